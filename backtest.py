@@ -0,0 +1,315 @@
+# backtest.py
+"""
+Офлайн-подбор порогов стратегии по залогированным сигналам и размеченным CSV.
+
+Источники (всё приводится к колонкам-массивам NumPy):
+  * signals.db  — размеченные сигналы (outcome 0/1) с признаками из features_json;
+  * historical.csv, friend_trades.csv — ручная разметка (индикаторов нет → NaN).
+Правило с NaN-признаком считается пройденным: строки CSV проверяют только
+MIN_PROFIT_PERCENT (по прогнозу прибыли) и окно удержания.
+
+Издержки (--dex-fee за своп, --slippage) вычитаются из PnL строки один раз. У строк signals.db
+берётся PnL монитора до комиссий (pnl_raw) и число свопов сигнала (hops из features_json, по
+умолчанию 2); у старых строк без pnl_raw он восстанавливается из net-PnL (pnl_real) теми же издержками.
+
+Окно удержания: сделка из CSV входит в ячейку, если закрылась не позже окна. Строки signals.db —
+результат монитора с фиксированным удержанием hold_seconds: исход при более коротком окне
+неизвестен, поэтому в таких ячейках эти строки исключаются (их число — колонка excluded_fixed_hold
+и сводка по окнам в выводе). С --reserves DIR (история резервов reserve_index.py) выход таких строк
+переоценивается по цене пула: raw-PnL на окне h = (100 + raw-PnL монитора) * P(t+h) / P(t+hold) - 100,
+где P — цена токена в базовом по резервам V2-пары; издержки строки вычитаются один раз, исход —
+net-PnL > 0, как у метки монитора. Без истории на нужные моменты строка исключается.
+
+Каждая комбинация порогов — это маска по всем строкам; комбинации считаются блоками
+(матрица комбинации × строки), блоки — параллельно по ядрам.
+
+Пример:
+  python backtest.py --db signals.db --min-profit 0.5:2.0:0.25 --orderflow 1:3:0.25 \
+      --volume-spike 1:4:0.5 --momentum 0:2:0.25 --prob 0:0.9:0.1 --hold 180,300,600 --out sweep.csv
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import itertools
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+PARAMS = ("min_profit", "orderflow", "volume_spike", "momentum", "prob", "hold")
+
+# ---------- загрузка ----------
+def _cost_pct(hops, dex_fee, slippage):
+    return (hops * dex_fee + slippage) * 100.0
+
+def load_db(path, dex_fee=0.003, slippage=0.002):
+    """Размеченные строки signals.db -> dict колонок (np.float64); pnl — до комиссий, cost — издержки строки."""
+    if not path or not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        has_raw = any(r[1] == "pnl_raw" for r in conn.execute("PRAGMA table_info(signals)"))
+        rows = conn.execute(
+            "SELECT exp_pnl, predicted_prob, features_json, pnl_real, outcome, hold_seconds, "
+            f"{'pnl_raw' if has_raw else 'NULL'} FROM signals WHERE outcome IN (0, 1) ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    n = len(rows)
+    cols = _empty_cols(n)
+    cols["fixed"][:] = 1.0
+    for i, (exp_pnl, prob, fj, pnl_real, outcome, hold, pnl_raw) in enumerate(rows):
+        try:
+            f = json.loads(fj or "{}")
+        except Exception:
+            f = {}
+        cols["exp_pnl"][i] = exp_pnl if exp_pnl is not None else np.nan
+        cols["prob"][i] = prob if prob is not None else np.nan
+        for k, src in (("buys", "buys"), ("sells", "sells"), ("vol_m5", "vol_m5"),
+                       ("avg_m5", "avg_m5"), ("momentum", "momentum_m5")):
+            v = f.get(src)
+            cols[k][i] = float(v) if v is not None else np.nan
+        cost = _cost_pct(float(f.get("hops") or 2), dex_fee, slippage)
+        cols["cost"][i] = cost
+        if pnl_raw is not None:
+            cols["pnl"][i] = pnl_raw
+        elif pnl_real is not None:
+            cols["pnl"][i] = pnl_real + cost   # pnl_real уже net: возвращаем комиссии, чтобы не вычесть их дважды
+        cols["hit"][i] = outcome
+        cols["hold"][i] = hold if hold is not None else np.nan
+    return cols
+
+def reserve_exits(path, store, holds, pnl_raw, chain="polygon"):
+    """
+    PnL до комиссий строк signals.db на более коротких окнах удержания по истории резервов:
+    {hold: np.array, NaN — не переоценить}. pnl_raw — колонка pnl из load_db (тот же порядок строк).
+    Время сигнала ts — локальное время бота.
+    """
+    from token_registry import POLYGON_TOKENS
+    conn = sqlite3.connect(path)
+    try:
+        has_chain = any(r[1] == "chain" for r in conn.execute("PRAGMA table_info(signals)"))
+        rows = conn.execute(
+            f"SELECT ts, base, token, hold_seconds, {'chain' if has_chain else 'NULL'} "
+            "FROM signals WHERE outcome IN (0, 1) ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    out = {h: np.full(len(rows), np.nan) for h in holds}
+    for i, (ts, base, token, hold, row_chain) in enumerate(rows):
+        pnl = pnl_raw[i]
+        if np.isnan(pnl) or hold is None or (row_chain or chain) != chain or base not in POLYGON_TOKENS:
+            continue
+        addr = store.pair_for(f"{base}->{token}")
+        if addr is None:
+            continue
+        try:
+            t = dt.datetime.strptime(str(ts), "%Y-%m-%d %H:%M:%S").timestamp()
+        except ValueError:
+            continue
+        last = store.at(addr, float("inf"))
+        if last is None or last["ts"] < t + hold:
+            continue   # индекс ещё не дошёл до конца удержания
+        p_end = store.price(addr, t + hold, POLYGON_TOKENS[base])
+        for h in holds:
+            p_h = store.price(addr, t + h, POLYGON_TOKENS[base]) if h < hold else None
+            if p_end and p_h:
+                out[h][i] = (100.0 + pnl) * p_h / p_end - 100.0
+    return out
+
+def _minutes(a, b):
+    ta, tb = pd.to_datetime(a, format="%H:%M", errors="coerce"), pd.to_datetime(b, format="%H:%M", errors="coerce")
+    return ((tb - ta).dt.total_seconds() % 86400).to_numpy()
+
+def _empty_cols(n):
+    """fixed = 1 — удержание строки задано монитором (signals.db), а не длительностью сделки;
+    cost = NaN — издержки по умолчанию (2 свопа)."""
+    cols = {k: np.full(n, np.nan) for k in ("exp_pnl", "prob", "buys", "sells", "vol_m5", "avg_m5",
+                                            "momentum", "pnl", "hit", "hold", "cost")}
+    cols["fixed"] = np.zeros(n)
+    return cols
+
+def load_historical(path):
+    if not path or not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, sep="\t")
+    cols = _empty_cols(len(df))
+    cols["exp_pnl"] = ((df["profit_forecast_min"] + df["profit_forecast_max"]) / 2.0).to_numpy(float)
+    cols["pnl"] = df["profit_real"].to_numpy(float)
+    cols["hit"] = df["result"].to_numpy(float)
+    cols["hold"] = (df["timing_min"] * 60.0).to_numpy(float)
+    return cols
+
+def load_friend_trades(path):
+    if not path or not os.path.exists(path):
+        return None
+    df = pd.read_csv(path)
+    cols = _empty_cols(len(df))
+    rng = df["profit_range_%"].astype(str).str.split("-", n=1, expand=True).astype(float)
+    cols["exp_pnl"] = rng.mean(axis=1).to_numpy(float)
+    cols["pnl"] = df["real_profit_%"].to_numpy(float)
+    cols["hit"] = (cols["pnl"] > 0).astype(float)
+    cols["hold"] = _minutes(df["start_time"], df["sell_time"])
+    return cols
+
+def concat(parts):
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+# ---------- сетка ----------
+def parse_range(spec):
+    """'a:b:step' (включительно) или 'x,y,z'."""
+    if ":" in spec:
+        a, b, step = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(a, b + step / 2.0, step), 10)
+    return np.array([float(x) for x in spec.split(",") if x.strip()])
+
+def build_grid(ranges):
+    return np.array(list(itertools.product(*(ranges[p] for p in PARAMS))), dtype=np.float64)
+
+# ---------- расчёт ----------
+_DATA = None
+
+def _init_worker(data):
+    global _DATA
+    _DATA = data
+
+def _derived(d, cost_pct):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = d["buys"] / np.maximum(1.0, d["sells"])
+        spike = d["vol_m5"] / d["avg_m5"]
+    cost = np.where(np.isnan(d["cost"]), cost_pct, d["cost"])
+    return {
+        # переоценённые по резервам PnL строк монитора: колонки pnl@<окно>
+        "reeval": {float(k[4:]): d[k] for k in d if k.startswith("pnl@")},
+        "cost": cost,
+        "exp_pnl": d["exp_pnl"], "ratio": ratio, "spike": spike, "momentum": d["momentum"],
+        "prob": d["prob"], "hold": d["hold"], "fixed": d["fixed"] > 0,
+        "hit": np.nan_to_num(d["hit"]).astype(bool),
+        "net": np.nan_to_num(d["pnl"] - cost),
+    }
+
+def _ge(x, thr):
+    """x >= thr по (комбинации × строки); NaN в x — правило пройдено."""
+    return np.isnan(x)[None, :] | (x[None, :] >= thr[:, None])
+
+def hold_view(d, hold):
+    """
+    Строки, исход которых известен для окна hold, и их (hit, net) при этом окне.
+    Сделка CSV — если закрылась не позже окна; строка монитора — если её удержание не длиннее окна
+    или её выход переоценён по резервам на это окно.
+    Возвращает (avail, hit, net, excluded): excluded — строки монитора, отброшенные из-за удержания.
+    """
+    h = d["hold"]
+    avail = np.isnan(h) | (h <= hold)
+    hit, net = d["hit"], d["net"]
+    pnl = d["reeval"].get(float(hold))
+    if pnl is not None:
+        re = d["fixed"] & ~avail & ~np.isnan(pnl)
+        avail = avail | re
+        re_net = np.nan_to_num(pnl - d["cost"])
+        hit = np.where(re, re_net > 0, hit)
+        net = np.where(re, re_net, net)
+    return avail, hit, net, d["fixed"] & ~avail
+
+def evaluate_block(grid_block, cost_pct, data=None):
+    d = _derived(data if data is not None else _DATA, cost_pct)
+    g = grid_block
+    base = (_ge(d["exp_pnl"], g[:, 0]) & _ge(d["ratio"], g[:, 1]) & _ge(d["spike"], g[:, 2])
+            & _ge(d["momentum"], g[:, 3]) & _ge(d["prob"], g[:, 4]))
+    count, hits = np.zeros(len(g)), np.zeros(len(g))
+    pnl_sum, excluded = np.zeros(len(g)), np.zeros(len(g))
+    for hold in np.unique(g[:, 5]):
+        sel = g[:, 5] == hold
+        avail, hit, net, excl = hold_view(d, hold)
+        mask = base[sel] & avail[None, :]
+        count[sel] = mask.sum(axis=1)
+        hits[sel] = (mask & hit[None, :]).sum(axis=1)
+        pnl_sum[sel] = mask.astype(np.float64) @ net
+        excluded[sel] = excl.sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hit_rate = np.where(count > 0, hits / count, np.nan)
+        avg_pnl = np.where(count > 0, pnl_sum / count, np.nan)
+    return np.column_stack([g, count, hit_rate, avg_pnl, pnl_sum, excluded])
+
+def sweep(data, grid, cost_pct, workers=None, block=2048):
+    blocks = [grid[i:i + block] for i in range(0, len(grid), block)]
+    if workers == 1 or len(blocks) == 1:
+        out = [evaluate_block(b, cost_pct, data) for b in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as ex:
+            out = list(ex.map(evaluate_block, blocks, itertools.repeat(cost_pct)))
+    res = pd.DataFrame(np.vstack(out), columns=list(PARAMS) + ["signals", "hit_rate", "avg_net_pnl", "total_net_pnl",
+                                                              "excluded_fixed_hold"])
+    res["signals"] = res["signals"].astype(int)
+    res["excluded_fixed_hold"] = res["excluded_fixed_hold"].astype(int)
+    return res
+
+def hold_summary(data, holds, cost_pct):
+    """Строки по окнам удержания: сколько доступно и сколько строк монитора исключено."""
+    d = _derived(data, cost_pct)
+    lines = []
+    for hold in holds:
+        avail, _, _, excl = hold_view(d, hold)
+        re = int((avail & d["fixed"] & (d["hold"] > hold)).sum())
+        lines.append(f"  hold {hold:.0f}s: rows {int(avail.sum())}, re-evaluated from reserves {re}, "
+                     f"excluded (monitor hold longer) {int(excl.sum())}")
+    return lines
+
+def main():
+    p = argparse.ArgumentParser(description="Vectorised threshold sweep over logged/labelled signals")
+    p.add_argument("--db", default="signals.db")
+    p.add_argument("--historical", default="historical.csv")
+    p.add_argument("--friend-trades", default="friend_trades.csv")
+    p.add_argument("--min-profit", default="0.5:2.0:0.25", help="MIN_PROFIT_PERCENT grid")
+    p.add_argument("--orderflow", default="1.0:3.0:0.25", help="ORDERFLOW_RATIO grid")
+    p.add_argument("--volume-spike", default="1.0:4.0:0.5", help="VOLUME_SPIKE_RATIO grid")
+    p.add_argument("--momentum", default="0.0:2.0:0.25", help="MOMENTUM_THRESHOLD grid")
+    p.add_argument("--prob", default="0.0:0.9:0.1", help="ALERT_PROB_THRESHOLD grid")
+    p.add_argument("--hold", default="180,240,300,600", help="hold window, seconds")
+    p.add_argument("--dex-fee", type=float, default=float(os.getenv("DEX_FEE", "0.003")))
+    p.add_argument("--slippage", type=float, default=float(os.getenv("SLIPPAGE", "0.002")))
+    p.add_argument("--min-signals", type=int, default=5, help="drop combinations with fewer signals")
+    p.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--out", default="backtest_sweep.csv")
+    p.add_argument("--reserves", default=None,
+                   help="reserve history dir (reserve_index.py): re-evaluate signals.db exits at shorter holds")
+    p.add_argument("--reserves-chain", default="polygon", help="chain the reserve history belongs to")
+    args = p.parse_args()
+
+    t0 = time.time()
+    ranges = {"min_profit": parse_range(args.min_profit), "orderflow": parse_range(args.orderflow),
+              "volume_spike": parse_range(args.volume_spike), "momentum": parse_range(args.momentum),
+              "prob": parse_range(args.prob), "hold": parse_range(args.hold)}
+    parts = [load_db(args.db, args.dex_fee, args.slippage), load_historical(args.historical), load_friend_trades(args.friend_trades)]
+    if args.reserves and parts[0] is not None:
+        from reserve_index import ReserveStore
+        exits = reserve_exits(args.db, ReserveStore(args.reserves, readonly=True), ranges["hold"], parts[0]["pnl"],
+                              args.reserves_chain)
+        for i, part in enumerate(parts):
+            if part is not None:
+                for h, pnl in exits.items():
+                    part[f"pnl@{h:g}"] = pnl if i == 0 else np.full(len(part["hit"]), np.nan)
+    data = concat(parts)
+    if data is None or len(data["hit"]) == 0:
+        raise SystemExit("No labelled rows found (signals.db / historical.csv / friend_trades.csv).")
+    grid = build_grid(ranges)
+    t_load = time.time() - t0
+
+    cost_pct = _cost_pct(2, args.dex_fee, args.slippage)
+    res = sweep(data, grid, cost_pct, workers=args.workers)
+    res = res[res["signals"] >= args.min_signals].sort_values(["avg_net_pnl", "hit_rate"], ascending=False)
+    res.to_csv(args.out, index=False)
+
+    print(f"Rows: {len(data['hit'])}, combinations: {len(grid)}, load {t_load:.2f}s, total {time.time()-t0:.2f}s")
+    print("\n".join(hold_summary(data, ranges["hold"], cost_pct)))
+    print(f"Saved {len(res)} combinations (>= {args.min_signals} signals) to {args.out}")
+    if len(res):
+        print(res.head(args.top).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
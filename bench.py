@@ -0,0 +1,304 @@
+# bench.py
+"""
+Офлайн-микробенчмарки горячих путей стратегии на фикстурах из bench_fixtures/.
+
+  python bench.py                          # все бенчмарки, таблица в консоль
+  python bench.py --save bench_baseline.json
+  python bench.py --compare bench_baseline.json [--filter ds_]
+  python bench.py --record-ds <token_addr> # перезаписать фикстуру Dexscreener живым ответом
+
+Сеть не нужна: провайдеры подменяются записанными ответами, signals.db — во временном каталоге,
+модель — маленький LightGBM, обучаемый на фикстуре при старте.
+Каждый бенчмарк: repeat серий по number вызовов; в отчёте min и медиана на один вызов.
+Отдельная таблица — память, которую удерживают структуры после ответа провайдера (tracemalloc).
+"""
+import os
+import gc
+import sys
+import json
+import time
+import tempfile
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+_TMP = tempfile.mkdtemp(prefix="bench_")
+
+# main.py читает окружение при импорте: офлайн-RPC, временная БД, без сторонних потоков
+os.environ.setdefault("ALCHEMY_POLYGON_RPC", "http://127.0.0.1:1")
+os.environ["LOG_DB_PATH"] = os.path.join(_TMP, "signals.db")
+os.environ["SIGNALS_COMPACT_INTERVAL"] = "0"
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ds_fixture_pairs():
+    """Записанный ответ Dexscreener в том виде, в каком его держит бот (DsPair)."""
+    from ds_decode import decode_pairs
+    return decode_pairs(fixture("dexscreener_tokens.json"), "polygon")
+
+
+# ---------- подготовка ----------
+def setup_ds_decode(main):
+    from ds_decode import decode_pairs
+    data = fixture("dexscreener_tokens.json")
+    return (lambda: decode_pairs(data, "polygon")), len(data["pairs"])
+
+
+def setup_ds_eval(main):
+    pairs = ds_fixture_pairs()
+    def run():
+        for p in pairs:
+            main.evaluate_trade_signal_from_ds_pair(p)
+    return run, len(pairs)
+
+
+def setup_ds_pregate(main):
+    import ds_pregate
+    pairs = ds_fixture_pairs()
+    def run():
+        cols = ds_pregate.ds_columns(pairs)
+        ds_pregate.evaluate(cols, main.MIN_LIQ_USD, main.ORDERFLOW_RATIO, main.VOLUME_SPIKE_RATIO, main.MOMENTUM_THRESHOLD)
+    return run, len(pairs)
+
+
+def setup_derivatives(main):
+    pairs = fixture("dexscreener_tokens.json")["pairs"]
+    key = ("USDT", "LINK")
+    for i, p in enumerate(pairs[:main.BUFFER_LEN]):
+        main.push_pair_snapshot(key, float(p["priceUsd"]), p["volume"]["m5"], p["txns"]["m5"]["buys"],
+                                p["txns"]["m5"]["sells"], ts=1_700_000_000 + 300 * i)
+    return (lambda: main.compute_derivatives(key)), 1
+
+
+def setup_dxs_price(main):
+    data = ds_fixture_pairs()
+    main.dxs_fetch = lambda addr: data  # записанный ответ вместо HTTP
+    addr = main.TOKENS["LINK"]
+    return (lambda: main.dxs_price_usd(addr)), 1
+
+
+def setup_univ3_quote(main):
+    import v3_pool
+    st = v3_pool.load_fixture(os.path.join(FIXTURES, "univ3_usdc_weth_500.json"))
+    st.ts = st.ticks_ts = time.time() + 10 ** 6  # «свежий» на всё время прогона
+    main.GRAPH_API_KEY = main.GRAPH_API_KEY or "bench"
+    main.UNIV3_POOLS.put_state(st)
+    usdc, weth = main.TOKENS["USDC"], main.TOKENS["WETH"]
+    def run():
+        main.univ3_quote_amount_out(usdc, weth, 1_000 * 10 ** 6)        # в пределах текущего тика
+        main.univ3_quote_amount_out(weth, usdc, 400 * 10 ** 18)         # с пересечением тиков
+    return run, 2
+
+
+def setup_v3_math(main):
+    import v3_pool
+    ticks = list(range(-200_000, 200_001, 4_000))
+    def run():
+        for t in ticks:
+            v3_pool.get_tick_at_sqrt_ratio(v3_pool.get_sqrt_ratio_at_tick(t))
+    return run, len(ticks)
+
+
+def _signals_frame(rows):
+    """Строки фикстуры в виде выборки из signals.db (признаки — только в features_json)."""
+    import pandas as pd
+    return pd.DataFrame([{"id": i, "ts": r["ts"], "outcome": r["outcome"],
+                          "features_json": json.dumps(r["features"])} for i, r in enumerate(rows)])
+
+
+def _bench_model():
+    import numpy as np
+    import lightgbm as lgb
+    import train_model
+    rows = fixture("signals_rows.json")
+    df = train_model.explode_features_column(_signals_frame(rows))
+    X, cols = train_model.build_feature_matrix(df)
+    rng = np.random.default_rng(0)
+    y = (X["momentum_m5"].to_numpy() + rng.normal(0, 1, len(X)) > 1).astype(int)
+    booster = lgb.train({"objective": "binary", "verbose": -1, "num_leaves": 15, "min_data_in_leaf": 5},
+                        lgb.Dataset(X.to_numpy(np.float32), label=y), num_boost_round=50)
+    return train_model.ModelWrapper(booster, cols), rows
+
+
+def setup_model_predict(main):
+    main._model, rows = _bench_model()
+    feat = rows[0]["features"]
+    return (lambda: main.model_predict_proba(feat)), 1
+
+
+def setup_wrapper_batch(main):
+    import pandas as pd
+    model, rows = _bench_model()
+    X = pd.DataFrame([r["features"] for r in rows])
+    return (lambda: model.predict(X)), len(rows)
+
+
+def setup_writer(main):
+    main.init_logging_db()
+    cur = main._db_conn.cursor()
+    rows = fixture("signals_rows.json")
+    seq = [0]
+    def run():
+        seq[0] += 1
+        batch = [dict(r, uid=f"{seq[0]}-{i}") for i, r in enumerate(rows)]
+        main._write_batch(cur, batch)
+    return run, len(rows)
+
+
+def setup_explode(main):
+    import train_model
+    rows = fixture("signals_rows.json")
+    df = _signals_frame(rows)
+    return (lambda: train_model.explode_features_column(df.copy(), col="features_json")), len(rows)
+
+
+def setup_flight_record(main):
+    from flight_recorder import FlightRecorder, FlightEvent, DECISION
+    fr = FlightRecorder(os.path.join(_TMP, "flight.ring"), 10000)
+    pair = main.REGISTRY.pair("USDT", "LINK")
+    ds = fixture("signals_rows.json")[0]["features"]
+    def run():
+        ev = FlightEvent(pair.id)
+        ev.entry, ev.buy, ev.exit, ev.src_in, ev.src_out = 100 * 10 ** 6, 7 * 10 ** 18, 101 * 10 ** 6, "1inch:v6", "1inch:v6"
+        ev.exp_pnl, ev.net_pnl, ev.ds = 1.0, 0.2, ds
+        fr.commit(ev, DECISION["low_net"])
+    return run, 1
+
+
+# имя -> (подготовка, число вызовов в серии)
+BENCHES = {
+    "ds_decode_response":   (setup_ds_decode, 200),
+    "ds_evaluate_pair":     (setup_ds_eval, 200),
+    "ds_pregate_vector":    (setup_ds_pregate, 200),
+    "compute_derivatives":  (setup_derivatives, 20000),
+    "dxs_price_usd_parse":  (setup_dxs_price, 2000),
+    "univ3_quote_local":    (setup_univ3_quote, 200),
+    "v3_tick_math":         (setup_v3_math, 50),
+    "model_predict_proba":  (setup_model_predict, 50),
+    "model_wrapper_batch":  (setup_wrapper_batch, 20),
+    "writer_batch_insert":  (setup_writer, 10),
+    "explode_features":     (setup_explode, 20),
+    "flight_record":        (setup_flight_record, 20000),
+}
+
+
+def _ds_raw():
+    with open(os.path.join(FIXTURES, "dexscreener_tokens.json"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _ds_records(raw):
+    from ds_decode import decode_pairs
+    return decode_pairs(json.loads(raw), "polygon")
+
+
+# имя -> (построение объекта из текста ответа, что в нём); считается память, удерживаемая результатом
+MEMORY = {
+    "ds_response_json":    (json.loads, "resp.json() tree"),
+    "ds_response_records": (_ds_records, "decoded DsPair list"),
+}
+
+
+def retained_bytes(build, raw):
+    gc.collect()
+    tracemalloc.start()
+    obj = build(raw)
+    cur = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return cur
+
+
+def run_memory(names):
+    raw = _ds_raw()
+    _ds_records(raw)  # импорт ds_decode — не в счёт
+    return {name: {"bytes": retained_bytes(MEMORY[name][0], raw), "what": MEMORY[name][1]} for name in names}
+
+
+def time_it(fn, number, repeat):
+    fn()  # прогрев
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return min(runs), statistics.median(runs)
+
+
+def run_benches(names, repeat, scale):
+    import main
+    results = {}
+    for name in names:
+        setup, number = BENCHES[name]
+        fn, items = setup(main)
+        best, med = time_it(fn, max(1, int(number * scale)), repeat)
+        results[name] = {"min_us": best * 1e6, "median_us": med * 1e6, "items": items,
+                         "per_item_us": best * 1e6 / max(1, items)}
+    return results
+
+
+def record_ds(addr):
+    import requests
+    r = requests.get("https://api.dexscreener.com/latest/dex/tokens/" + addr, timeout=(5, 20))
+    r.raise_for_status()
+    with open(os.path.join(FIXTURES, "dexscreener_tokens.json"), "w", encoding="utf-8") as f:
+        json.dump(r.json(), f, indent=1)
+    print(f"saved {len(r.json().get('pairs') or [])} pairs")
+
+
+def main_cli():
+    p = argparse.ArgumentParser(description="Offline microbenchmarks of the strategy hot paths")
+    p.add_argument("--filter", default="", help="run only benchmarks whose name contains this")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--scale", type=float, default=1.0, help="multiply calls per series")
+    p.add_argument("--save", default=None, help="write results as a baseline JSON")
+    p.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    p.add_argument("--record-ds", default=None, metavar="TOKEN_ADDR", help="refresh the Dexscreener fixture (network)")
+    args = p.parse_args()
+
+    if args.record_ds:
+        record_ds(args.record_ds)
+        return
+
+    names = [n for n in BENCHES if args.filter in n]
+    res = run_benches(names, args.repeat, args.scale)
+    mem = run_memory([n for n in MEMORY if args.filter in n])
+    base = base_mem = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        base, base_mem = saved.get("results", {}), saved.get("memory", {})
+
+    print(f"{'benchmark':<22} {'min µs':>12} {'median µs':>12} {'items':>6} {'µs/item':>10}" + ("   vs baseline" if base else ""))
+    for name, r in res.items():
+        line = f"{name:<22} {r['min_us']:>12.1f} {r['median_us']:>12.1f} {r['items']:>6} {r['per_item_us']:>10.2f}"
+        if name in base:
+            delta = (r["min_us"] / base[name]["min_us"] - 1.0) * 100.0
+            line += f"   {delta:+7.1f}%"
+        print(line)
+
+    if mem:
+        print(f"\n{'retained memory':<22} {'bytes':>12}   what")
+        for name, m in mem.items():
+            line = f"{name:<22} {m['bytes']:>12,}   {m['what']}"
+            if name in base_mem:
+                line += f"   {(m['bytes'] / base_mem[name]['bytes'] - 1.0) * 100.0:+7.1f}%"
+            print(line)
+
+    if args.save:
+        payload = {"saved_at": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+                   "machine": platform.machine(), "results": res, "memory": mem}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=1)
+        print(f"Saved baseline to {args.save}")
+
+
+if __name__ == "__main__":
+    main_cli()
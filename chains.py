@@ -0,0 +1,213 @@
+# chains.py
+"""
+Мультисетевой режим: один процесс, по изолированному контексту сканера на сеть.
+
+  CHAINS=polygon,arbitrum,base python main.py
+
+У каждой сети свой ChainContext: реестр токенов, RPC (Web3-котировщик), лимит запросов,
+бан-лист, буферы снимков, граф маршрутов, V3-снимки, бортовой самописец и счётчики циклов.
+Общие на процесс: HTTP (requests), модель, writer signals.db, Telegram, быстрая полоса идей.
+
+Контекст выбирается на поток: основной цикл каждой сети и всё, что он порождает
+(мониторы, снапшот-сервисы), работают внутри use_chain(ctx) / bind(ctx, fn).
+Старые глобальные имена main.py (TOKENS, REGISTRY, ban_list, ...) — ChainLocal-прокси
+на объект текущей сети; поток без контекста видит первую сеть из CHAINS.
+
+Настройки: polygon читает прежние переменные (CHAIN_ID, BASE_TOKENS, MAX_RPS, ALCHEMY_POLYGON_RPC,
+UNISWAP_V3_SUBGRAPH_ID, SUSHI_SUBGRAPH_ID); остальные сети — <NAME>_BASE_TOKENS, <NAME>_MAX_RPS,
+<NAME>_RPC, <NAME>_UNISWAP_V3_SUBGRAPH_ID, <NAME>_SUSHI_SUBGRAPH_ID.
+Свои сети или замену таблиц — JSON-файлом CHAINS_FILE: {"name": {"chain_id": ..., "tokens": {...}, ...}}.
+"""
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+from token_registry import TokenRegistry, POLYGON_TOKENS, POLYGON_DECIMALS
+
+# v2_router/v2_factory — пулы для Web3-котировок getAmountsOut (форк Uniswap V2 этой сети)
+CHAIN_SPECS = {
+    "polygon": {
+        "chain_id": 137, "ds_chain": "polygon", "tokens": POLYGON_TOKENS, "decimals": POLYGON_DECIMALS,
+        "base_tokens": ["USDT"], "wrapped": "WPOL", "aliases": {"POL": "WPOL", "MATIC": "WPOL", "WMATIC": "WPOL"},
+        "stables": ["USDT", "USDC"],
+        "v2_router": "0xa5e0829caced8ffdd4de3c43696c57f7d7a678ff",    # QuickSwap
+        "v2_factory": "0x5757371414417b8c6caad45baef941abc7d3ab32",
+    },
+    "arbitrum": {
+        "chain_id": 42161, "ds_chain": "arbitrum",
+        "tokens": {
+            "USDT":   "0xfd086bc7cd5c481dcc9c85ebe478a1c0b69fcbb9",
+            "USDC":   "0xaf88d065e77c8cc2239327c5edb3a432268e5831",
+            "DAI":    "0xda10009cbd5d07dd0cecc66161fc93d7c9000da1",
+            "WETH":   "0x82af49447d8a07e3bd95bd0d56f35241523fbab1",
+            "WBTC":   "0x2f2a2543b76a4166549f7aab2e75bef0aefc5b0f",
+            "ARB":    "0x912ce59144191c1204e64559fe8253a0e49e6548",
+            "LINK":   "0xf97f4df75117a78c1a5a0dbb814af92458539fb4",
+            "GMX":    "0xfc5a1a6eb076a2c7ad06ed22c90d7e710e35ad0a",
+            "wstETH": "0x5979d7b546e38e414f7e9822514be443a4800529",
+        },
+        "decimals": {"USDT": 6, "USDC": 6, "WBTC": 8},
+        "base_tokens": ["USDT"], "wrapped": "WETH", "aliases": {"ETH": "WETH"}, "stables": ["USDT", "USDC"],
+        "v2_router": "0x1b02da8cb0d097eb8d57a175b88c7d8b47997506",    # SushiSwap
+        "v2_factory": "0xc35dadb65012ec5796536bd9864ed8773abc74c4",
+    },
+    "base": {
+        "chain_id": 8453, "ds_chain": "base",
+        "tokens": {
+            "USDC":  "0x833589fcd6edb6e08f4c7c32d4f71b54bda02913",
+            "USDbC": "0xd9aaec86b65d86f6a7b5b1b0c42ffa531710b6ca",
+            "DAI":   "0x50c5725949a6f0c72e6c4a641f24049a917db0cb",
+            "WETH":  "0x4200000000000000000000000000000000000006",
+            "cbETH": "0x2ae3f1ec7f1f5012cfeab0185bfc7aa3cf0dec22",
+            "AERO":  "0x940181a94a35a4569e4529a3cdfb74e38fd98631",
+        },
+        "decimals": {"USDC": 6, "USDbC": 6},
+        "base_tokens": ["USDC"], "wrapped": "WETH", "aliases": {"ETH": "WETH"}, "stables": ["USDC", "USDbC"],
+        "v2_router": "0x4752ba5dbc23f44d87826276bf6fd6b1c372ad24",    # Uniswap V2
+        "v2_factory": "0x8909dc15e40173ff4699343b6eb8132c65e18ec6",
+    },
+}
+
+
+def load_chain_specs(path: str = ""):
+    """Встроенные сети + CHAINS_FILE (поля сети из файла перекрывают встроенные)."""
+    specs = {k: dict(v) for k, v in CHAIN_SPECS.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for name, spec in json.load(f).items():
+                specs.setdefault(name.lower(), {}).update(spec)
+    for name, spec in specs.items():
+        if "chain_id" not in spec or "tokens" not in spec:
+            raise ValueError(f"chain {name!r}: chain_id and tokens are required")
+        spec.setdefault("ds_chain", name)
+        spec.setdefault("decimals", {})
+        spec.setdefault("base_tokens", ["USDT"])
+        spec.setdefault("aliases", {})
+        spec.setdefault("stables", [])
+    return specs
+
+
+def chain_env(name: str, key: str, default=None):
+    """<NAME>_<KEY> из окружения (ARBITRUM_MAX_RPS и т.п.)."""
+    v = os.getenv(f"{name.upper()}_{key}")
+    return default if v is None or v.strip() == "" else v.strip()
+
+
+class ChainContext:
+    """Состояние сканера одной сети. Объекты, которым нужны функции main.py
+    (граф маршрутов, V3-снимки, самописец, Web3), main.py подвешивает после создания."""
+
+    def __init__(self, name: str, spec: dict, registry: TokenRegistry, base_tokens, rps: float,
+                 chain_id: int = None, uniswap_subgraph_id=None, sushi_subgraph_id=None, rpc_url=None,
+                 primary: bool = False):
+        self.name = name
+        self.spec = spec
+        self.primary = primary
+        self.chain_id = int(chain_id or spec["chain_id"])
+        self.ds_chain = spec["ds_chain"]
+        self.registry = registry
+        self.base_tokens = list(base_tokens)
+        self.rps = max(0.1, float(rps))
+        self.uniswap_subgraph_id = uniswap_subgraph_id
+        self.sushi_subgraph_id = sushi_subgraph_id
+        self.rpc_url = rpc_url
+        # подпись сети в причинах отсева/замечаниях отчёта ("" у первой сети — как в односетевом режиме)
+        self.prefix = "" if primary else f"[{name}] "
+        # лимит запросов сети
+        self.req_lock = threading.Lock()
+        self.req_ts = 0.0
+        # изолированное состояние скана
+        self.ban_list = {}
+        self.pair_buffers = {}
+        self.pair_is_mine = bytearray()
+        self.totals = {"cycles": 0, "checked": 0, "signals": 0, "last_cycle_sec": 0.0, "pairs": 0}
+        self.reported = dict(self.totals)     # счётчики на момент прошлого отчёта
+        self.route_graph = None
+        self.univ3_pools = self.sushi_pools = None
+        self.univ3_snapshot = self.sushi_snapshot = None
+        self.web3 = None
+        self.flight = None
+
+    @classmethod
+    def from_env(cls, name: str, spec: dict, entry_amount: float, default_rps: float, primary: bool = False):
+        registry = TokenRegistry(spec["tokens"], spec["decimals"])
+        registry.set_entry_amount(entry_amount)
+        base = chain_env(name, "BASE_TOKENS")
+        return cls(name, spec, registry,
+                   base.split(",") if base else spec["base_tokens"],
+                   float(chain_env(name, "MAX_RPS", default_rps)),
+                   uniswap_subgraph_id=chain_env(name, "UNISWAP_V3_SUBGRAPH_ID"),
+                   sushi_subgraph_id=chain_env(name, "SUSHI_SUBGRAPH_ID"),
+                   rpc_url=chain_env(name, "RPC"), primary=primary)
+
+    def __repr__(self):
+        return f"ChainContext({self.name}, chain_id={self.chain_id})"
+
+
+# ===================== Текущая сеть потока =====================
+_local = threading.local()
+_default = [None]
+
+
+def set_default_chain(ctx: ChainContext):
+    """Сеть для потоков, не вошедших в use_chain (главный поток, HTTP, Telegram)."""
+    _default[0] = ctx
+
+
+def current() -> ChainContext:
+    return getattr(_local, "ctx", None) or _default[0]
+
+
+@contextmanager
+def use_chain(ctx: ChainContext):
+    prev = getattr(_local, "ctx", None)
+    _local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        _local.ctx = prev
+
+
+def bind(ctx: ChainContext, fn):
+    """fn, выполняемая в контексте ctx — для потоков и колбэков, созданных вне цикла сети."""
+    def run(*args, **kwargs):
+        with use_chain(ctx):
+            return fn(*args, **kwargs)
+    run.__name__ = getattr(fn, "__name__", "run")
+    return run
+
+
+class ChainLocal:
+    """Модульное имя, которое в каждом потоке означает объект его сети: ChainLocal(lambda c: c.ban_list)."""
+    __slots__ = ("_get",)
+
+    def __init__(self, get):
+        object.__setattr__(self, "_get", get)
+
+    def __getattr__(self, name):
+        return getattr(self._get(current()), name)
+
+    def __getitem__(self, k):
+        return self._get(current())[k]
+
+    def __setitem__(self, k, v):
+        self._get(current())[k] = v
+
+    def __delitem__(self, k):
+        del self._get(current())[k]
+
+    def __contains__(self, k):
+        return k in self._get(current())
+
+    def __iter__(self):
+        return iter(self._get(current()))
+
+    def __len__(self):
+        return len(self._get(current()))
+
+    def __bool__(self):
+        return bool(self._get(current()))
+
+    def __repr__(self):
+        return f"ChainLocal({self._get(current())!r})"
@@ -0,0 +1,78 @@
+# control_server.py
+"""
+Маленький HTTP-сервер управления процессом бота (по умолчанию выключен, слушает 127.0.0.1).
+
+  ControlServer("127.0.0.1", 8787, token="secret", routes={"/profile": handler}).start()
+  curl "http://127.0.0.1:8787/profile?seconds=30&token=secret"
+
+handler(params: dict, body: bytes) -> (http_status, json-объект); params — query-строка (одно значение
+на ключ). Если задан token, он нужен в ?token= или в заголовке X-Control-Token.
+"""
+import json
+import hmac
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+MAX_BODY = 1 << 20
+
+
+class ControlServer:
+    def __init__(self, host: str, port: int, token: str = "", routes: dict = None):
+        self.host = host
+        self.port = port
+        self.token = token or ""
+        self.routes = dict(routes or {})
+        self._server = None
+
+    def route(self, path: str, handler):
+        self.routes[path] = handler
+
+    def _authorized(self, params, headers) -> bool:
+        if not self.token:
+            return True
+        got = params.get("token") or headers.get("X-Control-Token") or ""
+        return hmac.compare_digest(got, self.token)
+
+    def start(self):
+        srv = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, obj):
+                raw = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _handle(self):
+                u = urlsplit(self.path)
+                params = {k: v[-1] for k, v in parse_qs(u.query).items()}
+                if not srv._authorized(params, self.headers):
+                    return self._reply(403, {"error": "forbidden"})
+                handler = srv.routes.get(u.path.rstrip("/") or "/")
+                if handler is None:
+                    return self._reply(404, {"error": "not found", "routes": sorted(srv.routes)})
+                n = min(int(self.headers.get("Content-Length") or 0), MAX_BODY)
+                body = self.rfile.read(n) if n else b""
+                try:
+                    status, obj = handler(params, body)
+                except Exception as e:
+                    status, obj = 500, {"error": repr(e)}
+                self._reply(status, obj)
+
+            do_GET = do_POST = _handle
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="control-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,75 @@
+# ds_decode.py
+"""
+Компактный разбор ответов Dexscreener /latest/dex/tokens/.
+
+В ответе на токен — десятки пар, у каждой вложенные txns/volume/priceChange/liquidity, info, labels...
+Сразу после получения из каждой пары нужной сети берутся только поля, которые читают индикаторы,
+предфильтр, граф маршрутов и цена в USD, — в запись DsPair со __slots__ (числа уже float/int).
+Дерево JSON дальше не хранится (кэш single-flight, снимок цикла), а потребители читают атрибуты
+вместо повторных обходов вложенных словарей.
+"""
+
+
+def _f(v, default=0.0):
+    if v is None:
+        return default
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+
+class DsPair:
+    __slots__ = ("dex", "pair_addr", "base_addr", "quote_addr", "price_usd", "price_native",
+                 "liquidity_usd", "buys", "sells", "vol_m5", "vol_h1", "momentum_m5")
+
+    def __repr__(self):
+        return (f"DsPair({self.dex} {self.pair_addr} {self.base_addr}/{self.quote_addr} "
+                f"usd={self.price_usd} liq={self.liquidity_usd:.0f})")
+
+
+def decode_pair(p: dict) -> DsPair:
+    r = DsPair()
+    base, quote = p.get("baseToken") or {}, p.get("quoteToken") or {}
+    txns = (p.get("txns") or {}).get("m5") or {}
+    vol = p.get("volume") or {}
+    r.dex = p.get("dexId")
+    r.pair_addr = (p.get("pairAddress") or "").lower()
+    r.base_addr = (base.get("address") or "").lower()
+    r.quote_addr = (quote.get("address") or "").lower()
+    r.price_usd = _f(p.get("priceUsd"), None) or None          # нет цены — None (как пустая строка в ответе)
+    r.price_native = _f(p.get("priceNative"))
+    r.liquidity_usd = _f((p.get("liquidity") or {}).get("usd"))
+    r.buys = int(_f(txns.get("buys")))
+    r.sells = int(_f(txns.get("sells")))
+    r.vol_m5 = _f(vol.get("m5"))
+    r.vol_h1 = _f(vol.get("h1"))
+    r.momentum_m5 = _f((p.get("priceChange") or {}).get("m5"))
+    return r
+
+
+def decode_pairs(data, chain: str = None):
+    """
+    resp.json() -> [DsPair] пар сети chain (Dexscreener ищет адрес во всех сетях; пара без chainId
+    считается своей); None — не ответ со списком пар. chain=None — все сети.
+    """
+    if not isinstance(data, dict):
+        return None
+    pairs = data.get("pairs")
+    if not isinstance(pairs, list):
+        return []
+    out = []
+    for p in pairs:
+        if not isinstance(p, dict) or (chain is not None and p.get("chainId", chain) != chain):
+            continue
+        out.append(decode_pair(p))
+    return out
+
+
+def best_by_liquidity(pairs):
+    """Самая ликвидная пара списка или None."""
+    best = None
+    for p in pairs or ():
+        if best is None or p.liquidity_usd > best.liquidity_usd:
+            best = p
+    return best
@@ -0,0 +1,77 @@
+# ds_pregate.py
+"""
+Дешёвый предфильтр по индикаторам Dexscreener для всех пар цикла сразу.
+
+Те же правила, что и в evaluate_trade_signal_from_ds_pair (main.py), но одним набором
+векторных операций NumPy по снимку цикла:
+  ликвидность >= min_liq → buys/max(1, sells) >= orderflow → vol_m5 >= (vol_h1/12)·spike → momentum_m5 >= momentum.
+Строка проходит, только если прошла все стадии; для отсеянных известна первая проваленная стадия.
+"""
+import numpy as np
+
+STAGES = ("liquidity", "orderflow", "volume_spike", "momentum")
+_COLS = ("liquidity_usd", "buys", "sells", "vol_m5", "vol_h1", "momentum_m5")
+
+
+def ds_columns(pairs):
+    """Список лучших пар Dexscreener (ds_decode.DsPair или None) -> dict колонок float64; None — строка без данных."""
+    n = len(pairs)
+    cols = {c: np.zeros(n) for c in _COLS}
+    cols["has_data"] = np.zeros(n, dtype=bool)
+    for i, p in enumerate(pairs):
+        if p is None:
+            continue
+        for c in _COLS:
+            cols[c][i] = getattr(p, c)
+        cols["has_data"][i] = True
+    return cols
+
+
+def evaluate(cols, min_liq, orderflow, spike, momentum):
+    """
+    Возвращает dict:
+      ok         — bool[n], прошли все стадии (строки без данных — False),
+      fail_stage — int[n], индекс первой проваленной стадии в STAGES (-1 — прошла, -2 — нет данных),
+      passed     — [кол-во строк с данными, после liquidity, после orderflow, ...],
+      avg_m5, ratio — производные колонки (как в признаках сигнала).
+    """
+    avg_m5 = np.where(cols["vol_h1"] > 0, cols["vol_h1"], 1.0) / 12.0
+    ratio = cols["buys"] / np.maximum(1.0, cols["sells"])
+    checks = (
+        cols["liquidity_usd"] >= min_liq,
+        ratio >= orderflow,
+        cols["vol_m5"] >= avg_m5 * spike,
+        cols["momentum_m5"] >= momentum,
+    )
+    alive = cols["has_data"].copy()
+    fail_stage = np.where(alive, -1, -2)
+    passed = [int(alive.sum())]
+    for k, chk in enumerate(checks):
+        failed = alive & ~chk
+        fail_stage[failed] = k
+        alive &= chk
+        passed.append(int(alive.sum()))
+    return {"ok": alive, "fail_stage": fail_stage, "passed": passed, "avg_m5": avg_m5, "ratio": ratio}
+
+
+def fail_reason(cols, res, i, min_liq, orderflow, spike, momentum) -> str:
+    """Текст причины в том же виде, что у evaluate_trade_signal_from_ds_pair."""
+    k = int(res["fail_stage"][i])
+    buys, sells = int(cols["buys"][i]), int(cols["sells"][i])
+    if k == 0:
+        return f"Low liquidity: ${cols['liquidity_usd'][i]:,.0f} < ${min_liq:,.0f}"
+    if k == 1:
+        return f"Weak orderflow: buys={buys}, sells={sells}, ratio={res['ratio'][i]:.2f} < {orderflow}"
+    if k == 2:
+        return f"No volume spike: m5={cols['vol_m5'][i]:.0f}, avg5={res['avg_m5'][i]:.0f}, need×{spike}"
+    if k == 3:
+        return f"Weak momentum: {cols['momentum_m5'][i]:.2f}% < {momentum}%"
+    return "Signal OK" if k == -1 else "No Dexscreener data"
+
+
+def features_at(cols, res, i) -> dict:
+    return {
+        "liquidity_usd": float(cols["liquidity_usd"][i]), "buys": int(cols["buys"][i]),
+        "sells": int(cols["sells"][i]), "vol_m5": float(cols["vol_m5"][i]),
+        "avg_m5": float(res["avg_m5"][i]), "momentum_m5": float(cols["momentum_m5"][i]),
+    }
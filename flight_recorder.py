@@ -0,0 +1,250 @@
+# flight_recorder.py
+"""
+Бортовой самописец: по одной бинарной записи фиксированного размера на каждую оценку пары
+в кольцевом файле, отображённом в память (mmap). Старые записи затираются новыми.
+
+Запись (REC): время, номер, id пары из реестра, достигнутая стадия, решение, источники котировок
+входа/выхода, задержки (вся оценка, котировка, Dexscreener), units входа/покупки/выхода,
+ожидаемый/чистый PnL, вероятность модели и индикаторы Dexscreener.
+Запись — один struct.pack_into в mmap (единицы микросекунд); файл переживает падение процесса,
+после перезапуска запись продолжается с сохранённого номера.
+
+Рядом лежит <path>.pairs.json — подписи пар по id (для читателя).
+
+Чтение после инцидента:
+  python flight_recorder.py dump  flight.ring --pair "USDT->LINK" --last 50
+  python flight_recorder.py dump  flight.ring --decision no_quote --since 15m --json
+  python flight_recorder.py stats flight.ring --since 1h
+"""
+import os
+import json
+import math
+import mmap
+import time
+import struct
+import argparse
+import threading
+
+MAGIC = b"FLTREC01"
+HEADER = struct.Struct("<8sIIQd")          # magic, размер записи, ёмкость, следующий номер, время создания
+HEADER_SIZE = 64
+REC = struct.Struct("<dQIBBBBIIIddd" + "f" * 11)
+
+STAGES = ("start", "ban_ok", "ds_ok", "quoted", "profit_ok", "net_ok", "ml_ok", "signalled")
+DECISIONS = ("none", "signal", "banned", "ds_fail", "no_quote", "bad_quote", "no_exit_quote",
+             "low_profit", "low_net", "ml_filtered", "claimed_elsewhere", "error")
+SOURCES = ("", "1inch:v6", "1inch:v5", "1inch", "UniswapV3", "SushiSwap", "Web3", "Dexscreener", "other")
+INDICATORS = ("liquidity_usd", "buys", "sells", "vol_m5", "avg_m5", "momentum_m5", "d_price")
+
+STAGE = {s: i for i, s in enumerate(STAGES)}
+DECISION = {d: i for i, d in enumerate(DECISIONS)}
+_SOURCE = {s: i for i, s in enumerate(SOURCES)}
+_NAN = float("nan")
+
+
+def source_code(src) -> int:
+    if not src:
+        return 0
+    return _SOURCE.get(src, _SOURCE["other"])
+
+
+class FlightEvent:
+    """Черновик записи для одной оценки пары: поля заполняются по ходу стадий."""
+    __slots__ = ("pair_id", "t0", "stage", "src_in", "src_out", "lat_quote", "lat_ds",
+                 "entry", "buy", "exit", "exp_pnl", "net_pnl", "prob", "ds")
+
+    def __init__(self, pair_id: int):
+        self.pair_id = pair_id
+        self.t0 = time.perf_counter()
+        self.stage = 0
+        self.src_in = self.src_out = None
+        self.lat_quote = self.lat_ds = 0.0
+        self.entry = self.buy = self.exit = 0
+        self.exp_pnl = self.net_pnl = self.prob = None
+        self.ds = None
+
+
+def _f(v):
+    try:
+        return _NAN if v is None else float(v)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+class FlightRecorder:
+    def __init__(self, path: str, capacity: int = 200000):
+        self.path = path
+        self.capacity = int(capacity)
+        self._lock = threading.Lock()
+        self._labels = {}
+        self._labels_dirty = False
+        self._labels_ts = 0.0
+        size = HEADER_SIZE + self.capacity * REC.size
+        fresh = True
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            with open(path, "rb") as f:
+                magic, rec_size, cap, seq, created = HEADER.unpack(f.read(HEADER.size))
+            fresh = not (magic == MAGIC and rec_size == REC.size and cap == self.capacity)
+        if fresh:
+            with open(path, "wb") as f:
+                f.truncate(size)
+                f.write(HEADER.pack(MAGIC, REC.size, self.capacity, 0, time.time()))
+        self._fh = open(path, "r+b")
+        self._mm = mmap.mmap(self._fh.fileno(), size)
+        _, _, _, self.seq, self.created = HEADER.unpack_from(self._mm, 0)
+        self._load_labels()
+
+    # ---------- подписи пар ----------
+    def _labels_path(self):
+        return self.path + ".pairs.json"
+
+    def _load_labels(self):
+        try:
+            with open(self._labels_path(), "r", encoding="utf-8") as f:
+                self._labels = {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            self._labels = {}
+
+    def _save_labels(self):
+        tmp = self._labels_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._labels, f, ensure_ascii=False)
+        os.replace(tmp, self._labels_path())
+        self._labels_dirty = False
+        self._labels_ts = time.time()
+
+    def label_pair(self, pair_id: int, label: str):
+        if self._labels.get(pair_id) != label:
+            self._labels[pair_id] = label
+            self._labels_dirty = True
+
+    # ---------- запись ----------
+    def commit(self, ev: FlightEvent, decision: int, shard: int = 0):
+        """Одна запись в кольцо; ev.stage — последняя пройденная стадия."""
+        ds = ev.ds or {}
+        lat_total = int((time.perf_counter() - ev.t0) * 1e6)
+        with self._lock:
+            seq = self.seq
+            REC.pack_into(
+                self._mm, HEADER_SIZE + (seq % self.capacity) * REC.size,
+                time.time(), seq, ev.pair_id, ev.stage, decision, source_code(ev.src_in), source_code(ev.src_out),
+                min(lat_total, 0xFFFFFFFF), int(ev.lat_quote * 1e6), int(ev.lat_ds * 1e6),
+                float(ev.entry or 0), float(ev.buy or 0), float(ev.exit or 0),
+                _f(ev.exp_pnl), _f(ev.net_pnl), _f(ev.prob),
+                _f(ds.get("liquidity_usd")), _f(ds.get("buys")), _f(ds.get("sells")), _f(ds.get("vol_m5")),
+                _f(ds.get("avg_m5")), _f(ds.get("momentum_m5")), _f(ds.get("d_price")), float(shard),
+            )
+            self.seq = seq + 1
+            struct.pack_into("<Q", self._mm, 16, self.seq)
+        if self._labels_dirty and time.time() - self._labels_ts >= 1.0:
+            try:
+                self._save_labels()
+            except OSError:
+                pass
+
+    def close(self):
+        try:
+            if self._labels_dirty:
+                self._save_labels()
+            self._mm.flush()
+            self._mm.close()
+            self._fh.close()
+        except (OSError, ValueError):
+            pass
+
+
+# ===================== Чтение =====================
+def read_ring(path: str):
+    """Все целые записи кольца в порядке номеров: [dict]."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, rec_size, cap, seq, created = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or rec_size != REC.size:
+        raise ValueError(f"{path}: not a flight recorder ring (or other record version)")
+    try:
+        with open(path + ".pairs.json", "r", encoding="utf-8") as f:
+            labels = {int(k): v for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        labels = {}
+    out = []
+    for n in range(max(0, seq - cap), seq):
+        vals = REC.unpack_from(data, HEADER_SIZE + (n % cap) * REC.size)
+        if vals[1] != n:
+            continue  # слот уже перезаписан или запись не дописана
+        ts, rseq, pid, stage, decision, s_in, s_out, lat_total, lat_quote, lat_ds, entry, buy, exit_ = vals[:13]
+        exp_pnl, net_pnl, prob = vals[13:16]
+        ind = vals[16:16 + len(INDICATORS)]
+        out.append({
+            "ts": ts, "seq": rseq, "pair_id": pid, "pair": labels.get(pid, f"#{pid}"), "shard": int(vals[-1]),
+            "stage": STAGES[stage] if stage < len(STAGES) else stage,
+            "decision": DECISIONS[decision] if decision < len(DECISIONS) else decision,
+            "src_in": SOURCES[s_in] if s_in < len(SOURCES) else s_in,
+            "src_out": SOURCES[s_out] if s_out < len(SOURCES) else s_out,
+            "lat_total_us": lat_total, "lat_quote_us": lat_quote, "lat_ds_us": lat_ds,
+            "entry_units": entry, "buy_units": buy, "exit_units": exit_,
+            "exp_pnl": exp_pnl, "net_pnl": net_pnl, "prob": prob,
+            **{k: v for k, v in zip(INDICATORS, ind)},
+        })
+    return out
+
+
+def _parse_since(s):
+    if not s:
+        return None
+    mult = {"s": 1, "m": 60, "h": 3600, "d": 86400}.get(s[-1])
+    return time.time() - (float(s[:-1]) * mult if mult else float(s))
+
+
+def _fmt(v, spec):
+    return "-" if isinstance(v, float) and math.isnan(v) else format(v, spec)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Read the flight recorder ring")
+    p.add_argument("cmd", choices=("dump", "stats"))
+    p.add_argument("path", nargs="?", default=os.getenv("FLIGHT_RECORDER_PATH", "flight.ring"))
+    p.add_argument("--pair", default=None, help="pair label, e.g. USDT->LINK (substring match)")
+    p.add_argument("--decision", default=None, help=", ".join(DECISIONS))
+    p.add_argument("--stage", default=None, help=", ".join(STAGES))
+    p.add_argument("--since", default=None, help="e.g. 90s, 15m, 2h")
+    p.add_argument("--last", type=int, default=0, help="only the last N matching records")
+    p.add_argument("--json", action="store_true", help="one JSON object per line")
+    args = p.parse_args()
+
+    recs = read_ring(args.path)
+    since = _parse_since(args.since)
+    sel = [r for r in recs
+           if (since is None or r["ts"] >= since)
+           and (not args.pair or args.pair in r["pair"])
+           and (not args.decision or r["decision"] == args.decision)
+           and (not args.stage or r["stage"] == args.stage)]
+    if args.last:
+        sel = sel[-args.last:]
+
+    if args.cmd == "stats":
+        print(f"{len(sel)} of {len(recs)} records")
+        for field in ("decision", "stage", "src_in"):
+            cnt = {}
+            for r in sel:
+                cnt[r[field]] = cnt.get(r[field], 0) + 1
+            print(f"{field}: " + ", ".join(f"{k or '-'}={v}" for k, v in sorted(cnt.items(), key=lambda kv: -kv[1])))
+        lat = sorted(r["lat_total_us"] for r in sel)
+        if lat:
+            print(f"eval latency us: p50={lat[len(lat) // 2]} p90={lat[int(0.9 * (len(lat) - 1))]} max={lat[-1]}")
+        return
+
+    for r in sel:
+        if args.json:
+            print(json.dumps({k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in r.items()}))
+            continue
+        print(f"{time.strftime('%H:%M:%S', time.localtime(r['ts']))}.{int(r['ts'] * 1000) % 1000:03d} "
+              f"#{r['seq']:<8} {r['pair']:<16} {r['decision']:<17} {r['stage']:<10} "
+              f"{(r['src_in'] or '-')}/{(r['src_out'] or '-'):<11} "
+              f"t={r['lat_total_us']}us q={r['lat_quote_us']}us ds={r['lat_ds_us']}us "
+              f"pnl={_fmt(r['exp_pnl'], '.2f')}/{_fmt(r['net_pnl'], '.2f')} p={_fmt(r['prob'], '.2f')} "
+              f"liq={_fmt(r['liquidity_usd'], ',.0f')} b/s={_fmt(r['buys'], '.0f')}/{_fmt(r['sells'], '.0f')} "
+              f"mom={_fmt(r['momentum_m5'], '.2f')}")
+
+
+if __name__ == "__main__":
+    main()
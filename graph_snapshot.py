@@ -0,0 +1,152 @@
+# graph_snapshot.py
+"""
+Пакетное обновление V3-пулов из subgraph: один aliased GraphQL-запрос на subgraph за обновление.
+
+Для каждой наблюдаемой пары в запрос попадают:
+  p<i>: pools(...)                 — самые ликвидные пулы пары (slot0, liquidity, tick);
+  t<i>: ticks(where:{pool: <id>})  — окно тиков вокруг последнего известного тика,
+                                     если пул пары уже известен с прошлого обновления.
+Результат складывается в общий V3PoolCache, из которого котировки читаются без сети.
+Пулы, впервые найденные в этом обновлении, догружают тики одним дополнительным
+запросом (только при появлении новых пулов).
+"""
+import time
+import threading
+
+from v3_pool import PoolState, TICK_SPACING_BY_FEE, MIN_TICK, MAX_TICK
+
+POOL_FIELDS = "id feeTier liquidity sqrtPrice tick token0{ id decimals } token1{ id decimals }"
+
+
+class GraphSnapshotService:
+    """
+    post(query, variables) -> data — тот же транспорт, что у V3PoolCache (со своим rate-limit).
+    pairs_fn() -> iterable (addr_a, addr_b) — текущий список наблюдаемых пар.
+    """
+
+    def __init__(self, name, post, cache, pairs_fn, interval=300.0, batch_size=50,
+                 tick_window=400, pools_per_pair=3, on_error=None):
+        self.name = name
+        self.post = post
+        self.cache = cache
+        self.pairs_fn = pairs_fn
+        self.interval = interval
+        self.batch_size = max(1, int(batch_size))
+        self.tick_window = tick_window
+        self.pools_per_pair = pools_per_pair
+        self.on_error = on_error
+        self.last_refresh = 0.0
+        self.last_duration = 0.0
+        self.queries = 0
+        self.pairs_covered = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---------- построение запроса ----------
+    def _window(self, tick, fee):
+        span = self.tick_window * TICK_SPACING_BY_FEE.get(int(fee), 60)
+        return max(MIN_TICK, tick - span), min(MAX_TICK, tick + span)
+
+    def _build_query(self, pairs):
+        parts = []
+        windows = {}
+        for i, (a, b) in enumerate(pairs):
+            parts.append(
+                f'p{i}: pools(where:{{ token0_in:["{a}","{b}"], token1_in:["{a}","{b}"], '
+                f'feeTier_in:[100,500,3000,10000] }}, first: {self.pools_per_pair}, '
+                f'orderBy: liquidity, orderDirection: desc){{ {POOL_FIELDS} }}'
+            )
+            known = self.cache.get_state(a, b, allow_network=False)
+            if known is not None:
+                lo, hi = self._window(known.tick, known.fee)
+                windows[i] = (known.id, lo, hi)
+                parts.append(
+                    f't{i}: ticks(where:{{ pool:"{known.id}", tickIdx_gte:"{lo}", tickIdx_lte:"{hi}", '
+                    f'liquidityNet_not:"0" }}, first: 1000, orderBy: tickIdx){{ tickIdx liquidityNet }}'
+                )
+        return "query Snapshot {\n  " + "\n  ".join(parts) + "\n}", windows
+
+    @staticmethod
+    def _best_pool(pools, a, b):
+        exact = [p for p in pools or [] if {p["token0"]["id"].lower(), p["token1"]["id"].lower()} == {a, b}]
+        if not exact:
+            return None
+        def liq(x):
+            try: return int(x.get("liquidity") or 0)
+            except Exception: return 0
+        return max(exact, key=liq)
+
+    # ---------- обновление ----------
+    def refresh(self):
+        t0 = time.time()
+        pairs = sorted({tuple(sorted((a.lower(), b.lower()))) for a, b in self.pairs_fn() if a.lower() != b.lower()})
+        covered = 0
+        for start in range(0, len(pairs), self.batch_size):
+            batch = pairs[start:start + self.batch_size]
+            query, windows = self._build_query(batch)
+            self.queries += 1
+            data = self.post(query, {}) or {}
+            fresh = []
+            for i, (a, b) in enumerate(batch):
+                pool = self._best_pool(data.get(f"p{i}"), a, b)
+                if pool is None:
+                    continue
+                covered += 1
+                known = windows.get(i)
+                state = self.cache.get_state(a, b, allow_network=False)
+                if known and state is not None and known[0] == pool["id"]:
+                    _, lo, hi = known
+                    # окно тиков запрошено вокруг прошлого тика; если цена ушла к его краю,
+                    # пул догружается как новый — окном вокруг свежего тика
+                    new = state.with_slot(pool)
+                    new.tick_lo, new.tick_hi = lo, hi
+                    if not self.cache.in_window(new):
+                        fresh.append(pool)
+                        continue
+                    # готовим копию целиком и подменяем её в кэше: котировки в других потоках
+                    # читают либо старое, либо новое состояние, но не смесь
+                    new.merge_ticks(((int(t["tickIdx"]), int(t["liquidityNet"])) for t in data.get(f"t{i}") or []), lo, hi)
+                    self.cache.put_state(new)
+                else:
+                    fresh.append(pool)
+            if fresh:
+                self._load_fresh(fresh)
+        self.pairs_covered = covered
+        self.last_refresh = time.time()
+        self.last_duration = self.last_refresh - t0
+        return covered
+
+    def _load_fresh(self, pools):
+        """Новые пулы: тики всех сразу одним aliased-запросом."""
+        parts, windows = [], []
+        for i, pool in enumerate(pools):
+            lo, hi = self._window(int(pool.get("tick") or 0), pool["feeTier"])
+            windows.append((lo, hi))
+            parts.append(
+                f't{i}: ticks(where:{{ pool:"{pool["id"]}", tickIdx_gte:"{lo}", tickIdx_lte:"{hi}", '
+                f'liquidityNet_not:"0" }}, first: 1000, orderBy: tickIdx){{ tickIdx liquidityNet }}'
+            )
+        self.queries += 1
+        data = self.post("query SnapshotTicks {\n  " + "\n  ".join(parts) + "\n}", {}) or {}
+        for i, pool in enumerate(pools):
+            lo, hi = windows[i]
+            ticks = [(int(t["tickIdx"]), int(t["liquidityNet"])) for t in data.get(f"t{i}") or []]
+            self.cache.put_state(PoolState.from_graph(pool, ticks, lo, hi))
+
+    # ---------- фоновый поток ----------
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"{self.name} snapshot EXC: {repr(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, daemon=True, name=f"graph-{self.name}")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
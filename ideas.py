@@ -0,0 +1,90 @@
+# ideas.py
+"""
+Внешние торговые идеи (как в friend_trades.csv): разбор и очередь-файл JSONL.
+
+Идея — JSON-объект, достаточно пары:
+  {"pair": "USDT->wstETH->USDT"}                 или  {"base": "USDT", "token": "wstETH"}
+  {"token": "0x03b5...bccd", "source": "friend", "platform": "1inch", "profit_range": "1.57-1.89"}
+Необязательные поля: id, source, platform, profit_range, received (время получения у источника, epoch),
+chain (сеть в мультисетевом режиме; по умолчанию — основная).
+
+JsonlTail читает новые строки файла с запомненного смещения; файл можно дописывать
+из любого процесса (echo '{"pair": "USDT->LINK"}' >> ideas.jsonl). Усечение/ротация файла
+замечаются по уменьшению размера или смене inode.
+"""
+import os
+import json
+import itertools
+
+_ids = itertools.count(1)
+
+
+def parse_idea(obj) -> dict:
+    """Нормализует идею: {"id", "base", "token", "source", "platform", "profit_range", "received", "chain"}; ValueError — мусор."""
+    if isinstance(obj, str):
+        obj = {"pair": obj}
+    if not isinstance(obj, dict):
+        raise ValueError("idea must be an object or a pair string")
+    base, token = obj.get("base"), obj.get("token")
+    if obj.get("pair"):
+        legs = [p.strip() for p in str(obj["pair"]).split("->") if p.strip()]
+        if len(legs) < 2:
+            raise ValueError(f"bad pair {obj['pair']!r}, expected BASE->TOKEN[->BASE]")
+        base, token = legs[0], legs[1]
+    if not token:
+        raise ValueError("idea has no token")
+    received = obj.get("received")
+    try:
+        received = float(received) if received is not None else None
+    except (TypeError, ValueError):
+        received = None
+    return {
+        "id": str(obj.get("id") or f"idea-{next(_ids)}"),
+        "base": str(base).strip() if base else None,
+        "token": str(token).strip(),
+        "source": str(obj.get("source") or "external"),
+        "platform": obj.get("platform"),
+        "profit_range": obj.get("profit_range"),
+        "received": received,
+        "chain": str(obj["chain"]).strip().lower() if obj.get("chain") else None,
+    }
+
+
+class JsonlTail:
+    def __init__(self, path: str, from_end: bool = True):
+        """from_end — при старте пропустить уже лежащие в файле строки (старые идеи неактуальны)."""
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self._partial = b""
+        if from_end and os.path.exists(path):
+            st = os.stat(path)
+            self.offset, self.inode = st.st_size, st.st_ino
+
+    def poll(self):
+        """Новые полные строки: [(obj | None, raw_line)]; None — строка не JSON."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.offset, self.inode, self._partial = 0, st.st_ino, b""
+        if st.st_size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        self.offset += len(chunk)
+        data = self._partial + chunk
+        lines = data.split(b"\n")
+        self._partial = lines.pop()   # хвост без \n дописывается — дочитаем в следующий раз
+        out = []
+        for raw in lines:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                out.append((json.loads(raw), raw.decode("utf-8", "replace")))
+            except ValueError:
+                out.append((None, raw.decode("utf-8", "replace")))
+        return out
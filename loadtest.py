@@ -0,0 +1,498 @@
+# loadtest.py
+"""
+Нагрузочный прогон бота против локальных заглушек провайдеров.
+
+  python loadtest.py --sizes 25,100,200 --duration 120
+  python loadtest.py --sizes 200 --latency-ms 80 --latency dexscreener=300 --errors oneinch=0.05 --ds-pad 40
+
+Родитель поднимает HTTP-заглушки Dexscreener, 1inch, Graph gateway, Telegram и JSON-RPC ноды
+(задержка, доля ошибок и размер ответов настраиваются) и для каждого размера вселенной запускает
+настоящий бот (main.run_bot) отдельным процессом, направив на заглушки адреса провайдеров.
+Синтетические токены бот находит сам, обычным путём discovery: PairCreated в eth_getLogs ->
+Dexscreener -> decimals через Multicall3. Доля --hot токенов проходит индикаторы DS, а 1inch котирует
+их вход с наценкой --edge — из них получаются сигналы и открытые позиции.
+
+Отчёт по каждому размеру: циклов в минуту (после того как вся вселенная добавлена в скан),
+время до сигнала, потоки, память, открытые позиции, запросы и ошибки по провайдерам.
+"""
+import os
+import sys
+import json
+import time
+import math
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROVIDERS = ("dexscreener", "oneinch", "graph", "telegram", "rpc")
+SAMPLE_PREFIX = "[LOADTEST] "
+
+PAIR_CREATED_TOPIC = "0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9"
+AGGREGATE3_SELECTOR = "82ad56cb"  # aggregate3((address,bool,bytes)[])
+HEAD_BLOCK = 60_000_000
+
+
+# ===================== Синтетическая вселенная =====================
+def _addr(tag: str, i: int) -> str:
+    return "0x" + (tag.encode().hex() + f"{i:08x}").rjust(40, "0")[-40:]
+
+
+class Universe:
+    """Синтетические токены в паре с базовым токеном: цены, индикаторы DS, блок создания пары."""
+
+    def __init__(self, size, anchor_symbol="USDT", hot=0.25, edge_pct=3.0, ds_pad=0, seed=1):
+        from token_registry import POLYGON_TOKENS, POLYGON_DECIMALS
+        rng = random.Random(seed)
+        self.anchor_symbol = anchor_symbol
+        self.anchor = POLYGON_TOKENS[anchor_symbol]
+        self.edge = edge_pct / 100.0
+        self.ds_pad = ds_pad
+        self.decimals = {a: POLYGON_DECIMALS.get(s, 18) for s, a in POLYGON_TOKENS.items()}
+        self.price = {a: 1.0 for a in POLYGON_TOKENS.values()}
+        self.tokens = {}  # addr -> dict
+        for i in range(size):
+            a = _addr("syn", i)
+            t = {"symbol": f"SYN{i:04d}", "pair": _addr("pair", i), "hot": rng.random() < hot,
+                 "block": HEAD_BLOCK - 5000 + int(i * 4000 / max(1, size)),
+                 "liq": rng.uniform(2e5, 5e6), "vol_h1": rng.uniform(2e4, 5e5)}
+            self.tokens[a] = t
+            self.decimals[a] = 18
+            self.price[a] = math.exp(rng.uniform(-3, 5))
+        self.symbol_to_addr = {t["symbol"]: a for a, t in self.tokens.items()}
+
+    def ds_pair(self, a, rng):
+        t = self.tokens[a]
+        avg_m5 = t["vol_h1"] / 12.0
+        if t["hot"]:
+            buys, sells, vol_m5, mom = rng.randint(40, 90), rng.randint(5, 20), avg_m5 * rng.uniform(2.5, 4), rng.uniform(0.8, 3)
+        else:
+            # холодные токены отсеиваются одной из стадий индикаторов
+            buys, sells, vol_m5, mom = rng.randint(5, 30), rng.randint(20, 60), avg_m5 * rng.uniform(0.2, 1.5), rng.uniform(-2, 0.4)
+        return {
+            "chainId": "polygon", "dexId": "quickswap", "url": "", "pairAddress": t["pair"],
+            "baseToken": {"address": a, "name": t["symbol"], "symbol": t["symbol"]},
+            "quoteToken": {"address": self.anchor, "name": self.anchor_symbol, "symbol": self.anchor_symbol},
+            "priceNative": f"{self.price[a]:.8f}", "priceUsd": f"{self.price[a]:.8f}",
+            "txns": {"m5": {"buys": buys, "sells": sells}, "h1": {"buys": buys * 10, "sells": sells * 10}},
+            "volume": {"m5": round(vol_m5, 2), "h1": round(t["vol_h1"], 2), "h24": round(t["vol_h1"] * 20, 2)},
+            "priceChange": {"m5": round(mom, 2), "h1": round(mom * 2, 2), "h24": round(mom * 4, 2)},
+            "liquidity": {"usd": round(t["liq"], 2), "base": 0, "quote": 0},
+            "fdv": 0, "pairCreatedAt": 0,
+        }
+
+    def pad_pairs(self, a, rng):
+        """Мелкие пары токена с посторонними адресами — только для размера ответа."""
+        out = []
+        for k in range(self.ds_pad):
+            p = self.ds_pair(a, rng)
+            p["pairAddress"] = _addr("pad", k * 100003 + int(a[-8:], 16))
+            p["quoteToken"] = {"address": _addr("junk", k), "name": "JUNK", "symbol": "JUNK"}
+            p["liquidity"] = {"usd": rng.uniform(10, 1000), "base": 0, "quote": 0}
+            out.append(p)
+        return out
+
+    def quote(self, src, dst, amount):
+        ps, pd = self.price.get(src, 1.0), self.price.get(dst, 1.0)
+        out = amount / 10 ** self.decimals.get(src, 18) * ps / pd * 10 ** self.decimals.get(dst, 18) * 0.9995
+        if src == self.anchor and self.tokens.get(dst, {}).get("hot"):
+            out *= 1.0 + self.edge
+        return int(out)
+
+
+# ===================== Заглушки провайдеров =====================
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # бот завершается посреди запроса — обрыв соединения здесь ожидаем
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class StubProvider:
+    """HTTP-сервер одного провайдера: задержка, доля ошибок, счётчики запросов/байт."""
+
+    def __init__(self, name, handler, latency_ms=50.0, jitter_ms=None, error_rate=0.0, seed=0):
+        self.name = name
+        self.handler = handler
+        self.latency = latency_ms / 1000.0
+        self.jitter = (latency_ms / 4.0 if jitter_ms is None else jitter_ms) / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n) if n else b""
+                status, payload = provider.dispatch(self.command, self.path, body)
+                raw = json.dumps(payload, separators=(",", ":")).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+                with provider._lock:
+                    provider.bytes_out += len(raw)
+
+            do_GET = do_POST = _serve
+
+        self.server = _QuietServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.errors = self.bytes_out = 0
+            self.in_flight = self.max_in_flight = 0
+
+    def dispatch(self, method, path, body):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter)) if self.latency else 0.0
+            fail = self._rng.random() < self.error_rate
+        try:
+            time.sleep(delay)
+            if fail:
+                with self._lock:
+                    self.errors += 1
+                return (429 if self._rng.random() < 0.5 else 500), {"error": "injected"}
+            u = urlsplit(path)
+            return self.handler(method, u.path, parse_qs(u.query), body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "kb_out": round(self.bytes_out / 1024, 1),
+                    "max_in_flight": self.max_in_flight}
+
+
+class StubWorld:
+    """Все заглушки + общая синтетическая вселенная (меняется между прогонами)."""
+
+    def __init__(self, latency, errors):
+        self.universe = None
+        self._lock = threading.Lock()
+        self.t0 = time.time()
+        self.ds_first_seen = {}   # addr -> время первой отдачи в Dexscreener
+        self.signals = []         # (время, символ)
+        self.messages = 0
+        handlers = {"dexscreener": self._dexscreener, "oneinch": self._oneinch, "graph": self._graph,
+                    "telegram": self._telegram, "rpc": self._rpc}
+        self.providers = {name: StubProvider(name, handlers[name], latency[name], error_rate=errors[name], seed=k)
+                          for k, name in enumerate(PROVIDERS)}
+
+    def reset(self, universe):
+        with self._lock:
+            self.universe = universe
+            self.t0 = time.time()
+            self.ds_first_seen = {}
+            self.signals = []
+            self.messages = 0
+        for p in self.providers.values():
+            p.reset()
+
+    def bot_env(self):
+        u = {n: p.url for n, p in self.providers.items()}
+        return {
+            "DEXSCREENER_TOKEN_URL": u["dexscreener"] + "/latest/dex/tokens/",
+            "ONEINCH_API_KEY": "loadtest",
+            "ONEINCH_V6_URL": u["oneinch"] + "/swap/v6.0/137/quote",
+            "ONEINCH_V5_URL": u["oneinch"] + "/v5.0/137/quote",
+            "GRAPH_API_KEY": "loadtest", "UNISWAP_V3_SUBGRAPH_ID": "uniswap", "SUSHI_SUBGRAPH_ID": "sushi",
+            "GRAPH_GATEWAY_BASE": u["graph"] + "/api",
+            "TELEGRAM_TOKEN": "loadtest", "TELEGRAM_CHAT_ID": "1", "TELEGRAM_API_BASE": u["telegram"],
+            "ALCHEMY_POLYGON_RPC": u["rpc"],
+        }
+
+    # ---------- обработчики ----------
+    def _dexscreener(self, method, path, qs, body):
+        u = self.universe
+        addrs = [a.lower() for a in path.rsplit("/", 1)[-1].split(",") if a]
+        rng = random.Random(f"{','.join(addrs)}:{int(time.time() // 30)}")  # индикаторы меняются раз в 30 с
+        pairs, now = [], time.time()
+        for a in addrs:
+            if a == u.anchor:
+                # самые ликвидные пары базового токена — первые 30 синтетических
+                served = list(u.tokens)[:30]
+            elif a in u.tokens:
+                served = [a]
+                pairs += u.pad_pairs(a, rng)
+            else:
+                continue
+            for t in served:
+                pairs.append(u.ds_pair(t, rng))
+                with self._lock:
+                    self.ds_first_seen.setdefault(t, now)
+        return 200, {"schemaVersion": "1.0.0", "pairs": pairs}
+
+    def _oneinch(self, method, path, qs, body):
+        src = (qs.get("src") or qs.get("fromTokenAddress") or [""])[0].lower()
+        dst = (qs.get("dst") or qs.get("toTokenAddress") or [""])[0].lower()
+        out = self.universe.quote(src, dst, int((qs.get("amount") or ["0"])[0]))
+        return 200, {"dstAmount": str(out), "protocols": []}
+
+    def _graph(self, method, path, qs, body):
+        # пулов V3 в синтетике нет: котировки идут через 1inch, subgraph лишь нагружается запросами
+        return 200, {"data": {}}
+
+    def _telegram(self, method, path, qs, body):
+        try:
+            text = json.loads(body or b"{}").get("text") or ""
+        except ValueError:
+            text = ""
+        with self._lock:
+            self.messages += 1
+            if "Предварительный сигнал" in text:
+                for line in text.splitlines():
+                    if line.startswith("PAIR: "):
+                        self.signals.append((time.time(), line[6:].split("->")[1]))
+        return 200, {"ok": True, "result": {"message_id": self.messages}}
+
+    def _rpc(self, method, path, qs, body):
+        req = json.loads(body or b"{}")
+        if isinstance(req, list):
+            return 200, [self._rpc_one(r) for r in req]
+        return 200, self._rpc_one(req)
+
+    def _rpc_one(self, req):
+        m, params = req.get("method"), req.get("params") or []
+        res = None
+        head = HEAD_BLOCK + int((time.time() - self.t0) / 2)
+        if m == "eth_chainId":
+            res = hex(137)
+        elif m == "net_version":
+            res = "137"
+        elif m == "eth_blockNumber":
+            res = hex(head)
+        elif m == "eth_getLogs":
+            res = self._logs(params[0])
+        elif m == "eth_call":
+            res = self._eth_call(params[0])
+        return {"jsonrpc": "2.0", "id": req.get("id"), "result": res}
+
+    def _logs(self, flt):
+        lo, hi = int(flt.get("fromBlock", "0x0"), 16), int(flt.get("toBlock", hex(HEAD_BLOCK)), 16)
+        u, out = self.universe, []
+        emitter = flt.get("address") or "0x" + "00" * 20
+        emitter = emitter[0] if isinstance(emitter, list) else emitter
+        for i, (a, t) in enumerate(u.tokens.items()):
+            if lo <= t["block"] <= hi:
+                out.append({
+                    "address": emitter,
+                    "topics": [PAIR_CREATED_TOPIC, "0x" + "00" * 12 + a[2:], "0x" + "00" * 12 + u.anchor[2:]],
+                    "data": "0x" + "00" * 12 + t["pair"][2:] + f"{i + 1:064x}",
+                    "blockNumber": hex(t["block"]), "blockHash": "0x" + f"{t['block']:064x}",
+                    "transactionHash": "0x" + f"{i + 1:064x}", "transactionIndex": "0x0",
+                    "logIndex": "0x0", "removed": False,
+                })
+        return out
+
+    def _eth_call(self, tx):
+        from eth_abi import decode, encode
+        data = (tx.get("data") or tx.get("input") or "0x")[2:]
+        if data.startswith(AGGREGATE3_SELECTOR):
+            calls = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[8:]))[0]
+            ret = [(True, self.universe.decimals.get(c[0].lower(), 18).to_bytes(32, "big")) for c in calls]
+            return "0x" + encode(["(bool,bytes)[]"], [ret]).hex()
+        return "0x" + "00" * 32  # getPair и прочее: нулевой ответ (пары нет)
+
+
+# ===================== Дочерний процесс: бот + сэмплер =====================
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def child_main(sample_interval):
+    sys.path.insert(0, ROOT)
+    import main
+    t0 = time.time()
+    threading.Thread(target=main.run_bot, daemon=True).start()
+    while True:
+        time.sleep(sample_interval)
+        with main._positions_lock:
+            open_positions = len(main.OPEN_POSITIONS)
+        rec = {"t": round(time.time() - t0, 2), "cycles": main._shard_totals["cycles"],
+               "checked": main._shard_totals["checked"], "signals": main._shard_totals["signals"],
+               "tokens": len(main.TOKENS), "discovered": len(main.DISCOVERED_TOKENS),
+               "threads": threading.active_count(), "rss_mb": round(_rss_mb(), 1),
+               "open_positions": open_positions}
+        print(SAMPLE_PREFIX + json.dumps(rec), flush=True)
+
+
+# ===================== Прогон одного размера =====================
+def run_size(world, size, args):
+    universe = Universe(size, hot=args.hot, edge_pct=args.edge, ds_pad=args.ds_pad, seed=args.seed)
+    world.reset(universe)
+    workdir = tempfile.mkdtemp(prefix=f"loadtest_{size}_")
+    env = dict(os.environ)
+    env.update(world.bot_env())
+    env.update({
+        "BASE_TOKENS": universe.anchor_symbol, "MAX_RPS": str(args.max_rps), "HOLD_SECONDS": str(args.hold),
+        "REPORT_INTERVAL": "60", "DEBUG_MODE": "false", "USE_WEB3": "false", "SHARD_COUNT": "1",
+        "STATE_SNAPSHOT_ENABLED": "false", "MODEL_PATH": os.path.join(workdir, "no_model.pkl"),
+        "LOG_DB_PATH": os.path.join(workdir, "signals.db"), "SIGNALS_COMPACT_INTERVAL": "0",
+        "DISCOVERY_ENABLED": "true", "DISCOVERY_INTERVAL": "2", "DISCOVERY_TOP_N": str(size),
+        "DISCOVERY_DS_BATCHES": str(math.ceil(size / 30) + 1), "DISCOVERY_MIN_LIQ_USD": "0",
+        "DISCOVERY_MIN_VOL_USD": "0", "DISCOVERY_INDEX_PATH": os.path.join(workdir, "discovery_index.json"),
+        "GRAPH_INTERVAL": "60", "PYTHONUNBUFFERED": "1",
+    })
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--sample", str(args.sample)]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, bufsize=1)
+    samples, tail = [], []
+
+    def reader():
+        for line in proc.stdout:
+            if line.startswith(SAMPLE_PREFIX):
+                samples.append(json.loads(line[len(SAMPLE_PREFIX):]))
+            else:
+                tail.append(line.rstrip())
+                del tail[:-20]
+
+    rt = threading.Thread(target=reader, daemon=True)
+    rt.start()
+    time.sleep(args.duration)
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    rt.join(timeout=5)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(world, size, samples, tail)
+
+
+def summarize(world, size, samples, tail):
+    res = {"size": size, "samples": len(samples), "providers": {n: p.stats() for n, p in world.providers.items()}}
+    if not samples:
+        res["error"] = "no samples from bot: " + " | ".join(tail[-5:])
+        return res
+    last = samples[-1]
+    # устоявшийся режим: все синтетические токены уже в скане
+    steady = next((s for s in samples if s["discovered"] >= size), None)
+    ref = steady or samples[0]
+    span = last["t"] - ref["t"]
+    res.update({
+        "steady_after_s": steady["t"] if steady else None,
+        "cycles_per_min": round((last["cycles"] - ref["cycles"]) / span * 60.0, 2) if span > 0 else None,
+        "pairs_checked_per_min": round((last["checked"] - ref["checked"]) / span * 60.0, 1) if span > 0 else None,
+        "signals": last["signals"],
+        "max_threads": max(s["threads"] for s in samples),
+        "max_rss_mb": max(s["rss_mb"] for s in samples),
+        "max_open_positions": max(s["open_positions"] for s in samples),
+        "tokens_scanned": last["tokens"],
+        "duration_s": last["t"],
+    })
+    with world._lock:
+        sig, first_seen, t0 = list(world.signals), dict(world.ds_first_seen), world.t0
+    u = world.universe
+    lat = []
+    for ts, sym in sig:
+        a = u.symbol_to_addr.get(sym)
+        if a in first_seen:
+            lat.append(ts - first_seen[a])
+    res["first_signal_s"] = round(sig[0][0] - t0, 2) if sig else None
+    res["time_to_signal_median_s"] = round(statistics.median(lat), 2) if lat else None
+    res["time_to_signal_p90_s"] = round(sorted(lat)[int(0.9 * (len(lat) - 1))], 2) if lat else None
+    res["hot_tokens"] = sum(1 for t in u.tokens.values() if t["hot"])
+    for name, st in res["providers"].items():
+        st["per_min"] = round(st["requests"] / max(1e-9, last["t"]) * 60.0, 1)
+    return res
+
+
+def print_report(results):
+    cols = [("size", "size"), ("cyc/min", "cycles_per_min"), ("pairs/min", "pairs_checked_per_min"),
+            ("steady s", "steady_after_s"), ("1st sig s", "first_signal_s"), ("t2s p50", "time_to_signal_median_s"),
+            ("t2s p90", "time_to_signal_p90_s"), ("signals", "signals"), ("positions", "max_open_positions"),
+            ("threads", "max_threads"), ("rss MB", "max_rss_mb")]
+    print(" ".join(f"{h:>10}" for h, _ in cols))
+    for r in results:
+        print(" ".join(f"{'-' if r.get(k) is None else r.get(k):>10}" for _, k in cols))
+    print()
+    print(f"{'size':>6} " + " ".join(f"{p:>24}" for p in PROVIDERS) + "   (requests/errors, per min)")
+    for r in results:
+        cells = [f"{r['providers'][p]['requests']}/{r['providers'][p]['errors']} ({r['providers'][p].get('per_min', 0)}/m)"
+                 for p in PROVIDERS]
+        print(f"{r['size']:>6} " + " ".join(f"{c:>24}" for c in cells))
+    for r in results:
+        if r.get("error"):
+            print(f"[size {r['size']}] {r['error']}")
+
+
+def _per_provider(spec, default, cast=float):
+    vals = {p: default for p in PROVIDERS}
+    for item in filter(None, (spec or "").split(",")):
+        name, _, v = item.partition("=")
+        if name not in vals:
+            raise SystemExit(f"unknown provider {name!r}, expected one of {', '.join(PROVIDERS)}")
+        vals[name] = cast(v)
+    return vals
+
+
+def main_cli():
+    p = argparse.ArgumentParser(description="Load test the bot against local stub providers")
+    p.add_argument("--sizes", default="25,100,200", help="comma-separated synthetic universe sizes")
+    p.add_argument("--duration", type=float, default=120.0, help="seconds per size")
+    p.add_argument("--latency-ms", type=float, default=50.0, help="default provider latency")
+    p.add_argument("--latency", default="", help="per-provider latency, e.g. dexscreener=300,rpc=20")
+    p.add_argument("--error-rate", type=float, default=0.0, help="default share of 429/500 responses")
+    p.add_argument("--errors", default="", help="per-provider error rate, e.g. oneinch=0.05")
+    p.add_argument("--ds-pad", type=int, default=0, help="extra junk pairs per token in Dexscreener responses")
+    p.add_argument("--hot", type=float, default=0.25, help="share of tokens that pass DS indicators")
+    p.add_argument("--edge", type=float, default=3.0, help="entry edge (%%) quoted for hot tokens")
+    p.add_argument("--hold", type=int, default=120, help="HOLD_SECONDS for the bot (position lifetime)")
+    p.add_argument("--max-rps", type=int, default=50, help="MAX_RPS for the bot")
+    p.add_argument("--sample", type=float, default=2.0, help="metrics sampling interval in the bot process")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default=None, help="write results JSON here")
+    p.add_argument("--keep", action="store_true", help="keep per-run working directories")
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        child_main(args.sample)
+        return
+
+    sys.path.insert(0, ROOT)
+    world = StubWorld(_per_provider(args.latency, args.latency_ms), _per_provider(args.errors, args.error_rate))
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"[LOADTEST] size={size}: running {args.duration:.0f}s ...", flush=True)
+        results.append(run_size(world, size, args))
+    print_report(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "child"}, "results": results}, f, indent=1)
+        print(f"Saved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -10,16 +10,18 @@ Main.py — Trading Signals Bot (full, single-file)
 """
 
 import os
+import sys
 import time
 import json
 import math
 import threading
 import datetime as dt
-from math import isfinite
 
 import requests
 import sqlite3
 import queue
+import uuid
+import signal
 import atexit
 import joblib  # для ML-модели (LightGBM / XGBoost)
 from collections import deque  # для ring-buffers
@@ -48,9 +50,10 @@ DEBUG_MODE         = os.getenv("DEBUG_MODE", "True").lower() == "true"
 # лимиты запросов/таймауты
 REQUEST_TIMEOUT    = (5, 12)  # (connect, read) seconds
 MAX_RPS            = int(os.getenv("MAX_RPS", "5"))
-REQUEST_INTERVAL   = 1 / max(1, MAX_RPS)
-GRAPH_INTERVAL     = int(os.getenv("GRAPH_INTERVAL", "300"))
-_last_graph_call   = 0  # глобальная переменная для контроля интервала
+GRAPH_INTERVAL     = int(os.getenv("GRAPH_INTERVAL", "300"))    # период пакетного обновления V3-пулов (1 запрос на subgraph)
+GRAPH_BATCH_SIZE   = int(os.getenv("GRAPH_BATCH_SIZE", "50"))   # пар в одном aliased-запросе
+V3_TICK_WINDOW     = int(os.getenv("V3_TICK_WINDOW", "400"))    # окно тиков ±N*tickSpacing вокруг текущего
+V3_MAX_AGE         = float(os.getenv("V3_MAX_AGE", str(3 * GRAPH_INTERVAL)))  # старше — снимок пула не используем
 
 # === realistic trade settings ===
 DEX_FEE            = float(os.getenv("DEX_FEE", "0.003"))        # комиссия пула в долях (0.003 = 0.3%)
@@ -59,60 +62,194 @@ MIN_LIQ_USD        = float(os.getenv("MIN_LIQ_USD", "50000"))  # минимал
 ORDERFLOW_RATIO    = float(os.getenv("ORDERFLOW_RATIO", "1.5"))
 VOLUME_SPIKE_RATIO = float(os.getenv("VOLUME_SPIKE_RATIO", "2.0"))
 MOMENTUM_THRESHOLD = float(os.getenv("MOMENTUM_THRESHOLD", "0.5"))
+DS_PREGATE_ENABLED = os.getenv("DS_PREGATE_ENABLED", "true").strip().lower() in ("true", "1", "yes")  # индикаторы DS до котировок
+
+# маршруты по графу курсов (циклы длиной > 2: USDT->WPOL->LINK->USDT)
+ROUTE_ENABLED      = os.getenv("ROUTE_ENABLED", "true").strip().lower() in ("true", "1", "yes")
+ROUTE_MAX_LEN      = int(os.getenv("ROUTE_MAX_LEN", "4"))            # макс. число рёбер в цикле
+ROUTE_EDGE_TTL     = float(os.getenv("ROUTE_EDGE_TTL", "600"))       # сколько секунд курс на ребре считается живым
+ROUTE_MIN_LIQ_USD  = float(os.getenv("ROUTE_MIN_LIQ_USD", str(MIN_LIQ_USD)))  # пары Dexscreener мельче — не берём в граф
+ROUTE_MAX_SIGNALS  = int(os.getenv("ROUTE_MAX_SIGNALS", "3"))        # сколько циклов проверять котировками за проход
+
+# подбор оптимального объёма входа (по глубине пула)
+SIZE_OPT_ENABLED   = os.getenv("SIZE_OPT_ENABLED", "true").strip().lower() in ("true", "1", "yes")
+SIZE_MIN_USD       = float(os.getenv("SIZE_MIN_USD", "10"))
+SIZE_MAX_USD       = float(os.getenv("SIZE_MAX_USD", "10000"))
+SIZE_GRID          = int(os.getenv("SIZE_GRID", "64"))
+SIZE_PROBE_MULT    = float(os.getenv("SIZE_PROBE_MULT", "0"))  # >0 — доп. котировка круга на SELL_AMOUNT_USD*mult для оценки глубины
 
 # опциональные ключи
 ONEINCH_API_KEY    = os.getenv("ONEINCH_API_KEY", "").strip()   # если пуст — 1inch v6 будет пропущен
 GRAPH_API_KEY      = os.getenv("GRAPH_API_KEY", "").strip()     # если пуст — UniswapV3 через gateway недоступен
 
-# 1inch
+# 1inch ({chain_id} подставляется из сети контекста)
 CHAIN_ID           = int(os.getenv("CHAIN_ID", "137"))  # Polygon
-ONEINCH_V6_URL     = f"https://api.1inch.dev/swap/v6.0/{CHAIN_ID}/quote"
-ONEINCH_V5_URL     = f"https://api.1inch.io/v5.0/{CHAIN_ID}/quote"  # публичный — часто отдаёт HTML; используем лишь как попытку
+ONEINCH_V6_URL     = os.getenv("ONEINCH_V6_URL", "https://api.1inch.dev/swap/v6.0/{chain_id}/quote")
+ONEINCH_V5_URL     = os.getenv("ONEINCH_V5_URL", "https://api.1inch.io/v5.0/{chain_id}/quote")  # публичный — часто отдаёт HTML; используем лишь как попытку
+
+# мультисетевой режим: по изолированному контексту сканера на сеть в одном процессе (chains.py);
+# первая сеть — основная (отчёт, discovery), polygon читает прежние переменные, остальные — <NAME>_*
+CHAINS             = [c.strip().lower() for c in os.getenv("CHAINS", "polygon").split(",") if c.strip()]
+CHAINS_FILE        = os.getenv("CHAINS_FILE", "").strip()   # JSON со своими сетями / заменой таблиц токенов
 
 # UniswapV3 graph
 UNISWAP_V3_SUBGRAPH_ID = os.getenv("UNISWAP_V3_SUBGRAPH_ID")
 SUSHI_SUBGRAPH_ID      = os.getenv("SUSHI_SUBGRAPH_ID")
-GRAPH_GATEWAY_BASE     = "https://gateway.thegraph.com/api"
+GRAPH_GATEWAY_BASE     = os.getenv("GRAPH_GATEWAY_BASE", "https://gateway.thegraph.com/api")
+
+# шардирование: пары (base, token) делятся между процессами по стабильному хешу
+SHARD_COUNT        = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX        = int(os.getenv("SHARD_INDEX", "0"))
+COORDINATOR_DB     = os.getenv("COORDINATOR_DB", "coordinator.db")  # общий SQLite: бюджет запросов, баны, метрики шардов
+
+# снимок состояния для тёплого перезапуска
+STATE_SNAPSHOT_PATH     = os.getenv("STATE_SNAPSHOT_PATH", "state") + (f"_shard{SHARD_INDEX}" if SHARD_COUNT > 1 else "")
+STATE_SNAPSHOT_INTERVAL = float(os.getenv("STATE_SNAPSHOT_INTERVAL", "60"))
+STATE_SNAPSHOT_ENABLED  = os.getenv("STATE_SNAPSHOT_ENABLED", "true").strip().lower() in ("true", "1", "yes")
+
+# хранение signals.db: горячая таблица за SIGNALS_RETENTION_DAYS, старше — помесячный архив .jsonl.gz
+SIGNALS_RETENTION_DAYS   = float(os.getenv("SIGNALS_RETENTION_DAYS", "90"))
+SIGNALS_ARCHIVE_DIR      = os.getenv("SIGNALS_ARCHIVE_DIR", "signals_archive")
+SIGNALS_COMPACT_INTERVAL = float(os.getenv("SIGNALS_COMPACT_INTERVAL", "21600"))  # сек, 0 — отключено
+
+# автоматический поиск токенов (PairCreated QuickSwap + Dexscreener), топ-N добавляется к TOKENS
+DISCOVERY_ENABLED          = os.getenv("DISCOVERY_ENABLED", "false").strip().lower() in ("true", "1", "yes")
+DISCOVERY_USE_LOGS         = os.getenv("DISCOVERY_USE_LOGS", "true").strip().lower() in ("true", "1", "yes")
+DISCOVERY_INTERVAL         = float(os.getenv("DISCOVERY_INTERVAL", "300"))
+DISCOVERY_TOP_N            = int(os.getenv("DISCOVERY_TOP_N", "20"))
+DISCOVERY_MIN_LIQ_USD      = float(os.getenv("DISCOVERY_MIN_LIQ_USD", "50000"))
+DISCOVERY_MIN_VOL_USD      = float(os.getenv("DISCOVERY_MIN_VOL_USD", "10000"))
+DISCOVERY_BLOCKS_PER_CYCLE = int(os.getenv("DISCOVERY_BLOCKS_PER_CYCLE", "20000"))
+DISCOVERY_DS_BATCHES       = int(os.getenv("DISCOVERY_DS_BATCHES", "3"))   # x30 токенов за цикл
+DISCOVERY_INDEX_PATH       = os.getenv("DISCOVERY_INDEX_PATH", "discovery_index.json")
+
+# история резервов пар QuickSwap (Sync-события) в колоночных файлах: python reserve_index.py at reserves "USDT->LINK" <время>
+RESERVE_INDEX_ENABLED         = os.getenv("RESERVE_INDEX_ENABLED", "false").strip().lower() in ("true", "1", "yes")
+RESERVE_INDEX_DIR             = os.getenv("RESERVE_INDEX_DIR", "reserves")
+RESERVE_INDEX_INTERVAL        = float(os.getenv("RESERVE_INDEX_INTERVAL", "10"))
+RESERVE_INDEX_BLOCKS_PER_CYCLE = int(os.getenv("RESERVE_INDEX_BLOCKS_PER_CYCLE", "20000"))
+RESERVE_INDEX_BACKFILL_BLOCKS = int(os.getenv("RESERVE_INDEX_BACKFILL_BLOCKS", "200000"))  # ~5 суток Polygon для новой пары
+RESERVE_INDEX_START_BLOCK     = os.getenv("RESERVE_INDEX_START_BLOCK", "").strip()          # вместо глубины — с блока
+RESERVE_INDEX_CONFIRMATIONS   = int(os.getenv("RESERVE_INDEX_CONFIRMATIONS", "32"))        # отставание от головы (реорги)
+RESERVE_PAIRS_INTERVAL        = float(os.getenv("RESERVE_PAIRS_INTERVAL", "600"))          # поиск адресов новых пар
+
+# профилирование на лету (SIGUSR2, HTTP /profile, Telegram /profile): окно ограничено PROFILE_MAX_SECONDS
+PROFILE_DIR             = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS     = float(os.getenv("PROFILE_INTERVAL_MS", "10"))     # 10 мс = 100 Гц
+PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", "30"))
+PROFILE_MAX_SECONDS     = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+# бортовой самописец: запись на каждую оценку пары в кольцевой mmap-файл (python flight_recorder.py dump ...)
+FLIGHT_RECORDER_ENABLED = os.getenv("FLIGHT_RECORDER_ENABLED", "true").strip().lower() in ("true", "1", "yes")
+FLIGHT_RECORDER_PATH    = os.getenv("FLIGHT_RECORDER_PATH", "flight.ring") + (f".shard{SHARD_INDEX}" if SHARD_COUNT > 1 else "")
+FLIGHT_RECORDER_RECORDS = int(os.getenv("FLIGHT_RECORDER_RECORDS", "200000"))   # ~104 байта на запись
+
+# быстрая полоса для внешних идей (HTTP /idea, файл IDEAS_QUEUE_PATH, Telegram /idea) — свой бюджет запросов
+IDEAS_ENABLED        = os.getenv("IDEAS_ENABLED", "true").strip().lower() in ("true", "1", "yes")
+IDEAS_QUEUE_PATH     = os.getenv("IDEAS_QUEUE_PATH", "ideas.jsonl")       # JSONL: по идее на строку; "" — не следить
+IDEAS_RPS            = float(os.getenv("IDEAS_RPS", "2"))                 # запросов к провайдерам в секунду сверх MAX_RPS
+IDEAS_MAX_PER_MINUTE = int(os.getenv("IDEAS_MAX_PER_MINUTE", "20"))       # больше — отклоняем без запросов
+IDEAS_HTTP_WAIT      = float(os.getenv("IDEAS_HTTP_WAIT", "20"))          # POST /idea?wait=1 ждёт вердикт до N секунд
+
+# HTTP-управление процессом (0 — выключено); у шарда i порт CONTROL_PORT + i
+CONTROL_PORT       = int(os.getenv("CONTROL_PORT", "0"))
+CONTROL_HOST       = os.getenv("CONTROL_HOST", "127.0.0.1")
+CONTROL_TOKEN      = os.getenv("CONTROL_TOKEN", "").strip()
+# команды из Telegram-чата TELEGRAM_CHAT_ID через getUpdates (не включать при webhook/другом потребителе)
+TELEGRAM_COMMANDS  = os.getenv("TELEGRAM_COMMANDS", "false").strip().lower() in ("true", "1", "yes")
 
 # Dexscreener
-DEXSCREENER_TOKEN_URL  = "https://api.dexscreener.com/latest/dex/tokens/"
-
-from pipeline_web3 import get_quote_web3
+DEXSCREENER_TOKEN_URL  = os.getenv("DEXSCREENER_TOKEN_URL", "https://api.dexscreener.com/latest/dex/tokens/")
+
+# Telegram Bot API (адреса провайдеров переопределяются — например, заглушками loadtest.py)
+TELEGRAM_API_BASE      = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+
+import pipeline_web3
+from chains import (ChainContext, ChainLocal, load_chain_specs, current as current_chain, use_chain, bind,
+                    set_default_chain)
+from route_graph import RouteGraph
+from shard_coordinator import Coordinator, shard_of
+from state_snapshot import save_state, load_state
+from v3_pool import V3PoolCache
+from graph_snapshot import GraphSnapshotService
+from size_optimizer import optimise_sizes, depth_from_liquidity, depth_from_quotes
+from singleflight import SingleFlight
+from token_discovery import TokenDiscovery
+from reserve_index import ReserveStore, SyncIndexer
+from token_registry import REGISTRY
+import ds_pregate
+from ds_decode import decode_pairs, best_by_liquidity
+from profiler import SamplingProfiler
+from flight_recorder import FlightRecorder, FlightEvent, STAGE as FR_STAGE, DECISION as FR
+from control_server import ControlServer
+from ideas import parse_idea, JsonlTail
+from signals_store import ensure_schema_extras, enable_incremental_vacuum, compact as compact_signals
 USE_WEB3 = os.getenv("USE_WEB3", "").strip().lower() in ("true", "1", "yes")
 
+# ===================== СЕТИ =====================
+# контекст сканера на сеть; polygon — общий REGISTRY (его же видят pipeline_web3 и discovery)
+CHAIN_SPECS = load_chain_specs(CHAINS_FILE)
+REGISTRY.set_entry_amount(SELL_AMOUNT_USD)
+
+def _make_chain(name: str, primary: bool) -> ChainContext:
+    if name not in CHAIN_SPECS:
+        raise RuntimeError(f"CHAINS: unknown chain {name!r} (known: {', '.join(sorted(CHAIN_SPECS))}; see CHAINS_FILE)")
+    spec = CHAIN_SPECS[name]
+    if name == "polygon":
+        return ChainContext(name, spec, REGISTRY, BASE_TOKENS, MAX_RPS, chain_id=CHAIN_ID,
+                            uniswap_subgraph_id=UNISWAP_V3_SUBGRAPH_ID, sushi_subgraph_id=SUSHI_SUBGRAPH_ID,
+                            rpc_url=os.getenv("ALCHEMY_POLYGON_RPC"), primary=primary)
+    return ChainContext.from_env(name, spec, SELL_AMOUNT_USD, MAX_RPS, primary=primary)
+
+CHAIN_CONTEXTS = [_make_chain(name, i == 0) for i, name in enumerate(dict.fromkeys(CHAINS or ["polygon"]))]
+PRIMARY_CHAIN = CHAIN_CONTEXTS[0]
+MULTI_CHAIN = len(CHAIN_CONTEXTS) > 1
+set_default_chain(PRIMARY_CHAIN)
+
+# Web3-котировщик сети (USE_WEB3): polygon — pipeline_web3 (ALCHEMY_POLYGON_RPC), остальные — <NAME>_RPC
+for _c in CHAIN_CONTEXTS:
+    if _c.name == "polygon":
+        _c.web3 = pipeline_web3.QUOTER
+    elif _c.rpc_url and _c.spec.get("v2_router") and _c.spec.get("v2_factory"):
+        _c.web3 = pipeline_web3.Web3Quoter.for_rpc(
+            _c.rpc_url, _c.spec["v2_router"], _c.spec["v2_factory"], _c.registry.CHECKSUM,
+            wrapped=_c.spec.get("wrapped"), aliases=_c.spec["aliases"], stables=_c.spec["stables"])
+
+def chain_by_name(name):
+    return next((c for c in CHAIN_CONTEXTS if c.name == (name or "").lower()), None)
+
+def chain_line() -> str:
+    """Строка «Сеть: ...» для сообщений Telegram (только в мультисетевом режиме)."""
+    return f"Сеть: {current_chain().name}\n" if MULTI_CHAIN else ""
+
+def chain_tag() -> str:
+    """« [arbitrum]» для однострочных сообщений (только в мультисетевом режиме)."""
+    return f" [{current_chain().name}]" if MULTI_CHAIN else ""
+
 # ===================== TOKENS & DECIMALS =====================
-TOKENS = {
-    # базовые
-    "USDT":   "0xc2132d05d31c914a87c6611c10748aeb04b58e8f",
-    "USDC":   "0x3c499c542cef5e3811e1192ce70d8cc03d5c3359",
-    "DAI":    "0x8f3cf7ad23cd3cadbd9735aff958023239c6a063",
-    "FRAX":   "0x45c32fa6df82ead1e2ef74d17b76547eddfaff89",
-    # ликвидные/наблюдаемые
-    "wstETH": "0x03b54a6e9a984069379fae1a4fc4dbae93b3bccd",
-    "BET":    "0xbf7970d56a150cd0b60bd08388a4a75a27777777",
-    "WPOL":   "0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270",
-    "tBTC":   "0x236aa50979d5f3de3bd1eeb40e81137f22ab794b",
-    "SAND":   "0xbbba073c31bf03b8acf7c28ef0738decf3695683",
-    "GMT":    "0x714db550b574b3e927af3d93e26127d15721d4c2",
-    "LINK":   "0x53e0bca35ec356bd5dddfebbd1fc0fd03fabad39",
-    "EMT":    "0x708383ae0e80e75377d664e4d6344404dede119a",
-    "AAVE":   "0xd6df932a45c0f255f85145f286ea0b292b21c90b",
-    "LDO":    "0xc3c7d422809852031b44ab29eec9f1eff2a58756",
-    "POL":    "0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270",  # WMATIC (wrapped POL)
-    "WETH":   "0x7ceb23fd6bc0add59e62ac25578270cff1b9f619",
-    "SUSHI":  "0x0b3f868e0be5597d5db7feb59e1cadbb0fdda50a",
-}
-DECIMALS = {
-    "USDT": 6, "USDC": 6, "DAI": 18, "FRAX": 18,
-    "wstETH": 18, "BET": 18, "WPOL": 18, "tBTC": 18, "SAND": 18, "GMT": 8,
-    "LINK": 18, "EMT": 18, "AAVE": 18, "LDO": 18, "POL": 18, "WETH": 18, "SUSHI": 18
-}
-ADDRESS_TO_SYMBOL = {addr.lower(): sym for sym, addr in TOKENS.items()}
+# единый реестр (token_registry.py): плотные id токенов/пар и статические данные пар;
+# TOKENS / DECIMALS / ADDRESS_TO_SYMBOL — его живые словари (меняются через REGISTRY.add_token/remove_token).
+# Имена ниже — ChainLocal: в потоке сети они означают её реестр и состояние.
+REGISTRY = ChainLocal(lambda c: c.registry)
+TOKENS = ChainLocal(lambda c: c.registry.TOKENS)
+DECIMALS = ChainLocal(lambda c: c.registry.DECIMALS)
+ADDRESS_TO_SYMBOL = ChainLocal(lambda c: c.registry.ADDRESS_TO_SYMBOL)
+BASE_TOKENS = ChainLocal(lambda c: c.base_tokens)
 
 RSI_TOKENS = {"AAVE","LINK","EMT","LDO","SUSHI","GMT","SAND","tBTC","wstETH","WETH"}
 
+# discovery ищет токены только в Polygon (фабрика QuickSwap) — найденные живут в его реестре
+DISCOVERY_CHAIN = chain_by_name("polygon")
+STATIC_TOKENS = set(REGISTRY.TOKENS if DISCOVERY_CHAIN is None else DISCOVERY_CHAIN.registry.TOKENS)  # символы из кода — не вытесняются найденными
+DISCOVERED_TOKENS = {}             # symbol -> address (добавлены discovery)
+
+# граф курсов всех известных пар сети (рёбра наполняются котировками и ответами Dexscreener)
+for _c in CHAIN_CONTEXTS:
+    _c.route_graph = RouteGraph(fee=DEX_FEE, max_len=ROUTE_MAX_LEN, edge_ttl=ROUTE_EDGE_TTL)
+ROUTE_GRAPH = ChainLocal(lambda c: c.route_graph)
+
 # ===================== STATE =====================
-ban_list = {}  # {(base, token): {"time":ts, "reason":str, "duration":int}}
+ban_list = ChainLocal(lambda c: c.ban_list)  # {(base, token): {"time":ts, "reason":str, "duration":int}} своей сети
 stats_lock = threading.Lock()
 stats_snapshot = {
     "checked": 0,
@@ -122,18 +259,45 @@ stats_snapshot = {
     "ban_details": {},   # copy of ban_list for report
 }
 last_report_time = 0.0
+_process_started = time.time()
 
-_last_req_lock = threading.Lock()
-_last_req_ts = 0.0
+_pace_local = threading.local()   # .lane = "ideas" — запросы потока идут из бюджета быстрой полосы
+_ideas_req_lock = threading.Lock()
+_ideas_req_ts = 0.0
+
+# единый координатор для всех шардов (None — обычный однопроцессный режим)
+COORD = Coordinator(COORDINATOR_DB) if SHARD_COUNT > 1 else None
+_shard_totals = {"cycles": 0, "checked": 0, "signals": 0}
 
 # ===================== UTIL =====================
 def pace_requests():
-    global _last_req_ts
-    with _last_req_lock:
-        elapsed = time.time() - _last_req_ts
-        if elapsed < REQUEST_INTERVAL:
-            time.sleep(REQUEST_INTERVAL - elapsed)
-        _last_req_ts = time.time()
+    if getattr(_pace_local, "lane", None) == "ideas":
+        _pace_ideas()
+        return
+    ctx = current_chain()
+    if COORD is not None:
+        # MAX_RPS (<NAME>_MAX_RPS) — общий бюджет сети на все шарды
+        COORD.acquire("providers" if ctx.primary else f"providers:{ctx.name}", ctx.rps)
+        return
+    with ctx.req_lock:
+        interval = 1.0 / ctx.rps
+        elapsed = time.time() - ctx.req_ts
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
+        ctx.req_ts = time.time()
+
+def _pace_ideas():
+    """Отдельный лимит быстрой полосы: идеи не ждут очереди сканера и не съедают его бюджет."""
+    global _ideas_req_ts
+    if COORD is not None:
+        COORD.acquire("ideas", IDEAS_RPS)
+        return
+    with _ideas_req_lock:
+        interval = 1.0 / max(0.1, IDEAS_RPS)
+        elapsed = time.time() - _ideas_req_ts
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
+        _ideas_req_ts = time.time()
 
 def now_local():
     # используем локальное время системы
@@ -147,7 +311,7 @@ def send_telegram(text: str):
         return
     try:
         r = requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
+            f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}/sendMessage",
             json={"chat_id": TELEGRAM_CHAT_ID, "text": text},
             timeout=REQUEST_TIMEOUT
         )
@@ -157,24 +321,46 @@ def send_telegram(text: str):
         print("[TG EXCEPTION]", repr(e))
 
 def add_skip(reason: str, pair_label: str):
+    pair_label = current_chain().prefix + pair_label
     with stats_lock:
         stats_snapshot["skipped"].setdefault(reason, []).append(pair_label)
 
 def add_dex_issue(text: str):
+    text = current_chain().prefix + text
     with stats_lock:
         stats_snapshot["dex_issues"].append(text)
 
 def inc_checked():
+    ctx = current_chain()
     with stats_lock:
         stats_snapshot["checked"] += 1
+        ctx.totals["checked"] += 1
+        if ctx.primary:
+            _shard_totals["checked"] += 1
 
 def inc_signal():
+    ctx = current_chain()
     with stats_lock:
         stats_snapshot["signals"] += 1
+        ctx.totals["signals"] += 1
+        if ctx.primary:
+            _shard_totals["signals"] += 1
 
 def copy_ban_for_report():
+    """Баны всех сетей; ключи чужих сетей — с именем сети первым элементом."""
+    bans = {}
+    for c in CHAIN_CONTEXTS:
+        for k, v in list(c.ban_list.items()):
+            bans[k if c.primary else (c.name,) + tuple(k)] = v
+    with stats_lock:
+        stats_snapshot["ban_details"] = bans
+
+# счётчики стадий конвейера (за период отчёта, сбрасываются в reset_cycle_stats)
+PIPELINE_STATS = {}
+
+def inc_stage(name: str, n: int = 1):
     with stats_lock:
-        stats_snapshot["ban_details"] = dict(ban_list)
+        PIPELINE_STATS[name] = PIPELINE_STATS.get(name, 0) + n
 
 def reset_cycle_stats():
     with stats_lock:
@@ -183,13 +369,91 @@ def reset_cycle_stats():
         stats_snapshot["skipped"] = {}
         stats_snapshot["dex_issues"] = []
         stats_snapshot["ban_details"] = {}
+        PIPELINE_STATS.clear()
+        PIPELINE_STATS.update({
+            "ds_requests": 0, "ds_tokens": 0, "tokens_ds_data": 0, "tokens_ds_liquidity": 0,
+            "tokens_ds_orderflow": 0, "tokens_ds_volume_spike": 0, "tokens_ds_momentum": 0,
+            "pairs": 0, "pregate_rejected": 0, "quoted": 0, "profit_pass": 0, "net_pass": 0,
+        })
 
 from collections import deque
-PAIR_BUFFERS = {}  # key -> {"price": deque(), "vol": deque(), "buys": deque(), "sells": deque(), "ts": deque()}
+PAIR_BUFFERS = ChainLocal(lambda c: c.pair_buffers)  # key -> {"price": deque(), "vol": deque(), "buys": deque(), "sells": deque(), "ts": deque()}
 BUFFER_LEN = 12  # храним последние 12 значений (пример — 12*5min = 60min, но у тебя m5)
+STATE_BUFFER_MAX_AGE = float(os.getenv("STATE_BUFFER_MAX_AGE", str(BUFFER_LEN * 300)))  # старше — буфер после рестарта не нужен
+
+def _coord_key(key):
+    """Ключ пары в общей таблице координатора: у неосновной сети — с её именем."""
+    ctx = current_chain()
+    return key if ctx.primary else (ctx.name,) + tuple(key)
 
 def ban_pair(key, reason, duration=900):
     ban_list[key] = {"time": time.time(), "reason": reason, "duration": duration}
+    if COORD is not None:
+        try:
+            COORD.ban(_coord_key(key), reason, duration, SHARD_INDEX)
+        except Exception as e:
+            print("[COORD ban error]", repr(e))
+
+def pair_ban_left(key):
+    """(reason, seconds_left) для забаненной пары или None. В шардированном режиме — по общей таблице."""
+    if COORD is not None:
+        try:
+            return COORD.get_ban(_coord_key(key))
+        except Exception as e:
+            print("[COORD get_ban error]", repr(e))
+    info = ban_list.get(key)
+    if not info:
+        return None
+    left = int(info["duration"] - (time.time() - info["time"]))
+    if left > 0:
+        return info["reason"], left
+    ban_list.pop(key, None)
+    return None
+
+_claimed = {}                      # ключ пары -> момент, до которого сигнал по ней уже выдан этим процессом
+_claims_lock = threading.Lock()
+
+def claim_signal(key, cooldown=600):
+    """
+    Единая точка выдачи сигнала: пару нельзя просигналить дважды за cooldown.
+    Проверка и запись — под одним локом, поэтому скан и быстрая полоса идей, оценившие пару
+    одновременно, не откроют две позиции; в шардированном режиме дальше решает координатор.
+    """
+    ck = _coord_key(key)
+    now = time.time()
+    with _claims_lock:
+        if _claimed.get(ck, 0.0) > now:
+            return False
+        _claimed[ck] = now + cooldown
+        if len(_claimed) > 4096:
+            for k in [k for k, until in _claimed.items() if until <= now]:
+                del _claimed[k]
+    if COORD is None:
+        return True
+    try:
+        ok = COORD.claim_signal(ck, cooldown, SHARD_INDEX)
+    except Exception as e:
+        print("[COORD claim error]", repr(e))
+        ok = False
+    if not ok:
+        with _claims_lock:
+            _claimed.pop(ck, None)   # пару держит другой шард — локальная отметка не нужна
+    return ok
+
+def is_my_pair(key) -> bool:
+    return shard_of(key, SHARD_COUNT) == SHARD_INDEX
+
+def is_my_pair_id(pair) -> bool:
+    """is_my_pair по плотному id пары из реестра: хеш считается один раз на пару."""
+    # по id пары (реестр своей сети): 1 — пара этого шарда, 2 — чужая, 0 — ещё не посчитано
+    _pair_is_mine = current_chain().pair_is_mine
+    if pair.id >= len(_pair_is_mine):
+        _pair_is_mine.extend(b"\0" * (REGISTRY.pair_count() - len(_pair_is_mine)))
+    v = _pair_is_mine[pair.id]
+    if not v:
+        v = 1 if is_my_pair(pair.key) else 2
+        _pair_is_mine[pair.id] = v
+    return v == 1
 
 def clean_ban_list():
     now = time.time()
@@ -197,52 +461,139 @@ def clean_ban_list():
         if now - ban_list[k]["time"] > ban_list[k]["duration"]:
             ban_list.pop(k, None)
 
+# ===================== Single-flight =====================
+# одинаковые одновременные запросы (скан + мониторы) идут в сеть один раз и платят pace_requests один раз
+def _clone_quote(res):
+    q, reasons = res
+    return (dict(q) if q else q), list(reasons or [])
+
+def _clone_quote_err(res):
+    q, err = res
+    return (dict(q) if q else q), err
+
+def _clone_round_trip(res):
+    q_in, q_out, reasons = res
+    return (dict(q_in) if q_in else q_in), (dict(q_out) if q_out else q_out), list(reasons or [])
+
+SF_DEXSCREENER = SingleFlight("dexscreener")
+SF_QUOTE       = SingleFlight("quote", clone=_clone_quote)
+SF_ROUND_TRIP  = SingleFlight("round_trip", clone=_clone_round_trip)   # результат — тройка, не пара
+SF_ONEINCH     = SingleFlight("1inch", clone=_clone_quote_err)
+SINGLE_FLIGHTS = (SF_DEXSCREENER, SF_QUOTE, SF_ROUND_TRIP, SF_ONEINCH)
+
 # ===================== Dexscreener =====================
 def dxs_fetch(token_addr: str):
+    return SF_DEXSCREENER.do((current_chain().name, token_addr.lower()), _dxs_fetch_http, token_addr)
+
+def _dxs_fetch_http(token_addr: str):
     try:
         pace_requests()
         resp = requests.get(DEXSCREENER_TOKEN_URL + token_addr, timeout=REQUEST_TIMEOUT)
         if resp.status_code == 200:
-            return resp.json()
+            # сразу в компактные записи пар своей сети — дерево JSON не кэшируется
+            data = decode_pairs(resp.json(), current_chain().ds_chain)
+            if ROUTE_ENABLED:
+                route_graph_ingest_ds(data)
+            return data
         add_dex_issue(f"Dexscreener HTTP {resp.status_code} for {token_addr} | {resp.text[:150]}")
     except Exception as e:
         add_dex_issue(f"Dexscreener EXC for {token_addr}: {repr(e)}")
     return None
 
-def dxs_price_usd(token_addr: str):
-    data = dxs_fetch(token_addr)
-    if not data:
-        return None
-    best = None
-    for p in data.get("pairs", []):
+def route_node(symbol: str) -> str:
+    """Вершина графа — один символ на адрес (WPOL и POL — один и тот же токен)."""
+    addr = TOKENS.get(symbol)
+    return ADDRESS_TO_SYMBOL.get(addr.lower(), symbol) if addr else symbol
+
+def route_graph_ingest_ds(pairs):
+    """Каждая пара Dexscreener (DsPair) между известными токенами даёт два ребра графа (priceNative и обратное)."""
+    for p in pairs or ():
+        if p.liquidity_usd < ROUTE_MIN_LIQ_USD:
+            continue
+        a = ADDRESS_TO_SYMBOL.get(p.base_addr)
+        b = ADDRESS_TO_SYMBOL.get(p.quote_addr)
+        price = p.price_native
+        if not a or not b or a == b or price <= 0:
+            continue
+        src = f"Dexscreener:{p.dex or '?'}"
+        ROUTE_GRAPH.update_rate(a, b, price, src)
+        ROUTE_GRAPH.update_rate(b, a, 1.0 / price, src)
+
+DS_TOKENS_PER_REQUEST = 30  # лимит адресов в одном запросе /latest/dex/tokens/a,b,c
+
+def dxs_best_pairs_many(token_addrs):
+    """
+    Лучшие (по ликвидности) пары Dexscreener для многих токенов — по одному запросу на 30 адресов.
+    Возвращает ({addr: DsPair | None}, число запросов): None — пачка получила ответ, но пар токена в нём нет.
+    Токенов из пачек, запрос которых не удался, в словаре нет.
+    """
+    addrs = sorted({a.lower() for a in token_addrs})
+    best, n_req = {}, 0
+    for i in range(0, len(addrs), DS_TOKENS_PER_REQUEST):
+        batch = addrs[i:i + DS_TOKENS_PER_REQUEST]
+        wanted = set(batch)
+        data = None
         try:
-            pu = p.get("priceUsd")
-            if not pu:
-                continue
-            price = float(pu)
-            # выбираем пару с наибольшей ликвидностью
-            liq = float((p.get("liquidity") or {}).get("usd") or 0.0)
-            if not best or liq > best[1]:
-                best = (price, liq)
-        except Exception:
+            pace_requests()
+            n_req += 1
+            resp = requests.get(DEXSCREENER_TOKEN_URL + ",".join(batch), timeout=REQUEST_TIMEOUT)
+            if resp.status_code == 200:
+                data = decode_pairs(resp.json(), current_chain().ds_chain)
+            else:
+                add_dex_issue(f"Dexscreener batch HTTP {resp.status_code} | {resp.text[:150]}")
+        except Exception as e:
+            add_dex_issue(f"Dexscreener batch EXC: {repr(e)}")
+        if data is None:
             continue
-    return best[0] if best else None
+        for a in batch:
+            best.setdefault(a, None)
+        if ROUTE_ENABLED and data:
+            route_graph_ingest_ds(data)
+        for p in data:
+            for a in (p.base_addr, p.quote_addr):
+                if a in wanted:
+                    cur = best[a]
+                    if cur is None or p.liquidity_usd > cur.liquidity_usd:
+                        best[a] = p
+    return best, n_req
+
+def ds_pregate_cycle(token_addrs):
+    """
+    Снимок Dexscreener на цикл + векторная проверка индикаторов для всех токенов сразу.
+    Возвращает {addr: (ok, reason, ds_feat, best_pair)} для токенов, чья пачка получила ответ;
+    у токена без пар в ответе — (None, "No Dexscreener data", {}, None) (fail_stage -2).
+    """
+    best, n_req = dxs_best_pairs_many(token_addrs)
+    addrs = list(best.keys())
+    cols = ds_pregate.ds_columns([best[a] for a in addrs])
+    res = ds_pregate.evaluate(cols, MIN_LIQ_USD, ORDERFLOW_RATIO, VOLUME_SPIKE_RATIO, MOMENTUM_THRESHOLD)
+    verdict = {}
+    for i, a in enumerate(addrs):
+        if res["fail_stage"][i] == -2:
+            verdict[a] = (None, "No Dexscreener data", {}, None)
+            continue
+        ok = bool(res["ok"][i])
+        reason = "Signal OK" if ok else ds_pregate.fail_reason(cols, res, i, MIN_LIQ_USD, ORDERFLOW_RATIO,
+                                                               VOLUME_SPIKE_RATIO, MOMENTUM_THRESHOLD)
+        verdict[a] = (ok, reason, ds_pregate.features_at(cols, res, i), best[a])
+    with stats_lock:
+        PIPELINE_STATS["ds_requests"] += n_req
+        PIPELINE_STATS["ds_tokens"] += len(set(a.lower() for a in token_addrs))
+        for k, name in enumerate(("ds_data",) + tuple(f"ds_{st}" for st in ds_pregate.STAGES)):
+            PIPELINE_STATS["tokens_" + name] += res["passed"][k]
+    return verdict
+
+def dxs_price_usd(token_addr: str):
+    # цена самой ликвидной пары с ценой в USD
+    best = best_by_liquidity([p for p in dxs_fetch(token_addr) or () if p.price_usd])
+    return best.price_usd if best else None
 
 # ===================== Uniswap V3 (Graph) =====================
-def graph_url():
-    if not GRAPH_API_KEY:
+def graph_url(ctx=None):
+    ctx = ctx or current_chain()
+    if not GRAPH_API_KEY or (ctx.name != "polygon" and not ctx.uniswap_subgraph_id):
         return None
-    return f"{GRAPH_GATEWAY_BASE}/{GRAPH_API_KEY}/subgraphs/id/{UNISWAP_V3_SUBGRAPH_ID}"
-
-def _safe_get(d: dict, path: str, default=None):
-    cur = d or {}
-    for p in path.split('.'):
-        if not isinstance(cur, dict):
-            return default
-        cur = cur.get(p)
-        if cur is None:
-            return default
-    return cur
+    return f"{GRAPH_GATEWAY_BASE}/{GRAPH_API_KEY}/subgraphs/id/{ctx.uniswap_subgraph_id}"
 
 def ensure_pair_buffers(key):
     if key not in PAIR_BUFFERS:
@@ -284,21 +635,20 @@ def compute_derivatives(key):
         pass
     return res
 
-def evaluate_trade_signal_from_ds_pair(pair: dict):
+def evaluate_trade_signal_from_ds_pair(pair):
     """
-    Проверяет OrderFlow (m5), Volume Spike (m5 vs avg5), Momentum (m5) и Liquidity.
+    Проверяет OrderFlow (m5), Volume Spike (m5 vs avg5), Momentum (m5) и Liquidity пары DsPair.
     Возвращает (ok: bool, reason: str, features: dict)
     """
     try:
-        buys = int(_safe_get(pair, "txns.m5.buys", 0) or 0)
-        sells = int(_safe_get(pair, "txns.m5.sells", 0) or 0)
-        vol_m5 = float(_safe_get(pair, "volume.m5", 0.0) or 0.0)
-        vol_h1 = float(_safe_get(pair, "volume.h1", 0.0) or 0.0)
+        buys, sells = pair.buys, pair.sells
+        vol_m5 = pair.vol_m5
+        vol_h1 = pair.vol_h1
         if vol_h1 <= 0:
             vol_h1 = 1.0
         avg_m5 = vol_h1 / 12.0
-        momentum_m5 = float(_safe_get(pair, "priceChange.m5", 0.0) or 0.0)
-        liquidity_usd = float(_safe_get(pair, "liquidity.usd", 0.0) or 0.0)
+        momentum_m5 = pair.momentum_m5
+        liquidity_usd = pair.liquidity_usd
 
         if liquidity_usd < MIN_LIQ_USD:
             return False, f"Low liquidity: ${liquidity_usd:,.0f} < ${MIN_LIQ_USD:,.0f}", {
@@ -332,144 +682,137 @@ def evaluate_trade_signal_from_ds_pair(pair: dict):
     except Exception as e:
         return False, f"Signal error: {e}", {}
 
-def adjust_for_fees_pct(raw_profit_pct: float) -> float:
+def ds_check_single(key, token_addr: str):
+    """
+    Индикаторы DS для одного токена (его нет в снимке цикла): отдельный запрос Dexscreener.
+    Возвращает (ok | None если данных нет, reason, ds_feat).
+    """
+    best_ds_pair = best_by_liquidity(dxs_fetch(token_addr))
+    if not best_ds_pair:
+        return None, 'No Dexscreener data', {}
+    ds_ok, ds_reason, ds_feat = evaluate_trade_signal_from_ds_pair(best_ds_pair)
+    # история снимков пары -> производные признаки (d_price, dd_price, ...)
+    try:
+        push_pair_snapshot(key, best_ds_pair.price_usd or 0.0, ds_feat.get("vol_m5", 0.0),
+                           ds_feat.get("buys", 0), ds_feat.get("sells", 0))
+        ds_feat.update(compute_derivatives(key))
+    except Exception:
+        pass
+    return ds_ok, ds_reason, ds_feat
+
+def adjust_for_fees_pct(raw_profit_pct: float, hops: int = 2) -> float:
     """
     На входе — проценты (например 1.23 -> +1.23% raw).
     DEX_FEE и SLIPPAGE заданы в долях (0.003 = 0.3%).
+    hops — число свопов в маршруте (2 = вход+выход).
     Возвращает чистую прибыль в процентах после вычетов.
     """
-    fees_pct = (DEX_FEE * 2.0) * 100.0   # вход+выход (в процентах)
+    fees_pct = (DEX_FEE * hops) * 100.0   # комиссия за каждый своп (в процентах)
     slip_pct = SLIPPAGE * 100.0
     return raw_profit_pct - fees_pct - slip_pct
 
-def univ3_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
-    """Грубая оценка через sqrtPrice и самый ликвидный пул."""
-    global _last_graph_call
-    now = time.time()
-    if now - _last_graph_call < GRAPH_INTERVAL:
-        return None, "Uniswap skipped (graph interval)"
-    _last_graph_call = now
+def graph_post_fn(url_fn, tag, ctx):
+    """POST в subgraph сети ctx с её rate-limit; возвращает data или бросает исключение (для V3PoolCache)."""
+    def post(query, variables):
+        url = url_fn(ctx)
+        if not url:
+            raise RuntimeError(f"{tag}: no subgraph url")
+        with use_chain(ctx):
+            pace_requests()
+        resp = requests.post(url, json={"query": query, "variables": variables}, timeout=REQUEST_TIMEOUT)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{tag} HTTP {resp.status_code}: {resp.text[:200]}")
+        payload = resp.json()
+        if payload.get("errors"):
+            raise RuntimeError(f"{tag} graph errors: {str(payload['errors'])[:200]}")
+        return payload.get("data") or {}
+    return post
+
+def v3_snapshot_quote(cache, tag, src_addr: str, dst_addr: str, amount_units: int):
+    """Котировка по локальной модели пула из общего снимка (без сетевых запросов)."""
+    state = cache.get_state(src_addr, dst_addr, allow_network=False)
+    if state is None:
+        return None, f"{tag}: no pool in snapshot"
+    if time.time() - state.ts > V3_MAX_AGE:
+        return None, f"{tag}: snapshot stale ({int(time.time() - state.ts)}s)"
+    out_units, err = cache.quote(src_addr, dst_addr, amount_units, allow_network=False)
+    if err:
+        return None, f"{tag}: {err}"
+    return out_units, None
 
+def univ3_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
+    """Котировка по локальной модели пула (тики + ликвидность), состояние — из снимка UNIV3_POOLS."""
     url = graph_url()
     if not url:
         return None, "Uniswap skipped (no GRAPH_API_KEY)"
-
-    src = src_addr.lower()
-    dst = dst_addr.lower()
-    q = """
-    query Pools($a:String!, $b:String!){
-      pools(
-        where:{ token0_in:[$a,$b], token1_in:[$a,$b], feeTier_in:[500,3000,10000] }
-        first: 20, orderBy: liquidity, orderDirection: desc
-      ){
-        id feeTier liquidity sqrtPrice token0{ id decimals } token1{ id decimals }
-      }
-    }"""
     try:
-        pace_requests()
-        resp = requests.post(url, json={"query": q, "variables":{"a":src,"b":dst}}, timeout=REQUEST_TIMEOUT)
-        if resp.status_code != 200:
-            return None, f"Uniswap HTTP {resp.status_code}: {resp.text[:200]}"
-        data = resp.json()
-        pools = (data.get("data") or {}).get("pools") or []
-        if not pools:
-            return None, "Uniswap: no pools"
-        # оставляем пулы только ровно для пары
-        pools = [p for p in pools if {p["token0"]["id"].lower(), p["token1"]["id"].lower()} == {src, dst}]
-        if not pools:
-            return None, "Uniswap: no exact pool"
-        # берём самый ликвидный
-        def liq(x):
-            try: return float(x.get("liquidity") or 0)
-            except: return 0.0
-        pool = sorted(pools, key=liq, reverse=True)[0]
-        t0, t1 = pool["token0"], pool["token1"]
-        dec0, dec1 = int(t0["decimals"]), int(t1["decimals"])
-        sqrtP = int(pool["sqrtPrice"])
-        Q96 = 2**96
-        price1_per_0 = (sqrtP / Q96) ** 2 * (10 ** (dec0 - dec1))
-        if not isfinite(price1_per_0) or price1_per_0 <= 0:
-            return None, "Uniswap: bad sqrtP"
-        # направление
-        if src == t0["id"].lower() and dst == t1["id"].lower():
-            out_units = int(amount_units * price1_per_0 * (1 - int(pool["feeTier"])/1_000_000))
-        elif src == t1["id"].lower() and dst == t0["id"].lower():
-            out_units = int(amount_units * (1/price1_per_0) * (1 - int(pool["feeTier"])/1_000_000))
-        else:
-            return None, "Uniswap: dir mismatch"
-        if out_units <= 0:
-            return None, "Uniswap: zero out"
+        out_units, err = v3_snapshot_quote(UNIV3_POOLS, "Uniswap", src_addr, dst_addr, amount_units)
+        if err:
+            return None, err
         return {"buyAmount": str(out_units), "source": "UniswapV3"}, None
     except Exception as e:
         return None, f"Uniswap EXC: {repr(e)}"
 
 # ===================== SushiSwap v3 (Graph) =====================
-def sushi_graph_url():
-    # Требуются GRAPH_API_KEY и SUSHI_SUBGRAPH_ID в переменных окружения
-    if not GRAPH_API_KEY or not SUSHI_SUBGRAPH_ID:
+def sushi_graph_url(ctx=None):
+    # Требуются GRAPH_API_KEY и SUSHI_SUBGRAPH_ID (<NAME>_SUSHI_SUBGRAPH_ID) в переменных окружения
+    ctx = ctx or current_chain()
+    if not GRAPH_API_KEY or not ctx.sushi_subgraph_id:
         return None
-    return f"{GRAPH_GATEWAY_BASE}/{GRAPH_API_KEY}/subgraphs/id/{SUSHI_SUBGRAPH_ID}"
+    return f"{GRAPH_GATEWAY_BASE}/{GRAPH_API_KEY}/subgraphs/id/{ctx.sushi_subgraph_id}"
 
 def sushi_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
-    """Грубая оценка для Sushi v3 по sqrtPrice самого ликвидного пула."""
+    """Котировка Sushi v3 по локальной модели пула, состояние — из снимка SUSHI_POOLS."""
     url = sushi_graph_url()
     if not url:
         return None, "Sushi skipped (no GRAPH_API_KEY or SUSHI_SUBGRAPH_ID)"
-
-    src = src_addr.lower()
-    dst = dst_addr.lower()
-    q = """
-    query Pools($a:String!, $b:String!){
-      pools(
-        where:{ token0_in:[$a,$b], token1_in:[$a,$b], feeTier_in:[500,3000,10000] }
-        first: 20, orderBy: liquidity, orderDirection: desc
-      ){
-        id feeTier liquidity sqrtPrice token0{ id decimals } token1{ id decimals }
-      }
-    }"""
     try:
-        pace_requests()
-        resp = requests.post(url, json={"query": q, "variables":{"a":src,"b":dst}}, timeout=REQUEST_TIMEOUT)
-        if resp.status_code != 200:
-            return None, f"Sushi HTTP {resp.status_code}: {resp.text[:200]}"
-        data = resp.json()
-        pools = (data.get("data") or {}).get("pools") or []
-        if not pools:
-            return None, "Sushi: no pools"
-
-        # берём именно нашу пару и самый ликвидный пул
-        pools = [p for p in pools if {p["token0"]["id"].lower(), p["token1"]["id"].lower()} == {src, dst}]
-        if not pools:
-            return None, "Sushi: no exact pool"
-
-        def liq(x):
-            try: return float(x.get("liquidity") or 0)
-            except: return 0.0
-        pool = sorted(pools, key=liq, reverse=True)[0]
-
-        t0, t1 = pool["token0"], pool["token1"]
-        dec0, dec1 = int(t0["decimals"]), int(t1["decimals"])
-        sqrtP = int(pool["sqrtPrice"]); Q96 = 2**96
-        price1_per_0 = (sqrtP / Q96) ** 2 * (10 ** (dec0 - dec1))
-        if not isfinite(price1_per_0) or price1_per_0 <= 0:
-            return None, "Sushi: bad sqrtP"
-
-        fee = int(pool["feeTier"]) / 1_000_000
-        if src == t0["id"].lower() and dst == t1["id"].lower():
-            out_units = int(amount_units * price1_per_0 * (1 - fee))
-        elif src == t1["id"].lower() and dst == t0["id"].lower():
-            out_units = int(amount_units * (1/price1_per_0) * (1 - fee))
-        else:
-            return None, "Sushi: dir mismatch"
-
-        if out_units <= 0:
-            return None, "Sushi: zero out"
+        out_units, err = v3_snapshot_quote(SUSHI_POOLS, "Sushi", src_addr, dst_addr, amount_units)
+        if err:
+            return None, err
         return {"buyAmount": str(out_units), "source": "SushiSwap"}, None
     except Exception as e:
         return None, f"Sushi EXC: {repr(e)}"
 
+def watched_pair_addrs():
+    """Все пары (base, token) этого шарда, которые сканирует основной цикл, — адресами."""
+    out = []
+    for base_symbol in BASE_TOKENS:
+        if base_symbol not in TOKENS:
+            continue
+        for token_symbol, token_addr in TOKENS.items():
+            if token_symbol != base_symbol and is_my_pair((base_symbol, token_symbol)):
+                out.append((TOKENS[base_symbol], token_addr))
+    return out
+
+# таблицы состояний V3-пулов сети: наполняются только снапшот-сервисами (их потоки работают в контексте сети)
+for _c in CHAIN_CONTEXTS:
+    _c.univ3_pools = V3PoolCache(graph_post_fn(graph_url, "Uniswap", _c), tick_window=V3_TICK_WINDOW)
+    _c.sushi_pools = V3PoolCache(graph_post_fn(sushi_graph_url, "Sushi", _c), tick_window=V3_TICK_WINDOW)
+    _c.univ3_snapshot = GraphSnapshotService(_c.prefix + "Uniswap", _c.univ3_pools.post, _c.univ3_pools,
+                                             bind(_c, watched_pair_addrs), interval=GRAPH_INTERVAL,
+                                             batch_size=GRAPH_BATCH_SIZE, tick_window=V3_TICK_WINDOW,
+                                             on_error=bind(_c, add_dex_issue))
+    _c.sushi_snapshot = GraphSnapshotService(_c.prefix + "Sushi", _c.sushi_pools.post, _c.sushi_pools,
+                                             bind(_c, watched_pair_addrs), interval=GRAPH_INTERVAL,
+                                             batch_size=GRAPH_BATCH_SIZE, tick_window=V3_TICK_WINDOW,
+                                             on_error=bind(_c, add_dex_issue))
+UNIV3_POOLS = ChainLocal(lambda c: c.univ3_pools)
+SUSHI_POOLS = ChainLocal(lambda c: c.sushi_pools)
+
+def start_graph_snapshots():
+    for ctx in CHAIN_CONTEXTS:
+        if graph_url(ctx):
+            ctx.univ3_snapshot.start()
+        if sushi_graph_url(ctx):
+            ctx.sushi_snapshot.start()
+
 # ===================== 1inch =====================
 def oneinch_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
+    return SF_ONEINCH.do((current_chain().name, src_addr.lower(), dst_addr.lower(), int(amount_units)),
+                         _oneinch_quote_http, src_addr, dst_addr, amount_units)
+
+def _oneinch_quote_http(src_addr: str, dst_addr: str, amount_units: int):
     params = {
         # оба формата, т.к. v6 и v5 используют разные названия
         "src": src_addr, "dst": dst_addr,
@@ -484,7 +827,7 @@ def oneinch_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
     if ONEINCH_API_KEY:
         try:
             pace_requests()
-            r = requests.get(ONEINCH_V6_URL, params=params,
+            r = requests.get(ONEINCH_V6_URL.format(chain_id=current_chain().chain_id), params=params,
                              headers={"Authorization": f"Bearer {ONEINCH_API_KEY}", "Accept":"application/json"},
                              timeout=REQUEST_TIMEOUT)
             if r.status_code == 200:
@@ -503,7 +846,7 @@ def oneinch_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
     # 2) v5 (публичный) — может вернуть HTML → ловим и пишем как причину
     try:
         pace_requests()
-        r = requests.get(ONEINCH_V5_URL, params=params, timeout=REQUEST_TIMEOUT)
+        r = requests.get(ONEINCH_V5_URL.format(chain_id=current_chain().chain_id), params=params, timeout=REQUEST_TIMEOUT)
         # если прилетел HTML — json() упадёт
         data = r.json()
         amt = data.get("toTokenAmount") or data.get("dstAmount")
@@ -515,17 +858,124 @@ def oneinch_quote_amount_out(src_addr: str, dst_addr: str, amount_units: int):
 
 # ===================== MULTI-SOURCE QUOTE =====================
 def quote_amount_out(src_symbol: str, dst_symbol: str, amount_units: int):
-    """Пробуем 1inch → Uniswap → Dexscreener. Возвращаем (dict|None, reasons[list])."""
+    """Котировка по цепочке источников (single-flight по (src, dst, amount))."""
+    return SF_QUOTE.do((current_chain().name, src_symbol, dst_symbol, int(amount_units)), _quote_and_ingest,
+                       src_symbol, dst_symbol, amount_units)
+
+def _quote_and_ingest(src_symbol: str, dst_symbol: str, amount_units: int, oneinch: bool = True):
+    """Удачный результат заодно обновляет ребро графа маршрутов."""
+    q, reasons = _quote_amount_out_chain(src_symbol, dst_symbol, amount_units, oneinch)
+    if q and q.get("buyAmount"):
+        try:
+            _ingest_quote(src_symbol, dst_symbol, amount_units, int(q["buyAmount"]), q.get("source", "unknown"))
+        except Exception:
+            pass
+    return q, reasons
+
+def _ingest_quote(src_symbol: str, dst_symbol: str, amount_units: int, out_units: int, source: str):
+    if ROUTE_ENABLED and out_units:
+        try:
+            ROUTE_GRAPH.update_quote(route_node(src_symbol), route_node(dst_symbol),
+                                     amount_units / (10 ** DECIMALS.get(src_symbol, 18)),
+                                     out_units / (10 ** DECIMALS.get(dst_symbol, 18)), source)
+        except Exception:
+            pass
+
+ROUND_TRIP_STATS = {"single": 0, "two_leg": 0}
+
+def quote_round_trip(base_symbol: str, token_symbol: str, amount_units: int):
+    """
+    Круг base->token->base. Возвращает (q_in|None, q_out|None, reasons).
+    Приоритет источников — как у основной цепочки (и у монитора, который котирует выход по ней):
+    сначала 1inch (v6 с ключом, иначе публичный v5) — вход, затем выход по полной цепочке.
+    Если 1inch не ответил — источники, которые умеют весь путь за один запрос: локальные модели
+    V3-пулов (Uniswap, Sushi — 0 запросов), Web3 getAmountsOut([base, token, base]); иначе две ноги
+    по остальной цепочке (вход — уже без 1inch).
+    """
+    return SF_ROUND_TRIP.do((current_chain().name, base_symbol, token_symbol, int(amount_units)), _quote_round_trip,
+                            base_symbol, token_symbol, amount_units)
+
+def _quote_round_trip(base_symbol: str, token_symbol: str, amount_units: int):
+    reasons = []
+    base_addr = TOKENS[base_symbol].lower()
+    token_addr = TOKENS[token_symbol].lower()
+
+    # 1) 1inch — первый источник основной цепочки
+    q_in, err = oneinch_quote_amount_out(base_addr, token_addr, amount_units)
+    if q_in and q_in.get("buyAmount"):
+        q_in["source"] = q_in.get("source") or "1inch"
+        try:
+            _ingest_quote(base_symbol, token_symbol, amount_units, int(q_in["buyAmount"]), q_in["source"])
+        except Exception:
+            pass
+        ROUND_TRIP_STATS["two_leg"] += 1
+        return _round_trip_exit(base_symbol, token_symbol, q_in, reasons)
+    if err:
+        reasons.append(err)
+
+    # 2) весь круг одним запросом (или без запросов)
+    legs = None
+    for cache, tag, enabled in ((UNIV3_POOLS, "UniswapV3", bool(graph_url())),
+                                (SUSHI_POOLS, "SushiSwap", bool(sushi_graph_url()))):
+        if not enabled:
+            continue
+        try:
+            mid, err = v3_snapshot_quote(cache, tag, base_addr, token_addr, amount_units)
+            back, err2 = (v3_snapshot_quote(cache, tag, token_addr, base_addr, mid) if mid else (None, err))
+            if mid and back:
+                legs = (mid, back, tag)
+                break
+            reasons.append(err2 or err)
+        except Exception as e:
+            reasons.append(f"{tag} round-trip EXC: {repr(e)}")
+    if legs is None and USE_WEB3 and current_chain().web3 is not None:
+        try:
+            mid, back = current_chain().web3.get_round_trip(base_symbol, token_symbol, amount_units)
+            if mid and back:
+                legs = (mid, back, "Web3")
+        except Exception as e:
+            reasons.append(f"Web3 round-trip: {e}")
+    if legs is not None:
+        mid, back, tag = legs
+        ROUND_TRIP_STATS["single"] += 1
+        _ingest_quote(base_symbol, token_symbol, amount_units, mid, tag)
+        _ingest_quote(token_symbol, base_symbol, mid, back, tag)
+        return ({"buyAmount": str(mid), "protocols": [], "source": tag},
+                {"buyAmount": str(back), "protocols": [], "source": tag}, reasons)
+
+    # 3) запасной путь: две ноги по остальной цепочке, выход зависит от результата входа
+    ROUND_TRIP_STATS["two_leg"] += 1
+    q_in, r_in = _quote_and_ingest(base_symbol, token_symbol, amount_units, oneinch=False)
+    reasons += r_in
+    return _round_trip_exit(base_symbol, token_symbol, q_in, reasons)
+
+def _round_trip_exit(base_symbol: str, token_symbol: str, q_in, reasons):
+    """Выходная нога token->base по полной цепочке на объём, полученный на входе."""
+    if not q_in or not q_in.get("buyAmount"):
+        return None, None, reasons
+    try:
+        mid = int(q_in["buyAmount"])
+    except Exception:
+        return q_in, None, reasons
+    if mid <= 0:
+        return q_in, None, reasons
+    q_out, r_out = quote_amount_out(token_symbol, base_symbol, mid)
+    return q_in, q_out, reasons + r_out
+
+def _quote_amount_out_chain(src_symbol: str, dst_symbol: str, amount_units: int, oneinch: bool = True):
+    """Пробуем 1inch → Uniswap → Dexscreener. Возвращаем (dict|None, reasons[list]).
+    oneinch=False — 1inch уже спрошен вызывающим (круговая котировка) и не ответил."""
     src_addr = TOKENS[src_symbol].lower()
     dst_addr = TOKENS[dst_symbol].lower()
     reasons = []
 
     # 1) 1inch
-    q, err = oneinch_quote_amount_out(src_addr, dst_addr, amount_units)
-    if q and q.get("buyAmount"):
-        q["source"] = q.get("source") or "1inch"
-        return q, reasons
-    if err: reasons.append(err)
+    if oneinch:
+        q, err = oneinch_quote_amount_out(src_addr, dst_addr, amount_units)
+        if q and q.get("buyAmount"):
+            q["source"] = q.get("source") or "1inch"
+            return q, reasons
+        if err: reasons.append(err)
 
     # 2) UniswapV3
     q, err = univ3_quote_amount_out(src_addr, dst_addr, amount_units)
@@ -544,9 +994,9 @@ def quote_amount_out(src_symbol: str, dst_symbol: str, amount_units: int):
         reasons.append(err)
 
     # Web3 (если включен флаг USE_WEB3)
-    if USE_WEB3:
+    if USE_WEB3 and current_chain().web3 is not None:
         try:
-            q = get_quote_web3(src_symbol, dst_symbol, amount_units)
+            q = current_chain().web3.get_quote(src_symbol, dst_symbol, amount_units)
             if q:
                 q["source"] = "Web3"
                 return q, reasons
@@ -601,9 +1051,15 @@ def compute_consensus(src_results: list):
     return count
 
 # ===================== Мониторинг сделки =====================
-def monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units, source_tag):
-    """Параллельный монитор входа: ждём до HOLD_SECONDS, следим за целью/стопом, шлём финал."""
-    start = time.time()
+def monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units, source_tag,
+                         route_label=None, started_at=None, signal_uid=None, hops=2):
+    """Параллельный монитор входа: ждём до HOLD_SECONDS, следим за целью/стопом, шлём финал.
+    route_label — подпись маршрута для циклов длиннее base->token->base (держим последний токен цикла).
+    started_at — время входа (при восстановлении позиции после перезапуска).
+    signal_uid — uid строки signals.db: финальный результат дописывается в неё (outcome, pnl_real).
+    hops — число свопов в сделке (у маршрута len(path)-1): по нему считается net-PnL."""
+    start = started_at or time.time()
+    pair_label = route_label or f"{base_symbol}->{token_symbol}->{base_symbol}"
     alerted_take = False
     alerted_stop = False
 
@@ -626,17 +1082,19 @@ def monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount
         pnl = profit_pct_by_units(entry_sell_units, exit_units) if exit_units else None
 
         if is_final:
+            if signal_uid:
+                enqueue_outcome_update(signal_uid, pnl, exit_units, int(elapsed), hops=hops)
             # финальное сообщение
             if pnl is not None:
                 # абсолют в USDT — эквивалент входа
                 base_dec = DECIMALS.get(base_symbol, 6)
                 entry_tokens = entry_sell_units / (10 ** base_dec)
                 abs_usdt = entry_tokens * (pnl / 100.0) if pnl is not None else 0.0
-                final_net = adjust_for_fees_pct(pnl) if (pnl is not None) else None
+                final_net = adjust_for_fees_pct(pnl, hops=hops) if (pnl is not None) else None
 
                 msg_lines = [
-                    "✅ Финальный результат",
-                    f"PAIR: {base_symbol}->{token_symbol}->{base_symbol}",
+                    "✅ Финальный результат" + chain_tag(),
+                    f"PAIR: {pair_label}",
                     f"Источник: {source_tag}"
                 ]
                 if pnl is not None:
@@ -650,8 +1108,8 @@ def monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount
                 send_telegram("\n".join(msg_lines))
             else:
                 send_telegram(
-                    f"✅ Финальный результат\n"
-                    f"PAIR: {base_symbol}->{token_symbol}->{base_symbol}\n"
+                    f"✅ Финальный результат{chain_tag()}\n"
+                    f"PAIR: {pair_label}\n"
                     f"Источник: {source_tag}\n"
                     f"PnL: — (котировка выхода не получена)\n"
                     f"Время: {now_local()}"
@@ -660,28 +1118,124 @@ def monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount
 
         # промежуточные алерты (однократно)
         if pnl is not None:
-            final_net = adjust_for_fees_pct(pnl)
+            final_net = adjust_for_fees_pct(pnl, hops=hops)
 
             if (not alerted_take) and pnl >= MIN_PROFIT_PERCENT:
                 if final_net is not None:
-                    send_telegram(f"🎯 Цель достигнута: {pnl:.2f}% (net {final_net:.2f}%) по {token_symbol} (Источник: {source_tag})")
+                    send_telegram(f"🎯 Цель достигнута: {pnl:.2f}% (net {final_net:.2f}%) по {token_symbol}{chain_tag()} (Источник: {source_tag})")
                 else:
-                    send_telegram(f"🎯 Цель достигнута: {pnl:.2f}% по {token_symbol} (Источник: {source_tag})")
+                    send_telegram(f"🎯 Цель достигнута: {pnl:.2f}% по {token_symbol}{chain_tag()} (Источник: {source_tag})")
                 alerted_take = True
 
             if (not alerted_stop) and pnl <= STOP_LOSS_PERCENT:
                 if final_net is not None:
-                    send_telegram(f"⚠️ Стоп-лосс: {pnl:.2f}% (net {final_net:.2f}%) по {token_symbol} (Источник: {source_tag})")
+                    send_telegram(f"⚠️ Стоп-лосс: {pnl:.2f}% (net {final_net:.2f}%) по {token_symbol}{chain_tag()} (Источник: {source_tag})")
                 else:
-                    send_telegram(f"⚠️ Стоп-лосс: {pnl:.2f}% по {token_symbol} (Источник: {source_tag})")
+                    send_telegram(f"⚠️ Стоп-лосс: {pnl:.2f}% по {token_symbol}{chain_tag()} (Источник: {source_tag})")
                 alerted_stop = True
 
         time.sleep(20)
 
+OPEN_POSITIONS = {}  # id -> параметры монитора (для снимка состояния)
+_positions_lock = threading.Lock()
+_position_seq = 0
+
+def _run_monitor(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units, source_tag,
+                 route_label=None, started_at=None, signal_uid=None, hops=2):
+    global _position_seq
+    started_at = started_at or time.time()
+    with _positions_lock:
+        _position_seq += 1
+        pid = _position_seq
+        OPEN_POSITIONS[pid] = {
+            "base": base_symbol, "token": token_symbol, "entry_sell_units": entry_sell_units,
+            "buy_amount_token_units": buy_amount_token_units, "source": source_tag,
+            "route_label": route_label, "started_at": started_at, "signal_uid": signal_uid,
+            "chain": current_chain().name, "hops": hops,
+        }
+    try:
+        monitor_trade_thread(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units,
+                             source_tag, route_label, started_at, signal_uid, hops)
+    finally:
+        with _positions_lock:
+            OPEN_POSITIONS.pop(pid, None)
+
 def start_monitor(*args):
-    t = threading.Thread(target=monitor_trade_thread, args=args, daemon=True)
+    # монитор котирует выход в сети, из которой пришёл сигнал
+    t = threading.Thread(target=bind(current_chain(), _run_monitor), args=args, daemon=True)
     t.start()
 
+# ===================== Снимок состояния (тёплый перезапуск) =====================
+def collect_state_caches():
+    caches = {}
+    if ROUTE_ENABLED:
+        caches["route_edges"] = ROUTE_GRAPH.export_edges()
+    caches["v3_univ3"] = UNIV3_POOLS.export_states(max_age=V3_MAX_AGE)
+    caches["v3_sushi"] = SUSHI_POOLS.export_states(max_age=V3_MAX_AGE)
+    return caches
+
+def state_snapshot_path(ctx) -> str:
+    """Снимок у каждой сети свой; у основной — прежний путь."""
+    return STATE_SNAPSHOT_PATH if ctx.primary else f"{STATE_SNAPSHOT_PATH}_{ctx.name}"
+
+def save_state_snapshot():
+    size = took = 0
+    for ctx in CHAIN_CONTEXTS:
+        with use_chain(ctx):
+            with _positions_lock:
+                positions = [p for p in OPEN_POSITIONS.values() if p.get("chain", ctx.name) == ctx.name]
+            sz, tk = save_state(state_snapshot_path(ctx), dict(PAIR_BUFFERS), BUFFER_LEN, dict(ban_list),
+                                positions, collect_state_caches())
+        size, took = size + sz, took + tk
+    if DEBUG_MODE:
+        print(f"[STATE] saved {size/1024:.1f} KiB in {took*1000:.1f} ms")
+    return size, took
+
+def restore_state_snapshot():
+    """Восстанавливает снимки всех сетей; возвращает строку для стартового сообщения."""
+    infos = []
+    for ctx in CHAIN_CONTEXTS:
+        with use_chain(ctx):
+            info = restore_chain_state()
+        infos.append(info if not MULTI_CHAIN else f"{ctx.name}: {info}")
+    return "\n".join(infos)
+
+def restore_chain_state():
+    """Буферы, баны, позиции и кэши сети текущего контекста."""
+    try:
+        st = load_state(state_snapshot_path(current_chain()), BUFFER_LEN, STATE_BUFFER_MAX_AGE, HOLD_SECONDS)
+    except Exception as e:
+        print("[STATE] restore failed:", repr(e))
+        return "Состояние: не восстановлено (ошибка)"
+    PAIR_BUFFERS.update(st["buffers"])
+    ban_list.update(st["bans"])
+    caches = st["caches"]
+    if ROUTE_ENABLED and caches.get("route_edges"):
+        ROUTE_GRAPH.import_edges(caches["route_edges"])
+    UNIV3_POOLS.import_states(caches.get("v3_univ3") or [], max_age=V3_MAX_AGE)
+    SUSHI_POOLS.import_states(caches.get("v3_sushi") or [], max_age=V3_MAX_AGE)
+    for pos in st["positions"]:
+        if pos.get("base") in TOKENS and pos.get("token") in TOKENS:
+            start_monitor(pos["base"], pos["token"], pos["entry_sell_units"], pos["buy_amount_token_units"],
+                          pos["source"], pos.get("route_label"), pos["started_at"], pos.get("signal_uid"),
+                          pos.get("hops", 2))
+    info = (f"Состояние: {len(st['buffers'])} буферов, {len(st['bans'])} банов, {len(st['positions'])} позиций "
+            f"за {st['restore_sec']*1000:.1f} мс (снимок {st['snapshot_bytes']/1024:.1f} KiB, пропущено устаревших {st['skipped']})")
+    print(f"[STATE] {current_chain().prefix}{info}")
+    return info
+
+def state_snapshot_worker():
+    while True:
+        time.sleep(STATE_SNAPSHOT_INTERVAL)
+        try:
+            save_state_snapshot()
+        except Exception as e:
+            print("[STATE] save failed:", repr(e))
+
+def start_state_snapshots():
+    threading.Thread(target=state_snapshot_worker, daemon=True).start()
+    atexit.register(save_state_snapshot)
+
 # --- Логирование сигналов (SQLite + CSV fallback) ---
 import json
 import threading
@@ -694,7 +1248,10 @@ _writer_thread = None
 
 def init_logging_db():
     global _db_conn
-    _db_conn = sqlite3.connect(LOG_DB_PATH, check_same_thread=False)
+    _db_conn = sqlite3.connect(LOG_DB_PATH, check_same_thread=False, timeout=30)
+    # auto_vacuum=INCREMENTAL (для старой базы — один полный VACUUM при первом запуске)
+    if enable_incremental_vacuum(_db_conn):
+        print(f"[DB] {LOG_DB_PATH}: converted to incremental auto_vacuum")
     cur = _db_conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS signals (
@@ -710,47 +1267,117 @@ def init_logging_db():
         entry_sell_units INTEGER,
         buy_amount_token_units INTEGER,
         exit_units_est INTEGER,
-        outcome INTEGER,   -- 1 win, 0 lose, -1 pending
-        pnl_real REAL,
-        hold_seconds INTEGER
+        outcome INTEGER,   -- 1 win, 0 lose, -1 pending, -2 no exit quote at the end of hold
+        pnl_real REAL,         -- net-PnL монитора (после комиссий за hops свопов)
+        hold_seconds INTEGER,
+        opt_size_usd REAL,
+        opt_pnl_usd REAL,
+        uid TEXT,              -- ключ для дописывания результата монитором
+        exit_units_real INTEGER,
+        resolved_ts TEXT,
+        chain TEXT,            -- сеть сигнала (мультисетевой режим)
+        pnl_raw REAL           -- PnL монитора до комиссий (для офлайн-перерасчёта с другими издержками)
     )
     """)
+    # миграция старых баз: добавляем недостающие колонки
+    have = {row[1] for row in cur.execute("PRAGMA table_info(signals)")}
+    for col, typ in (("opt_size_usd", "REAL"), ("opt_pnl_usd", "REAL"), ("uid", "TEXT"),
+                     ("exit_units_real", "INTEGER"), ("resolved_ts", "TEXT"), ("chain", "TEXT"),
+                     ("pnl_raw", "REAL")):
+        if col not in have:
+            cur.execute(f"ALTER TABLE signals ADD COLUMN {col} {typ}")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_signals_uid ON signals(uid)")
+    _db_conn.commit()
+    ensure_schema_extras(_db_conn)
+
+def signals_compaction_worker():
+    """Периодически переносит старые размеченные строки в архив и освобождает страницы."""
+    while True:
+        time.sleep(SIGNALS_COMPACT_INTERVAL)
+        try:
+            st = compact_signals(LOG_DB_PATH, SIGNALS_RETENTION_DAYS, SIGNALS_ARCHIVE_DIR)
+            if st["archived"]:
+                print(f"[DB] archived {st['archived']} rows -> {', '.join(st['months'])}, "
+                      f"freed {st['vacuumed_pages']} pages in {st['sec']:.2f}s")
+        except Exception as e:
+            print("[DB] compaction failed:", repr(e))
+
+WRITER_BATCH = int(os.getenv("WRITER_BATCH", "200"))
+
+def _db_units(v):
+    """units токенов с 18 знаками легко выходят за INTEGER SQLite (int64) — такие пишем как REAL."""
+    if isinstance(v, int) and not -2 ** 63 <= v < 2 ** 63:
+        return float(v)
+    return v
+
+def _insert_row(item):
+    return (
+        item.get("ts"), item.get("base"), item.get("token"), item.get("source"),
+        item.get("exp_pnl"), item.get("net_pnl"), item.get("predicted_prob"),
+        json.dumps(item.get("features") or {}, ensure_ascii=False),
+        _db_units(item.get("entry_sell_units")), _db_units(item.get("buy_amount_token_units")),
+        _db_units(item.get("exit_units_est")),
+        item.get("outcome", -1), item.get("pnl_real"), item.get("hold_seconds"),
+        item.get("opt_size_usd"), item.get("opt_pnl_usd"), item.get("uid"), item.get("chain")
+    )
+
+def _write_batch(cur, items):
+    """Одна транзакция на пачку: сначала вставки, затем дописывание результатов по uid."""
+    inserts = [_insert_row(it) for it in items if it.get("op", "insert") == "insert"]
+    updates = [(it.get("outcome"), it.get("pnl_real"), it.get("pnl_raw"), _db_units(it.get("exit_units_real")),
+                it.get("hold_seconds"), it.get("resolved_ts"), it["uid"]) for it in items if it.get("op") == "outcome"]
+    if inserts:
+        cur.executemany("""
+        INSERT INTO signals
+        (ts, base, token, source, exp_pnl, net_pnl, predicted_prob, features_json,
+         entry_sell_units, buy_amount_token_units, exit_units_est, outcome, pnl_real, hold_seconds,
+         opt_size_usd, opt_pnl_usd, uid, chain)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, inserts)
+    if updates:
+        cur.executemany("""
+        UPDATE signals SET outcome=?, pnl_real=?, pnl_raw=?, exit_units_real=?, hold_seconds=COALESCE(?, hold_seconds),
+                           resolved_ts=?
+        WHERE uid=?
+        """, updates)
     _db_conn.commit()
 
 def writer_worker():
     global _db_conn
     cur = _db_conn.cursor()
-    while True:
-        item = _write_queue.get()
-        if item is None:
-            break
+    stop = False
+    while not stop:
+        items = [_write_queue.get()]
+        # добираем всё, что уже накопилось, — одна транзакция на пачку
+        while len(items) < WRITER_BATCH:
+            try:
+                items.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in items:
+            stop = True
+        batch = [it for it in items if it is not None]
         try:
-            cur.execute("""
-            INSERT INTO signals
-            (ts, base, token, source, exp_pnl, net_pnl, predicted_prob, features_json,
-             entry_sell_units, buy_amount_token_units, exit_units_est, outcome, pnl_real, hold_seconds)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            """, (
-                item.get("ts"), item.get("base"), item.get("token"), item.get("source"),
-                item.get("exp_pnl"), item.get("net_pnl"), item.get("predicted_prob"),
-                json.dumps(item.get("features") or {}, ensure_ascii=False),
-                item.get("entry_sell_units"), item.get("buy_amount_token_units"), item.get("exit_units_est"),
-                item.get("outcome", -1), item.get("pnl_real"), item.get("hold_seconds")
-            ))
-            _db_conn.commit()
+            if batch:
+                _write_batch(cur, batch)
         except Exception as e:
             try:
+                _db_conn.rollback()
                 with open(LOG_CSV_PATH, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                    for item in batch:
+                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
             except Exception:
                 print("[LOGGING ERROR]", repr(e))
-        _write_queue.task_done()
+        for _ in items:
+            _write_queue.task_done()
 
 def start_writer():
     global _writer_thread
     init_logging_db()
     _writer_thread = threading.Thread(target=writer_worker, daemon=True)
     _writer_thread.start()
+    if SIGNALS_COMPACT_INTERVAL > 0 and SHARD_INDEX == 0:
+        threading.Thread(target=signals_compaction_worker, daemon=True).start()
     atexit.register(stop_writer)
 
 def stop_writer():
@@ -770,11 +1397,28 @@ def stop_writer():
         pass
 
 def enqueue_signal_record(record: dict):
+    record.setdefault("chain", current_chain().name)
     try:
         _write_queue.put_nowait(record)
     except queue.Full:
         print("[LOG QUEUE FULL] Dropping record")
 
+def new_signal_uid() -> str:
+    return uuid.uuid4().hex
+
+def enqueue_outcome_update(uid: str, pnl_raw, exit_units, held_seconds=None, hops: int = 2):
+    """Результат монитора -> строка сигнала: outcome 1/0 по net-PnL (комиссии за hops свопов),
+    -2 если котировки выхода нет. pnl_real — net, pnl_raw — до комиссий."""
+    if pnl_raw is None:
+        outcome, pnl_real = -2, None
+    else:
+        pnl_real = adjust_for_fees_pct(pnl_raw, hops=hops)
+        outcome = 1 if pnl_real > 0 else 0
+    enqueue_signal_record({
+        "op": "outcome", "uid": uid, "outcome": outcome, "pnl_real": pnl_real, "pnl_raw": pnl_raw,
+        "exit_units_real": exit_units, "hold_seconds": held_seconds, "resolved_ts": now_local(),
+    })
+
 MODEL_PATH = os.getenv("MODEL_PATH", "model_lgb.pkl")
 _model = None
 
@@ -787,6 +1431,36 @@ def load_model():
         _model = None
         print("[MODEL] not loaded:", e)
 
+def build_signal_features(exp_pnl, net_profit, entry_sell_units, buy_amount_token_units, exit_units_est, ds_feat,
+                          pool_feat=None):
+    """Признаки сигнала в том же формате, что при обучении (train_model.build_feature_matrix).
+    pool_feat — признаки пула из истории резервов (reserve_features), пишутся в features_json."""
+    try:
+        feat = {
+            "exp_pnl": float(exp_pnl or 0.0),
+            "net_pnl": float(net_profit or 0.0),
+            "entry_sell_units": int(entry_sell_units or 0),
+            "buy_amount_token_units": int(buy_amount_token_units or 0),
+            "exit_units_est": int(exit_units_est or 0),
+            "hold_seconds": int(HOLD_SECONDS or 0),
+            # доп. признаки из ds_feat (если есть)
+            "liquidity_usd": float(ds_feat.get("liquidity_usd", 0.0)),
+            "buys": float(ds_feat.get("buys", 0.0)),
+            "sells": float(ds_feat.get("sells", 0.0)),
+            "vol_m5": float(ds_feat.get("vol_m5", 0.0)),
+            "avg_m5": float(ds_feat.get("avg_m5", 0.0)),
+            "momentum_m5": float(ds_feat.get("momentum_m5", 0.0)),
+        }
+        # возможно, некоторые производные признаки тоже есть в ds_feat
+        for k in ("d_price","dd_price","d_vol","d_buys","vol_rel_change"):
+            if k in ds_feat:
+                feat[k] = float(ds_feat.get(k) or 0.0)
+        for k, v in (pool_feat or {}).items():
+            feat[k] = float(v)
+    except Exception:
+        feat = {}
+    return feat
+
 def model_predict_proba(feature_dict):
     if _model is None:
         return None
@@ -799,158 +1473,843 @@ def model_predict_proba(feature_dict):
         print("[MODEL PRED ERROR]", e)
         return None
 
+# ===================== Оптимальный объём =====================
+def probe_round_trip_ratio(base_symbol, token_symbol, entry_units):
+    """Круг base->token->base на заданном объёме: exit/entry или None."""
+    q_in, q_out, _ = quote_round_trip(base_symbol, token_symbol, entry_units)
+    if not q_out or not q_out.get("buyAmount"):
+        return None
+    return int(q_out["buyAmount"]) / entry_units
+
+def optimal_sizes_for(candidates):
+    """
+    candidates: список dict с ключами entry_sell_units, exit_units_est, base_dec, liquidity_usd
+    и опционально probe_ratio/probe_size_usd (котировка круга на большем объёме).
+    Возвращает список (size_usd|None, pnl_usd, pnl_pct) — одним векторным расчётом.
+    """
+    if not candidates:
+        return []
+    x0 = [c["entry_sell_units"] / (10 ** c["base_dec"]) for c in candidates]
+    r0 = [c["exit_units_est"] / c["entry_sell_units"] for c in candidates]
+    depth = depth_from_liquidity([c.get("liquidity_usd") or float("nan") for c in candidates])
+    for i, c in enumerate(candidates):
+        if c.get("probe_ratio"):
+            d = depth_from_quotes(x0[i], r0[i], c["probe_size_usd"], c["probe_ratio"])
+            if d == d:  # не NaN
+                depth[i] = d
+    cost = 2.0 * DEX_FEE + SLIPPAGE
+    sizes, pnls, pcts = optimise_sizes(r0, depth, x0, cost, SIZE_MIN_USD, SIZE_MAX_USD, SIZE_GRID)
+    return [(None if s != s else float(s), float(p), float(q)) for s, p, q in zip(sizes, pnls, pcts)]
+
+# ===================== Циклы по графу маршрутов =====================
+def process_route_cycles():
+    """
+    Ищем прибыльные циклы длиной > 2 по графу курсов (только через изменившиеся рёбра),
+    перепроверяем лучшие из них реальными котировками по каждому шагу и отправляем
+    в тот же путь сигнал → монитор → Telegram, что и обычные пары.
+    """
+    anchors = [route_node(b) for b in BASE_TOKENS if b in TOKENS]
+    min_profit = (MIN_PROFIT_PERCENT + SLIPPAGE * 100.0) / 100.0
+    try:
+        ROUTE_GRAPH.prune()
+        cycles = ROUTE_GRAPH.find_cycles(min_profit=min_profit, anchors=anchors)
+    except Exception as e:
+        add_dex_issue(f"Route graph EXC: {repr(e)}")
+        return
+    cycles = [c for c in cycles if len(c["path"]) > 3]  # base->token->base проверяет основной проход
+
+    for cyc in cycles[:ROUTE_MAX_SIGNALS]:
+        path = cyc["path"]
+        key = tuple(path)
+        label = "->".join(path)
+        inc_checked()
+        banned = pair_ban_left(key)
+        if banned:
+            add_skip(f"Banned ({banned[0]}, left {banned[1]}s)", label)
+            continue
+
+        base_symbol = path[0]
+        entry_sell_units = int(SELL_AMOUNT_USD * (10 ** DECIMALS.get(base_symbol, 6)))
+        units = entry_sell_units
+        held_units = None
+        sources = []
+        for src_sym, dst_sym in zip(path, path[1:]):
+            held_units = units
+            q, reasons = quote_amount_out(src_sym, dst_sym, units)
+            try:
+                units = int(q["buyAmount"]) if q and q.get("buyAmount") else 0
+            except Exception:
+                units = 0
+            if units <= 0:
+                add_skip("Route: no quote", f"{label} ({src_sym}->{dst_sym})")
+                for rs in reasons:
+                    add_skip(f"Cause {src_sym}->{dst_sym}", rs)
+                break
+            sources.append(q.get("source", "unknown"))
+        if units <= 0:
+            ban_pair(key, "Route no quote", duration=60)
+            continue
+
+        hops = len(path) - 1
+        exp_pnl = profit_pct_by_units(entry_sell_units, units)
+        if exp_pnl is None:
+            continue
+        net_profit = adjust_for_fees_pct(exp_pnl, hops=hops)
+        if net_profit < MIN_PROFIT_PERCENT:
+            add_skip(f"Route low net profit {net_profit:.2f}% (graph {cyc['profit']*100:.2f}%)", label)
+            ban_pair(key, "Route low profit", duration=120)
+            continue
+
+        source_tag = " / ".join(sources)
+        if not claim_signal(key):
+            add_skip("Already signalled (claimed)", label)
+            continue
+        inc_signal()
+        send_telegram(
+            f"📣 Предварительный сигнал (маршрут)\n"
+            + chain_line() +
+            f"PAIR: {label}\n"
+            f"Источники по шагам: {source_tag}\n"
+            f"Ожидаемый PnL (raw): {exp_pnl:.2f}%\n"
+            f"Ожидаемый PnL (net, {hops} свопа): {net_profit:.2f}%\n"
+            f"Оценка по графу (net): {cyc['profit']*100:.2f}%\n"
+            f"План: удержание ~{HOLD_SECONDS//60}-{(HOLD_SECONDS//60)+3} мин, цель {MIN_PROFIT_PERCENT:.2f}%, стоп {STOP_LOSS_PERCENT:.2f}%\n"
+            f"Время: {now_local()}"
+        )
+        signal_uid = new_signal_uid()
+        enqueue_signal_record({
+            "ts": now_local(), "base": base_symbol, "token": path[-2], "source": source_tag,
+            "exp_pnl": exp_pnl, "net_pnl": net_profit,
+            "features": {"exp_pnl": exp_pnl, "net_pnl": net_profit, "route": label, "hops": hops,
+                         "graph_profit": cyc["profit"] * 100.0},
+            "entry_sell_units": entry_sell_units, "buy_amount_token_units": held_units,
+            "exit_units_est": units, "outcome": -1, "hold_seconds": HOLD_SECONDS, "uid": signal_uid,
+        })
+        # монитор держит последний токен цикла и котирует выход в базовый
+        start_monitor(base_symbol, path[-2], entry_sell_units, held_units, source_tag, label, None, signal_uid,
+                      hops)
+        ban_pair(key, "Post-trade cooldown", duration=600)
+
+# ===================== Поиск новых токенов =====================
+DISCOVERY = None
+_discovery_pending = None   # последний топ-N от фонового потока; применяется в начале цикла скана
+
+def _discovery_http_get(url):
+    try:
+        pace_requests()
+        r = requests.get(url, timeout=REQUEST_TIMEOUT)
+        if r.status_code == 200:
+            return r.json()
+        add_dex_issue(f"Discovery: Dexscreener HTTP {r.status_code}")
+    except Exception as e:
+        add_dex_issue(f"Discovery EXC: {repr(e)}")
+    return None
+
+def _discovered_symbol(symbol, addr):
+    """Символ без коллизий с уже известными токенами."""
+    sym = "".join(ch for ch in (symbol or "") if ch.isalnum()) or addr[2:8]
+    known = TOKENS.get(sym)
+    return sym if known is None or known.lower() == addr else f"{sym}_{addr[2:6]}"
+
+def apply_discovered_tokens():
+    """Вызывается из основного цикла (между проходами по TOKENS): добавляет топ-N, убирает выбывшие."""
+    global _discovery_pending
+    if current_chain() is not DISCOVERY_CHAIN:
+        return
+    top, _discovery_pending = _discovery_pending, None
+    if top is None:
+        return
+    with _positions_lock:
+        held = {p["token"] for p in OPEN_POSITIONS.values()}
+    keep = {}
+    for rec in top:
+        addr = rec["address"].lower()
+        if addr in ADDRESS_TO_SYMBOL and ADDRESS_TO_SYMBOL[addr] in STATIC_TOKENS:
+            continue
+        sym = next((s for s, a in DISCOVERED_TOKENS.items() if a == addr), None) or _discovered_symbol(rec["symbol"], addr)
+        keep[sym] = addr
+    added = removed = 0
+    for sym, addr in list(DISCOVERED_TOKENS.items()):
+        if sym not in keep and sym not in held:
+            REGISTRY.remove_token(sym)
+            DISCOVERED_TOKENS.pop(sym, None)
+            removed += 1
+    dec_by_addr = {r["address"].lower(): r["decimals"] for r in top}
+    for sym, addr in keep.items():
+        if sym not in DISCOVERED_TOKENS:
+            REGISTRY.add_token(sym, addr, dec_by_addr[addr])
+            DISCOVERED_TOKENS[sym] = addr
+            added += 1
+    if added or removed:
+        print(f"[DISCOVERY] +{added} -{removed} tokens, discovered total {len(DISCOVERED_TOKENS)}")
+
+def discovery_worker():
+    global _discovery_pending
+    while True:
+        try:
+            if SHARD_INDEX == 0:
+                st = DISCOVERY.refresh()
+                for err in st["errors"]:
+                    add_dex_issue(f"Discovery: {err}")
+                if DEBUG_MODE:
+                    print(f"[DISCOVERY] {st['tokens']} tokens / {st['pairs']} pairs, +{st['new_tokens']} new, "
+                          f"{st['ds_requests']} DS req, {st['decimals']} decimals in {st['sec']:.2f}s")
+            else:
+                DISCOVERY.load()  # индекс ведёт шард 0
+            _discovery_pending = DISCOVERY.top_pairs(DISCOVERY_TOP_N)
+        except Exception as e:
+            print("[DISCOVERY] failed:", repr(e))
+        time.sleep(DISCOVERY_INTERVAL)
+
+def start_discovery():
+    global DISCOVERY
+    if not DISCOVERY_ENABLED or DISCOVERY_CHAIN is None:
+        return
+    w3 = factory = None
+    if DISCOVERY_USE_LOGS:
+        from pipeline_web3 import w3, QUICKSWAP_FACTORY as factory
+    ctx = DISCOVERY_CHAIN
+    anchors = {s: ctx.registry.TOKENS[s] for s in ctx.base_tokens if s in ctx.registry.TOKENS}
+    DISCOVERY = TokenDiscovery(anchors, w3=w3, factory=factory, http_get=_discovery_http_get,
+                               index_path=DISCOVERY_INDEX_PATH, blocks_per_cycle=DISCOVERY_BLOCKS_PER_CYCLE,
+                               ds_batches=DISCOVERY_DS_BATCHES, min_liq_usd=DISCOVERY_MIN_LIQ_USD,
+                               min_vol_usd=DISCOVERY_MIN_VOL_USD, ds_url=DEXSCREENER_TOKEN_URL)
+    threading.Thread(target=bind(ctx, discovery_worker), daemon=True).start()
+
+# ===================== История резервов =====================
+RESERVES = None              # ReserveStore; у шардов, кроме 0, — читатель файлов шарда 0
+RESERVE_INDEXER = None
+RESERVE_CHAIN = chain_by_name("polygon")   # Sync-события пар фабрики QuickSwap
+
+def _resolve_reserve_pairs():
+    """Адреса V2-пар для всех пар скана (индекс общий для шардов); несуществующие пары спрашиваются снова позже."""
+    added = 0
+    factory = pipeline_web3.QUOTER.factory
+    for base_symbol in BASE_TOKENS:
+        for pair in REGISTRY.pairs_for(base_symbol):
+            if RESERVES.pair_for(pair.label) is not None:
+                continue
+            addr = factory.functions.getPair(pair.base_addr_cs, pair.token_addr_cs).call()
+            if int(addr, 16) == 0:
+                continue
+            token0, token1 = sorted((pair.base_addr.lower(), pair.token_addr.lower()))
+            added += RESERVES.add_pair(addr, pair.label, token0, token1)
+    if added:
+        RESERVES.save_meta()
+    return added
+
+def reserve_index_worker():
+    pairs_ts = 0.0
+    while True:
+        try:
+            if SHARD_INDEX == 0:
+                if time.time() - pairs_ts >= RESERVE_PAIRS_INTERVAL:
+                    pairs_ts = time.time()
+                    added = _resolve_reserve_pairs()
+                    if added:
+                        print(f"[RESERVES] +{added} pairs, indexing {len(RESERVES.pairs())}")
+                st = RESERVE_INDEXER.step()
+                if DEBUG_MODE and st["blocks"]:
+                    print(f"[RESERVES] +{st['events']} Sync over {st['blocks']} blocks in {st['sec']:.2f}s, "
+                          f"lag {st['lag']} blocks")
+                if st["blocks"] and st["lag"]:
+                    continue  # бэкфилл: следующий шаг сразу
+            else:
+                RESERVES.refresh()  # индекс ведёт шард 0
+        except Exception as e:
+            add_dex_issue(f"Reserves: {repr(e)}")
+        time.sleep(RESERVE_INDEX_INTERVAL)
+
+def start_reserve_index():
+    global RESERVES, RESERVE_INDEXER
+    if not RESERVE_INDEX_ENABLED or RESERVE_CHAIN is None:
+        return
+    RESERVES = ReserveStore(RESERVE_INDEX_DIR, readonly=SHARD_INDEX != 0)
+    if SHARD_INDEX == 0:
+        RESERVE_INDEXER = SyncIndexer(RESERVES, pipeline_web3.w3, blocks_per_cycle=RESERVE_INDEX_BLOCKS_PER_CYCLE,
+                                      confirmations=RESERVE_INDEX_CONFIRMATIONS,
+                                      backfill_blocks=RESERVE_INDEX_BACKFILL_BLOCKS,
+                                      start_block=int(RESERVE_INDEX_START_BLOCK) if RESERVE_INDEX_START_BLOCK else None)
+    threading.Thread(target=bind(RESERVE_CHAIN, reserve_index_worker), daemon=True).start()
+
+def reserve_features(base_symbol, token_symbol, window=300):
+    """
+    Признаки пула за последние 5 минут по истории резервов: число Sync-событий (сделки/ликвидность)
+    и изменение цены токена в базовом, %. Индекс отстаёт от головы на RESERVE_INDEX_CONFIRMATIONS блоков.
+    """
+    if RESERVES is None or current_chain() is not RESERVE_CHAIN:
+        return {}
+    addr = RESERVES.pair_for(f"{base_symbol}->{token_symbol}")
+    if addr is None:
+        return {}
+    now = time.time()
+    feat = {"pool_syncs_5m": float(len(RESERVES.range(addr, now - window, now)["ts"]))}
+    base_addr = TOKENS[base_symbol]
+    first, last = RESERVES.price(addr, now - window, base_addr), RESERVES.price(addr, now, base_addr)
+    if first and last:
+        feat["pool_chg_5m"] = (last / first - 1.0) * 100.0
+    return feat
+
+# ===================== Профилирование и управление =====================
+def _profile_done(res):
+    """Итог окна профилирования: в лог и в Telegram (топ по собственным сэмплам)."""
+    if res.get("error"):
+        print("[PROFILE] failed:", res["error"])
+        send_telegram(f"🩺 Профилирование не удалось: {res['error']}")
+        return
+    print(f"[PROFILE] {res['samples']} samples / {res['seconds']}s -> {res['collapsed']}")
+    lines = [f"🩺 Профиль{f' шарда {SHARD_INDEX}' if SHARD_COUNT > 1 else ''}: {res['seconds']}с, "
+             f"{res['samples']} сэмплов, накладные {res['overhead_pct']:.2f}%",
+             f"Файлы: {res['collapsed']}, {res['summary']}",
+             "Топ (собственные сэмплы):"]
+    lines += [f"  {n:>6}  {lab}" for lab, n in res["top_self"]]
+    send_telegram("\n".join(lines))
+
+PROFILER = SamplingProfiler(out_dir=PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000.0,
+                            max_seconds=PROFILE_MAX_SECONDS, on_done=_profile_done)
+
+def start_profile(seconds=None, origin=""):
+    ok, msg = PROFILER.start(seconds or PROFILE_DEFAULT_SECONDS, origin)
+    print(f"[PROFILE] {origin}: {msg}")
+    return ok, msg
+
+def install_profile_signal():
+    """kill -USR2 <pid> — окно PROFILE_DEFAULT_SECONDS (обработчик ставится только из главного потока)."""
+    if not hasattr(signal, "SIGUSR2") or threading.current_thread() is not threading.main_thread():
+        return
+    signal.signal(signal.SIGUSR2, lambda signum, frame: start_profile(origin="SIGUSR2"))
+
+def _http_profile(params, body):
+    if params.get("action") == "stop":
+        PROFILER.stop()
+        return 200, {"stopping": PROFILER.running()}
+    if params.get("action") == "status":
+        return 200, PROFILER.status()
+    try:
+        seconds = float(params.get("seconds") or PROFILE_DEFAULT_SECONDS)
+    except ValueError:
+        return 400, {"error": "seconds must be a number"}
+    ok, msg = start_profile(seconds, origin="http")
+    return (200 if ok else 409), {"started": ok, "message": msg, "dir": os.path.abspath(PROFILE_DIR)}
+
+CONTROL = ControlServer(CONTROL_HOST, CONTROL_PORT + SHARD_INDEX, token=CONTROL_TOKEN,
+                        routes={"/profile": _http_profile})
+
+def start_control_server():
+    if CONTROL_PORT <= 0:
+        return
+    try:
+        CONTROL.start()
+        print(f"[CONTROL] listening on http://{CONTROL.host}:{CONTROL.port}")
+    except OSError as e:
+        print("[CONTROL] failed to start:", repr(e))
+
+def _tg_cmd_profile(args):
+    if args and args[0] == "status":
+        st = PROFILER.status()
+        return (f"🩺 Профайлер работает: {st['elapsed']}с, осталось {st['left']}с" if st["running"]
+                else "🩺 Профайлер не запущен")
+    if args and args[0] == "stop":
+        PROFILER.stop()
+        return "🩺 Останавливаю профилирование"
+    try:
+        seconds = float(args[0]) if args else None
+    except ValueError:
+        return "Использование: /profile [секунды|status|stop]"
+    ok, msg = start_profile(seconds, origin="telegram")
+    return f"🩺 {msg}" if ok else f"🩺 Не запущено: {msg}"
+
+TELEGRAM_HANDLERS = {"/profile": _tg_cmd_profile}
+
+def telegram_commands_worker():
+    """Long-poll getUpdates; команды принимаются только из TELEGRAM_CHAT_ID."""
+    offset = None
+    while True:
+        try:
+            params = {"timeout": 25, "allowed_updates": json.dumps(["message"])}
+            if offset is not None:
+                params["offset"] = offset
+            r = requests.get(f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}/getUpdates", params=params, timeout=(5, 35))
+            if r.status_code != 200:
+                print(f"[TG commands] getUpdates HTTP {r.status_code}: {r.text[:150]}")
+                time.sleep(10)
+                continue
+            for upd in r.json().get("result") or []:
+                offset = upd["update_id"] + 1
+                msg = upd.get("message") or {}
+                if str((msg.get("chat") or {}).get("id")) != TELEGRAM_CHAT_ID:
+                    continue
+                parts = (msg.get("text") or "").split()
+                if not parts:
+                    continue
+                handler = TELEGRAM_HANDLERS.get(parts[0].split("@")[0].lower())
+                if handler is not None:
+                    send_telegram(handler(parts[1:]))
+        except Exception as e:
+            print("[TG commands] error:", repr(e))
+            time.sleep(10)
+
+def start_telegram_commands():
+    # getUpdates допускает одного потребителя: команды слушает только шард 0
+    if not TELEGRAM_COMMANDS or not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID or SHARD_INDEX != 0:
+        return
+    threading.Thread(target=telegram_commands_worker, daemon=True).start()
+
+# ===================== Бортовой самописец =====================
+# у каждой сети своё кольцо: id пар — из её реестра (основная — FLIGHT_RECORDER_PATH, прочие — .<сеть>)
+def start_flight_recorder():
+    if not FLIGHT_RECORDER_ENABLED:
+        return
+    for ctx in CHAIN_CONTEXTS:
+        path = FLIGHT_RECORDER_PATH if ctx.primary else f"{FLIGHT_RECORDER_PATH}.{ctx.name}"
+        try:
+            ctx.flight = FlightRecorder(path, FLIGHT_RECORDER_RECORDS)
+            atexit.register(ctx.flight.close)
+            print(f"[FLIGHT] {path}: {FLIGHT_RECORDER_RECORDS} records, continuing at #{ctx.flight.seq}")
+        except Exception as e:
+            ctx.flight = None
+            print(f"[FLIGHT] {path} disabled:", repr(e))
+
+def fr_begin(pair):
+    flight = current_chain().flight
+    if flight is not None:
+        flight.label_pair(pair.id, pair.label)
+    return FlightEvent(pair.id)
+
+def fr_commit(ev, decision):
+    flight = current_chain().flight
+    if flight is not None:
+        try:
+            flight.commit(ev, decision, SHARD_INDEX)
+        except Exception as e:
+            print("[FLIGHT] write error:", repr(e))
+
+# ===================== Быстрая полоса для внешних идей =====================
+_idea_queue = queue.Queue(maxsize=100)
+_ideas_lock = threading.Lock()
+_idea_admitted = deque()          # время приёма идей за последнюю минуту (лимит IDEAS_MAX_PER_MINUTE)
+IDEA_STATS = {"received": 0, "rejected": 0, "entered": 0, "over_budget": 0, "latency_ms": []}
+
+def submit_idea(obj, origin: str):
+    """
+    Ставит идею в быструю полосу без единого запроса к провайдерам.
+    (True, idea); (False, причина) — идея не разобрана; (None, причина) — сверх бюджета или очередь полна.
+    В бюджет минуты идея засчитывается, только если попала в очередь.
+    """
+    try:
+        idea = parse_idea(obj)
+    except ValueError as e:
+        return False, str(e)
+    idea.update(origin=origin, t_recv=time.time(), t0=time.perf_counter(), done=threading.Event(), verdict=None)
+    with _ideas_lock:
+        now = time.time()
+        while _idea_admitted and now - _idea_admitted[0] > 60:
+            _idea_admitted.popleft()
+        if len(_idea_admitted) >= IDEAS_MAX_PER_MINUTE:
+            IDEA_STATS["over_budget"] += 1
+            return None, f"over budget ({IDEAS_MAX_PER_MINUTE}/min)"
+        try:
+            _idea_queue.put_nowait(idea)
+        except queue.Full:
+            return None, "queue full"
+        _idea_admitted.append(now)
+        IDEA_STATS["received"] += 1
+    return True, idea
+
+def _resolve_symbol(name):
+    """Символ или адрес токена -> символ из TOKENS (регистр символа не важен)."""
+    if not name:
+        return None
+    if name.lower().startswith("0x"):
+        return ADDRESS_TO_SYMBOL.get(name.lower())
+    if name in TOKENS:
+        return name
+    return next((s for s in TOKENS if s.lower() == name.lower()), None)
+
+def evaluate_idea(idea) -> dict:
+    """Котировка круга -> свежие индикаторы DS -> ML; при прохождении всех порогов — вход как у сигнала скана."""
+    stages = {"queue": (time.perf_counter() - idea["t0"]) * 1000.0}
+    verdict = {"id": idea["id"], "source": idea["source"], "origin": idea["origin"], "decision": "reject",
+               "reasons": [], "stages_ms": stages}
+    ctx = current_chain()
+    verdict["chain"] = ctx.name
+    base = _resolve_symbol(idea["base"] or BASE_TOKENS[0])
+    token = _resolve_symbol(idea["token"])
+    pair = REGISTRY.pair(base, token) if base and token and base != token else None
+    if pair is None:
+        verdict["reasons"].append(f"unknown pair {idea['base'] or BASE_TOKENS[0]}->{idea['token']}")
+        return verdict
+    verdict["pair"] = pair.route_label
+    ev = fr_begin(pair)
+    ev.entry = pair.entry_units
+    with _positions_lock:
+        held = any(p["base"] == base and p["token"] == token and p.get("chain", ctx.name) == ctx.name
+                   for p in OPEN_POSITIONS.values())
+    if held:
+        verdict["reasons"].append("position already open")
+        fr_commit(ev, FR["claimed_elsewhere"])
+        return verdict
+    # прочие баны (низкая прибыль, DS, ML) идея обходит — у неё свежие данные, но не пост-охлаждение после входа
+    ban = pair_ban_left(pair.key)
+    if ban and ban[0] == "Post-trade cooldown":
+        verdict["reasons"].append(f"post-trade cooldown ({ban[1]}s left)")
+        fr_commit(ev, FR["banned"])
+        return verdict
+
+    t = time.perf_counter()
+    q_in, q_out, reasons = quote_round_trip(base, token, pair.entry_units)
+    ev.lat_quote = time.perf_counter() - t
+    stages["quote"] = ev.lat_quote * 1000.0
+    ev.src_in = q_in.get("source") if q_in else None
+    ev.src_out = q_out.get("source") if q_out else None
+    try:
+        buy_units, exit_units = int(q_in["buyAmount"]), int(q_out["buyAmount"])
+    except Exception:
+        verdict["reasons"] += ["no round-trip quote"] + reasons[:3]
+        fr_commit(ev, FR["no_quote"])
+        return verdict
+    ev.stage, ev.buy, ev.exit = FR_STAGE["quoted"], buy_units, exit_units
+    exp_pnl = profit_pct_by_units(pair.entry_units, exit_units)
+    net_profit = adjust_for_fees_pct(exp_pnl)
+    ev.exp_pnl, ev.net_pnl = exp_pnl, net_profit
+
+    # индикаторы — свежим запросом (снимок цикла мог устареть на целый проход)
+    t = time.perf_counter()
+    ds_ok, ds_reason, ds_feat = ds_check_single(pair.key, pair.token_addr)
+    ev.lat_ds, ev.ds = time.perf_counter() - t, ds_feat
+    stages["ds"] = ev.lat_ds * 1000.0
+
+    t = time.perf_counter()
+    feat = build_signal_features(exp_pnl, net_profit, pair.entry_units, buy_units, exit_units, ds_feat,
+                                 reserve_features(pair.base, pair.token))
+    prob = model_predict_proba(feat)
+    ev.prob = prob
+    stages["ml"] = (time.perf_counter() - t) * 1000.0
+    threshold = float(os.getenv("ALERT_PROB_THRESHOLD", "0.5"))
+
+    verdict.update(exp_pnl=exp_pnl, net_pnl=net_profit, prob=prob, ds=ds_reason, quote_source=q_in.get("source"))
+    checks = ((exp_pnl >= MIN_PROFIT_PERCENT, f"profit {exp_pnl:.2f}% < {MIN_PROFIT_PERCENT}%", "low_profit"),
+              (ds_ok is not False, ds_reason, "ds_fail"),
+              (net_profit >= MIN_PROFIT_PERCENT, f"net {net_profit:.2f}% < {MIN_PROFIT_PERCENT}%", "low_net"),
+              (prob is None or prob >= threshold, f"ML prob {prob or 0:.3f} < {threshold}", "ml_filtered"))
+    failed = [(why, dec) for ok, why, dec in checks if not ok]
+    if failed:
+        verdict["reasons"] += [why for why, _ in failed]
+        fr_commit(ev, FR[failed[0][1]])
+        return verdict
+    ev.stage = FR_STAGE["ml_ok"]
+    if not claim_signal(pair.key):
+        verdict["reasons"].append("already signalled (claimed)")
+        fr_commit(ev, FR["claimed_elsewhere"])
+        return verdict
+
+    verdict["decision"] = "enter"
+    ev.stage = FR_STAGE["signalled"]
+    fr_commit(ev, FR["signal"])
+    inc_signal()
+    source_tag = f"idea:{idea['source']} / {q_in.get('source', 'unknown')}"
+    signal_uid = new_signal_uid()
+    enqueue_signal_record({
+        "ts": now_local(), "base": base, "token": token, "source": source_tag,
+        "exp_pnl": exp_pnl, "net_pnl": net_profit, "features": feat,
+        "predicted_prob": float(prob) if prob is not None else None,
+        "entry_sell_units": pair.entry_units, "buy_amount_token_units": buy_units,
+        "exit_units_est": exit_units, "outcome": -1, "hold_seconds": HOLD_SECONDS, "uid": signal_uid,
+    })
+    start_monitor(base, token, pair.entry_units, buy_units, source_tag, None, None, signal_uid)
+    ban_pair(pair.key, "Post-trade cooldown", duration=600)
+    return verdict
+
+def _idea_message(idea, v) -> str:
+    head = "⚡ Идея: ВХОД" if v["decision"] == "enter" else "⚡ Идея: отказ"
+    lines = [head, f"PAIR: {v.get('pair') or idea['token']}", f"Источник идеи: {idea['source']} ({idea['origin']})"]
+    if MULTI_CHAIN and v.get("chain"):
+        lines.append(f"Сеть: {v['chain']}")
+    if idea.get("profit_range"):
+        lines.append(f"Заявлено: {idea['profit_range']}%")
+    if v.get("exp_pnl") is not None:
+        lines.append(f"Ожидаемый PnL: {v['exp_pnl']:.2f}% raw / {v['net_pnl']:.2f}% net ({v.get('quote_source')})")
+    if v.get("prob") is not None:
+        lines.append(f"ML: {v['prob']:.3f}")
+    if v["reasons"]:
+        lines.append("Причины: " + "; ".join(str(r) for r in v["reasons"][:5]))
+    st = v["stages_ms"]
+    lines.append(f"Вердикт за {v['latency_ms']:.0f} мс (очередь {st.get('queue', 0):.0f}, котировка {st.get('quote', 0):.0f}, "
+                 f"DS {st.get('ds', 0):.0f}, ML {st.get('ml', 0):.0f})")
+    if v.get("age_s") is not None:
+        lines.append(f"С момента получения у источника: {v['age_s']:.0f} с")
+    lines.append(f"Время: {now_local()}")
+    return "\n".join(lines)
+
+def idea_worker():
+    _pace_local.lane = "ideas"   # все запросы этого потока — из бюджета IDEAS_RPS
+    while True:
+        idea = _idea_queue.get()
+        ctx = chain_by_name(idea["chain"]) if idea["chain"] else PRIMARY_CHAIN
+        try:
+            if ctx is None:
+                v = {"id": idea["id"], "decision": "reject", "reasons": [f"unknown chain {idea['chain']!r}"],
+                     "stages_ms": {}}
+            else:
+                with use_chain(ctx):
+                    v = evaluate_idea(idea)
+        except Exception as e:
+            v = {"id": idea["id"], "decision": "reject", "reasons": [f"error: {repr(e)}"], "stages_ms": {}}
+        v["latency_ms"] = (time.perf_counter() - idea["t0"]) * 1000.0
+        v["age_s"] = time.time() - idea["received"] if idea.get("received") else None
+        with _ideas_lock:
+            IDEA_STATS["entered" if v["decision"] == "enter" else "rejected"] += 1
+            IDEA_STATS["latency_ms"].append(v["latency_ms"])
+        print(f"[IDEA] {v['id']} {v.get('pair', idea['token'])}: {v['decision']} in {v['latency_ms']:.0f} ms "
+              f"{'; '.join(str(r) for r in v['reasons'][:3])}")
+        idea["verdict"] = v
+        idea["done"].set()
+        send_telegram(_idea_message(idea, v))
+
+def ideas_file_worker():
+    tail = JsonlTail(IDEAS_QUEUE_PATH)
+    while True:
+        try:
+            for obj, raw in tail.poll():
+                for item in (obj if isinstance(obj, list) else [obj]):
+                    ok, res = submit_idea(item, "file") if item is not None else (False, "not JSON")
+                    if not ok:
+                        print(f"[IDEA] {IDEAS_QUEUE_PATH}: rejected {raw[:120]!r}: {res}")
+        except Exception as e:
+            print("[IDEA] watch error:", repr(e))
+        time.sleep(0.5)
+
+def _http_idea(params, body):
+    if not IDEAS_ENABLED:
+        return 503, {"error": "ideas disabled"}
+    try:
+        obj = json.loads(body) if body.strip() else {k: v for k, v in params.items()
+                                                     if k in ("pair", "base", "token", "source", "chain")}
+    except ValueError:
+        return 400, {"error": "body must be JSON"}
+    items = obj if isinstance(obj, list) else [obj]
+    out, busy = [], False
+    for item in items:
+        ok, res = submit_idea(item, "http")
+        busy |= ok is None
+        out.append({"accepted": True, "id": res["id"]} if ok else {"accepted": False, "error": res})
+    if params.get("wait") and len(items) == 1 and out[0]["accepted"]:
+        idea = res
+        if idea["done"].wait(IDEAS_HTTP_WAIT):
+            return 200, idea["verdict"]
+        return 202, {"id": idea["id"], "pending": True}
+    # 429 — только сверх бюджета / очередь полна (повтор позже поможет); ошибки разбора — 400
+    return (202 if any(o["accepted"] for o in out) else 429 if busy else 400), {"ideas": out}
+
+def _tg_cmd_idea(args):
+    if not args:
+        return "Использование: /idea USDT->LINK [источник]"
+    ok, res = submit_idea({"pair": args[0], "source": " ".join(args[1:]) or "telegram"}, "telegram")
+    return f"⚡ Идея принята ({res['id']}), проверяю" if ok else f"⚡ Идея отклонена: {res}"
+
+CONTROL.route("/idea", _http_idea)
+TELEGRAM_HANDLERS["/idea"] = _tg_cmd_idea
+
+def start_ideas():
+    if not IDEAS_ENABLED:
+        return
+    threading.Thread(target=idea_worker, daemon=True).start()
+    # файл-очередь читает один шард: вход по идее защищён claim_signal, но дубли ни к чему
+    if IDEAS_QUEUE_PATH and SHARD_INDEX == 0:
+        threading.Thread(target=ideas_file_worker, daemon=True).start()
+
 # ===================== Основной цикл =====================
-def strategy_loop():
+def strategy_loop(restore_info: str = ""):
+    """Цикл скана сети текущего контекста; отчёт и пульс шарда ведёт только основная сеть."""
     global last_report_time
-    reset_cycle_stats()
-    send_telegram(f"🚀 Бот запущен {now_local()}\n"
-                  f"Источники: 1inch={'ON' if ONEINCH_API_KEY else 'OFF'}, UniswapGraph={'ON' if GRAPH_API_KEY else 'OFF'}, Dexscreener=ON\n"
-                  f"Параметры: MIN_PROFIT={MIN_PROFIT_PERCENT}%, STOP_LOSS={STOP_LOSS_PERCENT}%, HOLD={HOLD_SECONDS}s, REPORT={REPORT_INTERVAL}s")
+    ctx = current_chain()
+    if ctx.primary:
+        reset_cycle_stats()
+    if ctx.primary and SHARD_INDEX == 0:
+        send_telegram(f"🚀 Бот запущен {now_local()}\n"
+                      f"Источники: 1inch={'ON' if ONEINCH_API_KEY else 'OFF'}, UniswapGraph={'ON' if GRAPH_API_KEY else 'OFF'}, Dexscreener=ON\n"
+                      f"Параметры: MIN_PROFIT={MIN_PROFIT_PERCENT}%, STOP_LOSS={STOP_LOSS_PERCENT}%, HOLD={HOLD_SECONDS}s, REPORT={REPORT_INTERVAL}s"
+                      + (f"\nШарды: {SHARD_COUNT}" if SHARD_COUNT > 1 else "")
+                      + (f"\nСети: {', '.join(f'{c.name} ({len(c.registry.TOKENS)} токенов)' for c in CHAIN_CONTEXTS)}"
+                         if MULTI_CHAIN else "")
+                      + (f"\n{restore_info}" if restore_info else ""))
 
     while True:
         loop_start = time.time()
+        n_pairs = 0
         clean_ban_list()
+        apply_discovered_tokens()
+
+        # стадия 0: индикаторы Dexscreener для всех токенов шарда одним снимком
+        ds_verdict = None
+        if DS_PREGATE_ENABLED:
+            my_tokens = {addr for sym, addr in TOKENS.items()
+                         if any(sym != b and is_my_pair((b, sym)) for b in BASE_TOKENS if b in TOKENS)}
+            try:
+                ds_verdict = ds_pregate_cycle(my_tokens)
+            except Exception as e:
+                add_dex_issue(f"DS pregate EXC: {repr(e)}")
 
         for base_symbol in BASE_TOKENS:
             if base_symbol not in TOKENS:
                 add_skip("Base token not in TOKENS", base_symbol)
                 continue
-            base_addr = TOKENS[base_symbol].lower()
             base_dec  = DECIMALS.get(base_symbol, 6)
-            entry_sell_units = int(SELL_AMOUNT_USD * (10 ** base_dec))
 
-            for token_symbol, token_addr in TOKENS.items():
-                if token_symbol == base_symbol:
-                    continue
-                key = (base_symbol, token_symbol)
+            # статические данные пар (адреса, units входа, подписи) посчитаны реестром заранее
+            for pair in REGISTRY.pairs_for(base_symbol):
+                if not is_my_pair_id(pair):
+                    continue  # пара другого шарда
+                n_pairs += 1
+                token_symbol, token_addr, key = pair.token, pair.token_addr, pair.key
+                entry_sell_units = pair.entry_units
                 inc_checked()
+                ev = fr_begin(pair)
+                ev.entry = entry_sell_units
 
                 # бан-лист
-                if key in ban_list:
-                    left = int(ban_list[key]["duration"] - (time.time()-ban_list[key]["time"]))
-                    if left > 0:
-                        add_skip(f"Banned ({ban_list[key]['reason']}, left {left}s)", f"{base_symbol}->{token_symbol}")
+                banned = pair_ban_left(key)
+                if banned:
+                    add_skip(f"Banned ({banned[0]}, left {banned[1]}s)", pair.label)
+                    fr_commit(ev, FR["banned"])
+                    continue
+                inc_stage("pairs")
+                ev.stage = FR_STAGE["ban_ok"]
+
+                # предфильтр: индикаторы DS проверены векторно по снимку цикла — до платных котировок
+                # (ok None — пачка ответила, но пар токена нет: как и при одиночном запросе, без индикаторов)
+                pre = ds_verdict.get(token_addr) if ds_verdict is not None else None
+                if pre is not None and pre[0] is not None:
+                    ds_ok, ds_reason, ds_feat, best_ds_pair = pre[0], pre[1], dict(pre[2]), pre[3]
+                    # история снимков пары -> производные признаки (d_price, dd_price, ...)
+                    try:
+                        push_pair_snapshot(key, best_ds_pair.price_usd or 0.0, ds_feat.get("vol_m5", 0.0),
+                                           ds_feat.get("buys", 0), ds_feat.get("sells", 0))
+                        ds_feat.update(compute_derivatives(key))
+                    except Exception:
+                        pass
+                    ev.ds = ds_feat
+                    if not ds_ok:
+                        inc_stage("pregate_rejected")
+                        add_skip(ds_reason, pair.label)
+                        ban_pair(key, 'DS indicators fail', duration=60)
+                        fr_commit(ev, FR["ds_fail"])
                         continue
-                    else:
-                        ban_list.pop(key, None)
-
-                # Получаем цену входа base->token
-                q_in, reasons = quote_amount_out(base_symbol, token_symbol, entry_sell_units)
+                    ev.stage = FR_STAGE["ds_ok"]
+
+                # Круг base->token->base: одним запросом, где источник умеет, иначе двумя ногами
+                t_q = time.perf_counter()
+                q_in, q_out, reasons = quote_round_trip(base_symbol, token_symbol, entry_sell_units)
+                ev.lat_quote = time.perf_counter() - t_q
+                ev.src_in = q_in.get("source") if q_in else None
+                ev.src_out = q_out.get("source") if q_out else None
                 if not q_in or not q_in.get("buyAmount"):
-                    add_skip("No quote", f"{base_symbol}->{token_symbol}")
+                    add_skip("No quote", pair.label)
                     for rs in reasons:
-                        add_skip(f"Cause {base_symbol}->{token_symbol}", rs)
+                        add_skip(f"Cause {pair.label}", rs)
                     # мягкий бан на короткое время, чтобы не ддосить
                     ban_pair(key, "No quote", duration=60)
+                    fr_commit(ev, FR["no_quote"])
                     continue
 
                 source_tag = q_in.get("source", "unknown")
                 try:
                     buy_amount_token_units = int(q_in["buyAmount"])
                 except Exception:
-                    add_skip("Invalid buyAmount", f"{base_symbol}->{token_symbol}")
+                    add_skip("Invalid buyAmount", pair.label)
                     ban_pair(key, "Invalid buyAmount", duration=300)
+                    fr_commit(ev, FR["bad_quote"])
                     continue
+                ev.buy = buy_amount_token_units
                 if buy_amount_token_units <= 0:
-                    add_skip("Zero buy", f"{base_symbol}->{token_symbol}")
+                    add_skip("Zero buy", pair.label)
                     ban_pair(key, "Zero buy", duration=120)
+                    fr_commit(ev, FR["bad_quote"])
                     continue
 
                 # Выходная оценка token->base для расчёта ожидаемого PnL
-                q_out, reasons_out = quote_amount_out(token_symbol, base_symbol, buy_amount_token_units)
                 if not q_out or not q_out.get("buyAmount"):
-                    add_skip("No quote (exit)", f"{token_symbol}->{base_symbol}")
-                    for rs in reasons_out:
-                        add_skip(f"Cause {token_symbol}->{base_symbol}", rs)
+                    add_skip("No quote (exit)", pair.exit_label)
+                    for rs in reasons:
+                        add_skip(f"Cause {pair.exit_label}", rs)
                     ban_pair(key, "No exit quote", duration=60)
+                    fr_commit(ev, FR["no_exit_quote"])
                     continue
                 try:
                     exit_units_est = int(q_out["buyAmount"])
                 except Exception:
-                    add_skip("Invalid exit buyAmount", f"{token_symbol}->{base_symbol}")
+                    add_skip("Invalid exit buyAmount", pair.exit_label)
                     ban_pair(key, "Invalid exit buyAmount", duration=300)
+                    fr_commit(ev, FR["bad_quote"])
                     continue
 
+                inc_stage("quoted")
+                ev.stage, ev.exit = FR_STAGE["quoted"], exit_units_est
+
                 # ожидаемый PnL
                 exp_pnl = profit_pct_by_units(entry_sell_units, exit_units_est)
                 if exp_pnl is None:
-                    add_skip("Profit calc error", f"{base_symbol}->{token_symbol}")
+                    add_skip("Profit calc error", pair.label)
+                    fr_commit(ev, FR["error"])
                     continue
+                ev.exp_pnl = exp_pnl
 
                 # фильтр по минимальной прибыли
                 if exp_pnl < MIN_PROFIT_PERCENT:
                     add_skip(f"Low profit < {MIN_PROFIT_PERCENT}%", f"{base_symbol}->{token_symbol} ({exp_pnl:.2f}%)")
+                    fr_commit(ev, FR["low_profit"])
                     continue
+                inc_stage("profit_pass")
+                ev.stage = FR_STAGE["profit_ok"]
 
                 # --- Dexscreener indicators & net-profit calculation ---
-                try:
-                    token_addr = TOKENS.get(token_symbol) if 'token_symbol' in locals() else None
-                    best_ds_pair = None
-                    if token_addr:
-                        try:
-                            ds_raw = dxs_fetch(token_addr)  # у тебя есть dxs_fetch в коде
-                        except Exception:
-                            ds_raw = None
-                        if ds_raw and isinstance(ds_raw.get('pairs'), list) and len(ds_raw.get('pairs')) > 0:
-                            best_ds_pair = max(ds_raw['pairs'], key=lambda p: ((p.get('liquidity') or {}).get('usd', 0) or 0))
-                except Exception:
-                    best_ds_pair = None
-
-                if best_ds_pair:
-                    ds_ok, ds_reason, ds_feat = evaluate_trade_signal_from_ds_pair(best_ds_pair)
-                    if not ds_ok:
-                        add_skip(ds_reason, f"{base_symbol}->{token_symbol}")
+                # (если пачка предфильтра ответила — ds_feat готов, повторный запрос не нужен;
+                #  одиночный запрос — только для токенов, чья пачка не получила ответа)
+                if pre is not None and pre[0] is None:
+                    ds_feat = {}
+                elif pre is None:
+                    t_ds = time.perf_counter()
+                    ds_ok, ds_reason, ds_feat = ds_check_single(key, token_addr)
+                    ev.lat_ds, ev.ds = time.perf_counter() - t_ds, ds_feat
+                    if ds_ok is False:
+                        add_skip(ds_reason, pair.label)
                         ban_pair((base_symbol, token_symbol), 'DS indicators fail', duration=60)
+                        fr_commit(ev, FR["ds_fail"])
                         continue
-                else:
-                    ds_ok, ds_reason, ds_feat = False, 'No Dexscreener data', {}
 
                 # compute net profit after fees/slippage
                 net_profit = adjust_for_fees_pct(exp_pnl)
+                ev.net_pnl = net_profit
                 if net_profit < MIN_PROFIT_PERCENT:
-                    add_skip(f"Low net profit {net_profit:.2f}%", f"{base_symbol}->{token_symbol}")
+                    add_skip(f"Low net profit {net_profit:.2f}%", pair.label)
+                    fr_commit(ev, FR["low_net"])
                     continue
+                inc_stage("net_pass")
+                ev.stage = FR_STAGE["net_ok"]
                 # --- end inserted block ---
 
                 # ----------------- ML filter (insert here) -----------------
                 # Собираем словарь признаков в том же формате, что использовали при обучении
-                try:
-                    feat = {
-                        "exp_pnl": float(exp_pnl or 0.0),
-                        "net_pnl": float(net_profit or 0.0),
-                        "entry_sell_units": int(entry_sell_units or 0),
-                        "buy_amount_token_units": int(buy_amount_token_units or 0),
-                        "exit_units_est": int(exit_units_est or 0),
-                        "hold_seconds": int(HOLD_SECONDS or 0),
-                        # доп. признаки из ds_feat (если есть)
-                        "liquidity_usd": float(ds_feat.get("liquidity_usd", 0.0)),
-                        "buys": float(ds_feat.get("buys", 0.0)),
-                        "sells": float(ds_feat.get("sells", 0.0)),
-                        "vol_m5": float(ds_feat.get("vol_m5", 0.0)),
-                        "avg_m5": float(ds_feat.get("avg_m5", 0.0)),
-                        "momentum_m5": float(ds_feat.get("momentum_m5", 0.0)),
-                    }
-                    # возможно, некоторые производные признаки тоже есть в ds_feat
-                    for k in ("d_price","dd_price","d_vol","d_buys","vol_rel_change"):
-                        if k in ds_feat:
-                            feat[k] = float(ds_feat.get(k) or 0.0)
-                except Exception:
-                    feat = {}
+                feat = build_signal_features(exp_pnl, net_profit, entry_sell_units, buy_amount_token_units,
+                                             exit_units_est, ds_feat, reserve_features(base_symbol, token_symbol))
 
                 # порог вероятности — можно переопределить через env (default 0.5)
                 ALERT_PROB_THRESHOLD = float(os.getenv("ALERT_PROB_THRESHOLD", "0.5"))
 
                 # если модель загружена — используем её
+                prob = None
                 try:
                     prob = model_predict_proba(feat)
+                    ev.prob = prob
                     if prob is None:
                         # модель не загружена или ошибка — позволяем сигнал (поведение по умолчанию)
                         pass
                     else:
                         # если вероятность мала — пропускаем сигнал
                         if float(prob) < ALERT_PROB_THRESHOLD:
-                            add_skip(f"ML filter (prob {prob:.3f} < {ALERT_PROB_THRESHOLD})", f"{base_symbol}->{token_symbol}")
+                            add_skip(f"ML filter (prob {prob:.3f} < {ALERT_PROB_THRESHOLD})", pair.label)
                             ban_pair(key, "ML filtered", duration=120)
+                            fr_commit(ev, FR["ml_filtered"])
                             continue
                         else:
                             # можно добавить лог или метрику
@@ -961,11 +2320,37 @@ def strategy_loop():
                     if DEBUG_MODE:
                         print("[ML ERROR]", repr(e))
                 # ----------------- end ML filter -----------------
+                ev.stage = FR_STAGE["ml_ok"]
+
+                # ===== Оптимальный объём входа =====
+                # по одной паре: сигнал уходит сразу, пока котировки входа свежие (сам расчёт — микросекунды)
+                opt_size_usd, opt_pnl_usd, opt_pnl_pct = None, 0.0, 0.0
+                if SIZE_OPT_ENABLED:
+                    try:
+                        cand = {
+                            "entry_sell_units": entry_sell_units, "exit_units_est": exit_units_est,
+                            "base_dec": base_dec, "liquidity_usd": ds_feat.get("liquidity_usd"),
+                        }
+                        if SIZE_PROBE_MULT > 0:
+                            probe_units = int(entry_sell_units * SIZE_PROBE_MULT)
+                            cand["probe_ratio"] = probe_round_trip_ratio(base_symbol, token_symbol, probe_units)
+                            cand["probe_size_usd"] = probe_units / (10 ** base_dec)
+                        opt_size_usd, opt_pnl_usd, opt_pnl_pct = optimal_sizes_for([cand])[0]
+                    except Exception as e:
+                        if DEBUG_MODE:
+                            print("[SIZE OPT ERROR]", repr(e))
               
                 # ===== Предварительное сообщение о сделке =====
+                if not claim_signal(key):
+                    add_skip("Already signalled (claimed)", pair.label)
+                    fr_commit(ev, FR["claimed_elsewhere"])
+                    continue
                 inc_signal()
+                ev.stage = FR_STAGE["signalled"]
+                fr_commit(ev, FR["signal"])
                 send_telegram(
                     f"📣 Предварительный сигнал\n"
+                    + chain_line() +
                     f"PAIR: {base_symbol}->{token_symbol}->{base_symbol}\n"
                     f"Источник входа: {source_tag}\n"
                     f"Ожидаемый PnL (raw): {exp_pnl:.2f}%\n"
@@ -974,20 +2359,64 @@ def strategy_loop():
                     f"OrderFlow m5: buys={int(ds_feat.get('buys',0))}, sells={int(ds_feat.get('sells',0))}\n"
                     f"Volume m5: {ds_feat.get('vol_m5',0):.0f} vs avg5: {ds_feat.get('avg_m5',0):.0f}\n"
                     f"Momentum m5: {ds_feat.get('momentum_m5',0.0):.2f}%\n"
-                    f"План: удержание ~{HOLD_SECONDS//60}-{(HOLD_SECONDS//60)+3} мин, цель {MIN_PROFIT_PERCENT:.2f}%, стоп {STOP_LOSS_PERCENT:.2f}%\n"
+                    + (f"Оптимальный объём: ~{opt_size_usd:,.0f} {base_symbol}, ожидаемо {opt_pnl_usd:+.2f} {base_symbol} ({opt_pnl_pct:.2f}% net)\n"
+                       if opt_size_usd else "")
+                    + f"План: удержание ~{HOLD_SECONDS//60}-{(HOLD_SECONDS//60)+3} мин, цель {MIN_PROFIT_PERCENT:.2f}%, стоп {STOP_LOSS_PERCENT:.2f}%\n"
                     f"Время: {now_local()}"
                 )
 
-                # старт мониторинга (финальное сообщение будет из монитор-потока)
-                start_monitor(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units, source_tag)
+                signal_uid = new_signal_uid()
+                enqueue_signal_record({
+                    "ts": now_local(), "base": base_symbol, "token": token_symbol, "source": source_tag,
+                    "exp_pnl": exp_pnl, "net_pnl": net_profit, "features": feat,
+                    "predicted_prob": float(prob) if prob is not None else None,
+                    "entry_sell_units": entry_sell_units, "buy_amount_token_units": buy_amount_token_units,
+                    "exit_units_est": exit_units_est, "outcome": -1, "hold_seconds": HOLD_SECONDS,
+                    "opt_size_usd": opt_size_usd, "opt_pnl_usd": opt_pnl_usd, "uid": signal_uid,
+                })
+
+                # старт мониторинга (финальное сообщение и результат в signals.db — из монитор-потока)
+                start_monitor(base_symbol, token_symbol, entry_sell_units, buy_amount_token_units, source_tag,
+                              None, None, signal_uid)
 
                 # пост-охлаждение на пару, чтобы не спамить повторы
                 ban_pair(key, "Post-trade cooldown", duration=600)
 
+        # ===== Многошаговые циклы по графу курсов =====
+        if ROUTE_ENABLED:
+            process_route_cycles()
+
+        # ===== Счётчики сети =====
+        with stats_lock:
+            ctx.totals["cycles"] += 1
+            ctx.totals["last_cycle_sec"] = time.time() - loop_start
+            ctx.totals["pairs"] = n_pairs
+        if not ctx.primary:
+            time.sleep(0.5)
+            continue
+
+        # ===== Пульс шарда =====
+        _shard_totals["cycles"] += 1
+        if COORD is not None:
+            try:
+                COORD.heartbeat(SHARD_INDEX, _shard_totals["cycles"], _shard_totals["checked"],
+                                _shard_totals["signals"], time.time() - loop_start, len(watched_pair_addrs()))
+                if SHARD_INDEX == 0:
+                    COORD.purge_expired()
+            except Exception as e:
+                print("[COORD heartbeat error]", repr(e))
+
         # ===== Периодический отчёт =====
         now_ts = time.time()
+        if now_ts - last_report_time >= REPORT_INTERVAL and SHARD_INDEX != 0:
+            # отчёт шлёт только шард 0 (по общей таблице), остальные лишь сбрасывают период
+            reset_cycle_stats()
+            last_report_time = now_ts
         if now_ts - last_report_time >= REPORT_INTERVAL:
             copy_ban_for_report()
+            if COORD is not None:
+                with stats_lock:
+                    stats_snapshot["ban_details"] = {tuple(k.split("->")): v for k, v in COORD.active_bans().items()}
             with stats_lock:
                 checked = stats_snapshot["checked"]
                 signals = stats_snapshot["signals"]
@@ -1003,9 +2432,70 @@ def strategy_loop():
                 lines.append("Бан-лист детали:")
                 for pair, info in ban_det.items():
                     left = max(0, int(info["duration"] - (now_ts - info["time"])))
-                    lines.append(f"  - {pair[0]} -> {pair[1]}: причина - {info['reason']}, осталось: {left}s")
+                    lines.append(f"  - {' -> '.join(pair)}: причина - {info['reason']}, осталось: {left}s")
             lines.append(f"✔️ Успешных сигналов за период: {signals}")
             lines.append(f"🔍 Всего проверено пар: {checked}")
+            if COORD is not None:
+                lines.append("🧩 Шарды (циклов/мин, пар, посл. цикл, отставание):")
+                for st in COORD.shard_stats():
+                    lag = now_ts - (st["ts"] or 0)
+                    cpm = st["cycles"] / max(1e-9, (now_ts - _process_started) / 60.0)
+                    lines.append(f"  - #{st['shard']} pid={st['pid']}: {cpm:.1f}/мин, {st['pairs']} пар, "
+                                 f"{st['last_cycle_sec']:.1f}с, lag {lag:.0f}с, проверено {st['checked']}, сигналов {st['signals']}")
+            if ROUTE_ENABLED:
+                nodes, edges = ROUTE_GRAPH.size()
+                lines.append(f"🕸 Граф маршрутов: {nodes} токенов, {edges} рёбер")
+            if MULTI_CHAIN:
+                lines.append("⛓ Сети (циклов/мин, пар, посл. цикл, проверено, сигналов за период):")
+                for c in CHAIN_CONTEXTS:
+                    with stats_lock:
+                        tot, prev = dict(c.totals), c.reported
+                        c.reported = dict(tot, ts=now_ts)
+                    minutes = max(1e-9, (now_ts - prev.get("ts", _process_started)) / 60.0)
+                    lines.append(f"  - {c.name} (chain {c.chain_id}): {(tot['cycles'] - prev['cycles']) / minutes:.1f}/мин, "
+                                 f"{tot['pairs']} пар, {tot['last_cycle_sec']:.1f}с, "
+                                 f"проверено {tot['checked'] - prev['checked']}, сигналов {tot['signals'] - prev['signals']}"
+                                 + (f", граф {c.route_graph.size()[1]} рёбер" if ROUTE_ENABLED else ""))
+            with stats_lock:
+                ps = dict(PIPELINE_STATS)
+            if ps.get("pairs"):
+                lines.append("🪜 Стадии: пар {pairs} → DS-фильтр {left} → котировки {quoted} → PnL {profit_pass} → net {net_pass}".format(
+                    left=ps["pairs"] - ps["pregate_rejected"], **ps))
+                if ps.get("ds_tokens"):
+                    lines.append(f"   DS-снимок: {ps['ds_tokens']} токенов за {ps['ds_requests']} запросов; "
+                                 f"с данными {ps['tokens_ds_data']} → liq {ps['tokens_ds_liquidity']} → "
+                                 f"orderflow {ps['tokens_ds_orderflow']} → объём {ps['tokens_ds_volume_spike']} → "
+                                 f"momentum {ps['tokens_ds_momentum']}")
+                    # без предфильтра: круговая котировка на каждую отсеянную пару (≥2 запроса)
+                    # и отдельный запрос DS на каждый токен
+                    lines.append(f"   Сэкономлено: ~{2 * ps['pregate_rejected']} запросов котировок, "
+                                 f"{max(0, ps['ds_tokens'] - ps['ds_requests'])} запросов Dexscreener")
+            if DISCOVERY is not None:
+                ds = DISCOVERY.last_stats
+                lines.append(f"🧭 Discovery: в индексе {ds.get('tokens', 0)} токенов / {ds.get('pairs', 0)} пар, "
+                             f"в скане {len(DISCOVERED_TOKENS)} найденных")
+            if RESERVE_INDEXER is not None:
+                rs = RESERVE_INDEXER.last_stats
+                lines.append(f"📚 Резервы: {rs.get('pairs', 0)} пар в индексе, "
+                             f"отставание {rs.get('lag', 0)} блоков")
+            if ROUND_TRIP_STATS["single"] or ROUND_TRIP_STATS["two_leg"]:
+                lines.append(f"🔄 Круговые котировки: одним запросом {ROUND_TRIP_STATS['single']}, "
+                             f"двумя ногами {ROUND_TRIP_STATS['two_leg']}")
+                ROUND_TRIP_STATS["single"] = ROUND_TRIP_STATS["two_leg"] = 0
+            with _ideas_lock:
+                ist = dict(IDEA_STATS)
+                IDEA_STATS.update(received=0, rejected=0, entered=0, over_budget=0, latency_ms=[])
+            if ist["received"] or ist["over_budget"]:
+                lat = sorted(ist["latency_ms"])
+                lines.append(f"⚡ Идеи: получено {ist['received']}, вход {ist['entered']}, отказ {ist['rejected']}, "
+                             f"сверх бюджета {ist['over_budget']}"
+                             + (f"; до вердикта p50 {lat[len(lat) // 2]:.0f} мс, max {lat[-1]:.0f} мс" if lat else ""))
+            sf = [sfg.stats() for sfg in SINGLE_FLIGHTS]
+            if any(st["calls"] for st in sf):
+                lines.append("🔁 Single-flight (обращений / в сеть / общих): " + ", ".join(
+                    f"{st['name']} {st['calls']}/{st['executed']}/{st['shared']}" for st in sf))
+                for sfg in SINGLE_FLIGHTS:
+                    sfg.reset_stats()
             if dex_iss:
                 lines.append("🔎 Dexscreener замечания:")
                 for t in dex_iss[:50]:
@@ -1027,18 +2517,86 @@ def strategy_loop():
         time.sleep(0.5)
 
 # ===================== ENTRY =====================
-if __name__ == "__main__":
+def run_sharded(n: int):
+    """Локальный шардированный запуск: n процессов main.py с SHARD_INDEX=0..n-1 и общим координатором."""
+    import subprocess
+    Coordinator(COORDINATOR_DB)  # создаём схему до старта воркеров
+    procs = []
+    for i in range(n):
+        env = dict(os.environ, SHARD_COUNT=str(n), SHARD_INDEX=str(i), COORDINATOR_DB=COORDINATOR_DB)
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        print(f"[SHARD] started #{i} pid={procs[-1].pid}")
+    try:
+        for p in procs:
+            p.wait()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+def run_chain_loop(ctx):
+    """Цикл неосновной сети в своём потоке: падение цикла не роняет процесс и другие сети."""
+    with use_chain(ctx):
+        while True:
+            try:
+                strategy_loop()
+            except Exception as e:
+                print(f"[CHAIN {ctx.name}] loop crashed:", repr(e))
+                send_telegram(f"❗ Цикл сети {ctx.name} упал: {repr(e)}; перезапуск через 30 с")
+                time.sleep(30)
+
+def start_chain_loops():
+    for ctx in CHAIN_CONTEXTS:
+        if not ctx.primary:
+            threading.Thread(target=run_chain_loop, args=(ctx,), name=f"chain-{ctx.name}", daemon=True).start()
+
+def run_bot():
+    """Полный запуск одного процесса бота (модель, writer, снимки, discovery, основной цикл)."""
     # --- ML: загрузить модель заранее ---
     load_model()   # <-- ВСТАВИТЬ ЭТУ СТРОКУ ЗДЕСЬ (перед стартом основной петли)
 
     # запуск writer (если вы используете логирование)
     start_writer()
 
+    # тёплый перезапуск: буферы, баны, позиции, кэши
+    restore_info = ""
+    if STATE_SNAPSHOT_ENABLED:
+        restore_info = restore_state_snapshot()
+        start_state_snapshots()
+
+    # пакетное обновление V3-пулов (Uniswap/Sushi) в фоне
+    start_graph_snapshots()
+
+    # расширение списка токенов по PairCreated/Dexscreener
+    start_discovery()
+    start_reserve_index()
+
+    # бортовой самописец решений по парам
+    start_flight_recorder()
+
+    # быстрая полоса для внешних идей (HTTP /idea, ideas.jsonl, Telegram /idea)
+    start_ideas()
+
+    # профилирование по запросу: SIGUSR2, HTTP /profile, Telegram /profile
+    install_profile_signal()
+    start_control_server()
+    start_telegram_commands()
+
+    # мультисетевой режим: остальные сети — в своих потоках, основная — в этом
+    start_chain_loops()
+
     try:
-        strategy_loop()
+        strategy_loop(restore_info)
     except KeyboardInterrupt:
         print("Stopped by user")
     except Exception as e:
         send_telegram(f"❗ Bot crashed: {repr(e)}")
         raise
+
+if __name__ == "__main__":
+    if "--shards" in sys.argv:
+        run_sharded(int(sys.argv[sys.argv.index("--shards") + 1]))
+        sys.exit(0)
+    run_bot()
       
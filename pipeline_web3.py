@@ -3,6 +3,9 @@ import os
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 
+from token_registry import REGISTRY
+from chains import CHAIN_SPECS
+
 # RPC
 ALCHEMY_RPC = os.getenv("ALCHEMY_POLYGON_RPC")
 if not ALCHEMY_RPC:
@@ -11,9 +14,9 @@ if not ALCHEMY_RPC:
 w3 = Web3(Web3.HTTPProvider(ALCHEMY_RPC))
 w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
-# QuickSwap v2 Router & Factory
-QUICKSWAP_ROUTER = Web3.to_checksum_address("0xa5E0829CaCEd8fFDD4De3c43696c57F7D7A678ff")
-QUICKSWAP_FACTORY = Web3.to_checksum_address("0x5757371414417b8c6caad45baef941abc7d3ab32")
+# QuickSwap v2 Router & Factory (адреса V2-роутеров других сетей — в chains.py)
+QUICKSWAP_ROUTER = Web3.to_checksum_address(CHAIN_SPECS["polygon"]["v2_router"])
+QUICKSWAP_FACTORY = Web3.to_checksum_address(CHAIN_SPECS["polygon"]["v2_factory"])
 
 ROUTER_ABI = [{
     "name": "getAmountsOut",
@@ -51,91 +54,145 @@ PAIR_ABI = [{
     "outputs": [{"name": "token1", "type": "address"}]
 }]
 
-router = w3.eth.contract(address=QUICKSWAP_ROUTER, abi=ROUTER_ABI)
-factory = w3.eth.contract(address=QUICKSWAP_FACTORY, abi=FACTORY_ABI)
-
-# Адреса токенов (синхронизировано с Main.py)
-TOKENS = {
-    "USDT": Web3.to_checksum_address("0xc2132d05d31c914a87c6611c10748aeb04b58e8f"),
-    "USDC": Web3.to_checksum_address("0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"),
-    "DAI":  Web3.to_checksum_address("0x8f3Cf7ad23Cd3CaDbD9735AFf958023239c6A063"),
-    "FRAX": Web3.to_checksum_address("0x45c32fa6df82ead1e2ef74d17b76547eddfaff89"),
-    "LINK": Web3.to_checksum_address("0x53e0bca35ec356bd5dddfebbd1fc0fd03fabad39"),
-    "wstETH": Web3.to_checksum_address("0x7f39c581f595b53c5cb5bbf48fab85048e8c1b02"),
-    "tBTC": Web3.to_checksum_address("0x236aa50979d5f3de3bd1eeb40e81137f22ab794b"),
-    "SAND": Web3.to_checksum_address("0xbbba073c31bf03b8acf7c28ef0738decf3695683"),
-    "GMT":  Web3.to_checksum_address("0xe3c408BD53c31C085a1746AF401A4042954ff740"),
-    "BET":  Web3.to_checksum_address("0x2e28b9b74d6d99d4697e913b82b41ef1cac51c6c"),
-    "WPOL": Web3.to_checksum_address("0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270"),  # WMATIC
-    "POL":  Web3.to_checksum_address("0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270"),  # alias
-}
-
 # Порог ликвидности (в USD), можно задать через fly secrets или [env] в fly.toml
 MIN_LIQ_USD = float(os.getenv("MIN_LIQ_USD", "10000"))
 
-def _norm_symbol(sym: str) -> str:
-    s = sym.upper()
-    if s in ("POL", "MATIC", "WMATIC", "WPOL"):
-        return "WPOL"
-    return s
-
-def _check_liquidity(tokenA, tokenB):
-    """Проверка ликвидности пары через getReserves"""
-    pair_addr = factory.functions.getPair(tokenA, tokenB).call()
-    if pair_addr == "0x0000000000000000000000000000000000000000":
-        return 0
-
-    pair = w3.eth.contract(address=pair_addr, abi=PAIR_ABI)
-    reserves = pair.functions.getReserves().call()
-    token0 = pair.functions.token0().call()
-    token1 = pair.functions.token1().call()
-
-    r0, r1 = reserves[0], reserves[1]
-
-    # если в паре есть USDT или USDC — смотрим его резерв
-    if token0 in (TOKENS["USDT"], TOKENS["USDC"]):
-        return r0 / 1e6
-    if token1 in (TOKENS["USDT"], TOKENS["USDC"]):
-        return r1 / 1e6
 
-    # если нет USDT/USDC — просто возвращаем min(reserve0,reserve1)
-    return min(r0, r1)
-
-def get_quote_web3(src_symbol: str, dst_symbol: str, amount_in_units: int):
-    """Пробуем получить цену напрямую или через WPOL (WMATIC)."""
-    src_symbol = _norm_symbol(src_symbol)
-    dst_symbol = _norm_symbol(dst_symbol)
-
-    if src_symbol not in TOKENS or dst_symbol not in TOKENS:
-        raise ValueError(f"Web3 unsupported token: {src_symbol}->{dst_symbol}")
-
-    # === Проверка ликвидности
-    liq = _check_liquidity(TOKENS[src_symbol], TOKENS[dst_symbol])
-    if liq < MIN_LIQ_USD:
-        raise ValueError(f"Low liquidity: {liq:.2f} USD in {src_symbol}->{dst_symbol}")
-
-    try:
-        # Прямой маршрут
-        path = [TOKENS[src_symbol], TOKENS[dst_symbol]]
-        amounts = router.functions.getAmountsOut(int(amount_in_units), path).call()
-        out_units = int(amounts[-1])
-        return {"buyAmount": str(out_units), "protocols": [], "source": "Web3"}
-
-    except Exception:
-        # Через WPOL
-        if src_symbol != "WPOL" and dst_symbol != "WPOL":
-            liq = _check_liquidity(TOKENS[src_symbol], TOKENS["WPOL"])
-            if liq < MIN_LIQ_USD:
-                raise ValueError(f"Low liquidity via WPOL: {liq:.2f} USD")
-            try:
-                path = [TOKENS[src_symbol], TOKENS["WPOL"], TOKENS[dst_symbol]]
-                amounts = router.functions.getAmountsOut(int(amount_in_units), path).call()
-                out_units = int(amounts[-1])
-                return {"buyAmount": str(out_units), "protocols": [], "source": "Web3"}
-            except Exception as e:
-                raise ValueError(f"Web3 no route for {src_symbol}->{dst_symbol}: {e}")
-        else:
-            raise ValueError(f"Web3 no direct pool for {src_symbol}->{dst_symbol}")
+class Web3Quoter:
+    """
+    Котировки getAmountsOut через V2-роутер одной сети (с запасным маршрутом через wrapped-токен).
+    tokens — живой словарь symbol -> checksum-адрес (REGISTRY.CHECKSUM), stables — символы
+    стейблов с 6 знаками (их резерв пары считается долларами).
+    """
+
+    def __init__(self, w3, router_addr, factory_addr, tokens, wrapped="WPOL", aliases=None, stables=("USDT", "USDC"),
+                 min_liq_usd=None):
+        self.w3 = w3
+        self.router = w3.eth.contract(address=Web3.to_checksum_address(router_addr), abi=ROUTER_ABI)
+        self.factory = w3.eth.contract(address=Web3.to_checksum_address(factory_addr), abi=FACTORY_ABI)
+        self.tokens = tokens
+        self.wrapped = wrapped
+        self.aliases = {k.upper(): v for k, v in (aliases or {}).items()}
+        self.stables = tuple(stables)
+        self.min_liq_usd = MIN_LIQ_USD if min_liq_usd is None else min_liq_usd
+
+    @classmethod
+    def for_rpc(cls, rpc_url, router_addr, factory_addr, tokens, **kw):
+        w3_ = Web3(Web3.HTTPProvider(rpc_url))
+        w3_.middleware_onion.inject(geth_poa_middleware, layer=0)
+        return cls(w3_, router_addr, factory_addr, tokens, **kw)
+
+    def _norm_symbol(self, sym: str) -> str:
+        s = self.aliases.get(sym.upper())
+        if s:
+            return s
+        # символы реестра регистрозависимы (wstETH, tBTC)
+        return sym if sym in self.tokens else sym.upper()
+
+    def _check_liquidity(self, tokenA, tokenB):
+        """Проверка ликвидности пары через getReserves"""
+        pair_addr = self.factory.functions.getPair(tokenA, tokenB).call()
+        if pair_addr == "0x0000000000000000000000000000000000000000":
+            return 0
+
+        pair = self.w3.eth.contract(address=pair_addr, abi=PAIR_ABI)
+        reserves = pair.functions.getReserves().call()
+        token0 = pair.functions.token0().call()
+        token1 = pair.functions.token1().call()
+
+        r0, r1 = reserves[0], reserves[1]
+
+        # если в паре есть стейбл (USDT/USDC) — смотрим его резерв
+        stables = [self.tokens[s] for s in self.stables if s in self.tokens]
+        if token0 in stables:
+            return r0 / 1e6
+        if token1 in stables:
+            return r1 / 1e6
+
+        # если стейбла нет — просто возвращаем min(reserve0,reserve1)
+        return min(r0, r1)
+
+    def get_quote(self, src_symbol: str, dst_symbol: str, amount_in_units: int):
+        """Пробуем получить цену напрямую или через wrapped-токен сети (WPOL на Polygon)."""
+        TOKENS, wrapped = self.tokens, self.wrapped
+        src_symbol = self._norm_symbol(src_symbol)
+        dst_symbol = self._norm_symbol(dst_symbol)
+
+        if src_symbol not in TOKENS or dst_symbol not in TOKENS:
+            raise ValueError(f"Web3 unsupported token: {src_symbol}->{dst_symbol}")
+
+        # === Проверка ликвидности
+        liq = self._check_liquidity(TOKENS[src_symbol], TOKENS[dst_symbol])
+        if liq < self.min_liq_usd:
+            raise ValueError(f"Low liquidity: {liq:.2f} USD in {src_symbol}->{dst_symbol}")
+
+        try:
+            # Прямой маршрут
+            path = [TOKENS[src_symbol], TOKENS[dst_symbol]]
+            amounts = self.router.functions.getAmountsOut(int(amount_in_units), path).call()
+            out_units = int(amounts[-1])
+            return {"buyAmount": str(out_units), "protocols": [], "source": "Web3"}
+
+        except Exception:
+            # Через wrapped-токен
+            if src_symbol != wrapped and dst_symbol != wrapped and wrapped in TOKENS:
+                liq = self._check_liquidity(TOKENS[src_symbol], TOKENS[wrapped])
+                if liq < self.min_liq_usd:
+                    raise ValueError(f"Low liquidity via {wrapped}: {liq:.2f} USD")
+                try:
+                    path = [TOKENS[src_symbol], TOKENS[wrapped], TOKENS[dst_symbol]]
+                    amounts = self.router.functions.getAmountsOut(int(amount_in_units), path).call()
+                    out_units = int(amounts[-1])
+                    return {"buyAmount": str(out_units), "protocols": [], "source": "Web3"}
+                except Exception as e:
+                    raise ValueError(f"Web3 no route for {src_symbol}->{dst_symbol}: {e}")
+            else:
+                raise ValueError(f"Web3 no direct pool for {src_symbol}->{dst_symbol}")
+
+    def get_round_trip(self, base_symbol: str, token_symbol: str, amount_in_units: int):
+        """
+        Круг base->token->base одним eth_call: getAmountsOut с путём [base, token, base]
+        (или через wrapped: [base, WPOL, token, WPOL, base]). Резервы на каждом шаге — текущие,
+        т.е. результат равен двум независимым котировкам. Возвращает (token_units, base_units_back).
+        """
+        TOKENS = self.tokens
+        base_symbol = self._norm_symbol(base_symbol)
+        token_symbol = self._norm_symbol(token_symbol)
+        if base_symbol not in TOKENS or token_symbol not in TOKENS:
+            raise ValueError(f"Web3 unsupported token: {base_symbol}->{token_symbol}")
+
+        base, token, wrapped = TOKENS[base_symbol], TOKENS[token_symbol], TOKENS.get(self.wrapped)
+        liq = self._check_liquidity(base, token)
+        if liq < self.min_liq_usd:
+            raise ValueError(f"Low liquidity: {liq:.2f} USD in {base_symbol}->{token_symbol}")
+        try:
+            amounts = self.router.functions.getAmountsOut(int(amount_in_units), [base, token, base]).call()
+            return int(amounts[1]), int(amounts[2])
+        except Exception:
+            pass
+        # как и в get_quote — запасной маршрут через wrapped-токен
+        if wrapped is None or wrapped in (base, token):
+            raise ValueError(f"Web3 no direct pool for {base_symbol}->{token_symbol}")
+        liq = self._check_liquidity(base, wrapped)
+        if liq < self.min_liq_usd:
+            raise ValueError(f"Low liquidity via {self.wrapped}: {liq:.2f} USD")
+        try:
+            amounts = self.router.functions.getAmountsOut(int(amount_in_units), [base, wrapped, token, wrapped, base]).call()
+            return int(amounts[2]), int(amounts[4])
+        except Exception as e:
+            raise ValueError(f"Web3 no route for {base_symbol}->{token_symbol}->{base_symbol}: {e}")
+
+
+# Адреса токенов — общий реестр (token_registry.py), checksum-представление;
+# найденные discovery токены появляются здесь автоматически
+TOKENS = REGISTRY.CHECKSUM
+
+# котировщик Polygon (ALCHEMY_POLYGON_RPC, QuickSwap) и прежние функции модуля
+QUOTER = Web3Quoter(w3, QUICKSWAP_ROUTER, QUICKSWAP_FACTORY, TOKENS, wrapped="WPOL",
+                    aliases=CHAIN_SPECS["polygon"]["aliases"], stables=CHAIN_SPECS["polygon"]["stables"])
+router, factory = QUOTER.router, QUOTER.factory
+get_quote_web3 = QUOTER.get_quote
+get_round_trip_web3 = QUOTER.get_round_trip
 
 if __name__ == "__main__":
     print("Connected:", w3.is_connected())
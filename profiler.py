@@ -0,0 +1,183 @@
+# profiler.py
+"""
+Сэмплирующий профайлер всех потоков процесса, включаемый на лету на ограниченное окно.
+
+Фоновый поток раз в interval секунд снимает sys._current_frames() — стеки всех потоков
+(скан, мониторы, writer, снапшоты) — и считает одинаковые стеки. Время настенное: поток, спящий
+в time.sleep или ждущий HTTP, виден в кадре, который его вызвал.
+Пока профайлер не запущен, он ничего не стоит; запущенный — один поток и ~1% CPU при 100 Гц.
+
+Результат окна — два файла в out_dir:
+  profile_<время>.collapsed — «поток;кадр;кадр;... N» (flamegraph.pl, speedscope, inferno);
+  profile_<время>.txt       — топ функций по собственным и суммарным сэмплам, сэмплы по потокам.
+"""
+import os
+import re
+import sys
+import time
+import threading
+
+_THREAD_RE = re.compile(r"^Thread-\d+ \((.+)\)$")
+# служебные кадры запуска потока — одинаковы у всех потоков, в стек не пишем
+_SKIP_CODES = {threading.Thread._bootstrap.__code__, threading.Thread._bootstrap_inner.__code__,
+               threading.Thread.run.__code__}
+
+
+def _thread_label(name: str) -> str:
+    """«Thread-17 (_run_monitor)» -> «_run_monitor»: однотипные потоки складываются в одну ветку."""
+    m = _THREAD_RE.match(name or "")
+    return m.group(1) if m else (name or "?")
+
+
+class SamplingProfiler:
+    def __init__(self, out_dir="profiles", interval=0.01, max_seconds=300.0, max_depth=64, keep=20,
+                 on_done=None):
+        """on_done(result) вызывается из потока профайлера после записи файлов."""
+        self.out_dir = out_dir
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.keep = keep
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {}          # code object -> "func (file:line)"
+        self.started_at = None
+        self.deadline = None
+        self.origin = None
+        self.last_result = None
+
+    # ---------- управление ----------
+    def start(self, seconds: float, origin: str = ""):
+        """Запускает окно профилирования; (False, причина), если уже идёт."""
+        seconds = max(1.0, min(float(seconds), self.max_seconds))
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                left = max(0, int(self.deadline - time.time()))
+                return False, f"profiler already running ({left}s left, started by {self.origin})"
+            self._stop.clear()
+            self.started_at = time.time()
+            self.deadline = self.started_at + seconds
+            self.origin = origin or "?"
+            self._thread = threading.Thread(target=self._run, args=(seconds,), name="profiler", daemon=True)
+            self._thread.start()
+        return True, f"profiling {seconds:.0f}s at {1.0 / self.interval:.0f} Hz"
+
+    def stop(self):
+        self._stop.set()
+
+    def running(self) -> bool:
+        t = self._thread
+        return t is not None and t.is_alive()
+
+    def status(self) -> dict:
+        if self.running():
+            return {"running": True, "origin": self.origin, "elapsed": round(time.time() - self.started_at, 1),
+                    "left": round(max(0.0, self.deadline - time.time()), 1)}
+        return {"running": False, "last": self.last_result}
+
+    # ---------- сэмплирование ----------
+    def _label(self, code):
+        lab = self._labels.get(code)
+        if lab is None:
+            lab = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = lab
+        return lab
+
+    def _run(self, seconds):
+        me = threading.get_ident()
+        counts = {}
+        names = {}
+        names_ts = 0.0
+        samples = 0
+        busy = 0.0
+        t_end = time.time() + seconds
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            now = time.time()
+            if now >= t_end:
+                break
+            if now - names_ts >= 1.0:
+                names = {t.ident: _thread_label(t.name) for t in threading.enumerate()}
+                names_ts = now
+            frame = f = None
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                f = frame
+                while f is not None and len(stack) < self.max_depth:
+                    if f.f_code not in _SKIP_CODES:
+                        stack.append(self._label(f.f_code))
+                    f = f.f_back
+                stack.append(names.get(tid, f"thread-{tid}"))
+                key = tuple(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            del frame, f
+            samples += 1
+            spent = time.perf_counter() - t0
+            busy += spent
+            self._stop.wait(max(0.0, self.interval - spent))
+        elapsed = max(1e-9, time.time() - self.started_at)
+        try:
+            res = self._write(counts, samples, elapsed, busy)
+        except Exception as e:
+            res = {"error": repr(e), "samples": samples, "seconds": round(elapsed, 1)}
+        self.last_result = res
+        if self.on_done:
+            try:
+                self.on_done(res)
+            except Exception:
+                pass
+
+    # ---------- отчёт ----------
+    def _write(self, counts, samples, elapsed, busy):
+        os.makedirs(self.out_dir, exist_ok=True)
+        now = time.time()
+        stem = os.path.join(self.out_dir, "profile_" + time.strftime("%Y%m%d_%H%M%S", time.localtime(now))
+                            + f"_{int(now * 1000) % 1000:03d}")
+        with open(stem + ".collapsed", "w", encoding="utf-8") as f:
+            for key, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+                f.write(";".join(s.replace(";", ",") for s in key) + f" {n}\n")
+
+        self_cnt, total_cnt, per_thread = {}, {}, {}
+        for key, n in counts.items():
+            per_thread[key[0]] = per_thread.get(key[0], 0) + n
+            if len(key) > 1:
+                self_cnt[key[-1]] = self_cnt.get(key[-1], 0) + n
+            for lab in set(key[1:]):
+                total_cnt[lab] = total_cnt.get(lab, 0) + n
+        top_self = sorted(self_cnt.items(), key=lambda kv: -kv[1])[:30]
+        top_total = sorted(total_cnt.items(), key=lambda kv: -kv[1])[:30]
+        overhead = 100.0 * busy / elapsed
+        total = max(1, sum(counts.values()))   # сэмплы всех потоков (на тик — по одному на поток)
+
+        lines = [f"window {elapsed:.1f}s, {samples} samples ({samples / elapsed:.0f} Hz), "
+                 f"sampler overhead {overhead:.2f}% of one core, origin {self.origin}",
+                 "wall-clock samples: a thread sleeping or waiting on I/O counts in its caller;",
+                 f"percentages are of all thread samples ({total})", "",
+                 "samples per thread:"]
+        lines += [f"  {n:>8}  {100.0 * n / total:6.1f}%  {name}" for name, n in sorted(per_thread.items(), key=lambda kv: -kv[1])]
+        lines += ["", "top functions by self samples (leaf python frame):"]
+        lines += [f"  {n:>8}  {100.0 * n / total:6.1f}%  {lab}" for lab, n in top_self]
+        lines += ["", "top functions by total samples (anywhere in the stack):"]
+        lines += [f"  {n:>8}  {100.0 * n / total:6.1f}%  {lab}" for lab, n in top_total]
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._prune()
+        return {"collapsed": stem + ".collapsed", "summary": stem + ".txt", "samples": samples,
+                "seconds": round(elapsed, 1), "overhead_pct": round(overhead, 2), "origin": self.origin,
+                "top_self": top_self[:10], "top_total": top_total[:10]}
+
+    def _prune(self):
+        """Оставляет keep последних окон (по паре файлов на окно)."""
+        if not self.keep:
+            return
+        stems = sorted({os.path.splitext(n)[0] for n in os.listdir(self.out_dir) if n.startswith("profile_")})
+        for stem in stems[:-self.keep]:
+            for ext in (".collapsed", ".txt"):
+                try:
+                    os.remove(os.path.join(self.out_dir, stem + ext))
+                except OSError:
+                    pass
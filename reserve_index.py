@@ -0,0 +1,505 @@
+# reserve_index.py
+"""
+Локальная история резервов V2-пар: события Sync(uint112,uint112) отслеживаемых пар
+(бэкфилл от стартового блока, затем — слежение за головой цепи) в колоночном хранилище.
+
+Хранилище — каталог:
+  meta.json         — пары (подпись, token0/token1, курсор last_block), атомарная запись;
+  blocks.bin        — опорные точки блок -> время (int64, int64) для меток событий;
+  <pair>/block.bin  — номер блока события            (int64)
+  <pair>/ts.bin     — время блока, epoch секунды      (int64)
+  <pair>/r0.bin     — reserve0 после события          (float64)
+  <pair>/r1.bin     — reserve1 после события          (float64)
+Колонки только дописываются и отсортированы по блоку, поэтому сама колонка ts (или block) —
+индекс: «резервы пары на время T» — бинарный поиск по колонке в памяти (микросекунды),
+диапазон — срез без копирования. Резервы в float64: точность ~1e-16 относительной, для цен и признаков.
+
+Время события: blockTimestamp из лога (его отдают Alchemy/Erigon), иначе линейная интерполяция
+между опорными блоками на границах запроса логов (на Polygon — погрешность в секунды).
+Индексатор отстаёт от головы на confirmations блоков — реорганизации в хранилище не попадают.
+После падения колонки выравниваются по самой короткой и обрезаются по курсору пары из meta.json.
+
+Разбор:
+  python reserve_index.py stats reserves
+  python reserve_index.py at    reserves "USDT->LINK" 2026-10-01T12:00
+  python reserve_index.py range reserves "USDT->LINK" --since 2h --csv link.csv
+  python reserve_index.py backfill reserves --rpc $ALCHEMY_POLYGON_RPC --add 0x<pair> --from-block 60000000
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+import datetime as dt
+
+import numpy as np
+
+SYNC_TOPIC = "0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1"
+COLUMNS = (("block", "<i8"), ("ts", "<i8"), ("r0", "<f8"), ("r1", "<f8"))
+_ANCHOR = np.dtype([("block", "<i8"), ("ts", "<i8")])
+
+
+class _PairColumns:
+    """Колонки одной пары: растущие numpy-буферы в памяти + файлы на диске.
+    Читатели берут n, затем буферы — дописанные строки видны только после увеличения n."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.n = 0
+        self.cols = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        self._files = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".bin")
+
+    def load(self, cursor=None, repair=True):
+        """Читает колонки с диска; выравнивает длины и отрезает строки новее курсора (недописанный шаг).
+        repair=False (читатель) — файлы не трогает: писатель мог не дописать шаг."""
+        if not os.path.isdir(self.path):
+            return
+        data = {}
+        for name, dtype in COLUMNS:
+            f = self._file(name)
+            data[name] = np.fromfile(f, dtype=dtype) if os.path.exists(f) else np.empty(0, dtype=dtype)
+        n = min(len(a) for a in data.values())
+        if cursor is not None:
+            n = int(np.searchsorted(data["block"][:n], cursor, side="right"))
+        for name, dtype in COLUMNS:
+            if repair and len(data[name]) != n and os.path.exists(self._file(name)):
+                with open(self._file(name), "r+b") as fh:
+                    fh.truncate(n * np.dtype(dtype).itemsize)
+            self.cols[name] = np.array(data[name][:n])
+        self.n = n
+
+    def tail(self):
+        """Дочитывает строки, дописанные другим процессом (читатель)."""
+        sizes = []
+        for name, dtype in COLUMNS:
+            f = self._file(name)
+            sizes.append(os.path.getsize(f) // np.dtype(dtype).itemsize if os.path.exists(f) else 0)
+        n = min(sizes)
+        if n <= self.n:
+            return 0
+        new = {}
+        for name, dtype in COLUMNS:
+            with open(self._file(name), "rb") as fh:
+                fh.seek(self.n * np.dtype(dtype).itemsize)
+                new[name] = np.fromfile(fh, dtype=dtype, count=n - self.n)
+        return self._extend(new)
+
+    def append(self, rows: dict):
+        """rows — {колонка: список}; пишет в файлы, затем в память."""
+        if self._files is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._files = {name: open(self._file(name), "ab") for name, _ in COLUMNS}
+        arrs = {name: np.asarray(rows[name], dtype=dtype) for name, dtype in COLUMNS}
+        for name, _ in COLUMNS:
+            self._files[name].write(arrs[name].tobytes())
+            self._files[name].flush()
+        return self._extend(arrs)
+
+    def _extend(self, arrs: dict):
+        k = len(arrs["block"])
+        n = self.n
+        for name, dtype in COLUMNS:
+            buf = self.cols[name]
+            if n + k > len(buf):
+                grown = np.empty(max(1024, 2 * (n + k)), dtype=dtype)
+                grown[:n] = buf[:n]
+                buf = grown
+            buf[n:n + k] = arrs[name]
+            self.cols[name] = buf
+        self.n = n + k
+        return k
+
+    def close(self):
+        for fh in (self._files or {}).values():
+            fh.close()
+        self._files = None
+
+
+class BlockClock:
+    """Время блока по опорным точкам (block, ts): точно в опорной точке, между ними — интерполяция."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.blocks = []
+        self.ts = []
+        if path and os.path.exists(path):
+            arr = np.fromfile(path, dtype=_ANCHOR)
+            for b, t in sorted(set(zip(arr["block"].tolist(), arr["ts"].tolist()))):
+                self.blocks.append(b)
+                self.ts.append(t)
+
+    def has(self, block: int) -> bool:
+        i = bisect.bisect_left(self.blocks, block)
+        return i < len(self.blocks) and self.blocks[i] == block
+
+    def add(self, block: int, ts: int):
+        i = bisect.bisect_left(self.blocks, block)
+        if i < len(self.blocks) and self.blocks[i] == block:
+            return
+        self.blocks.insert(i, block)
+        self.ts.insert(i, ts)
+        if self.path:
+            with open(self.path, "ab") as fh:
+                fh.write(np.array([(block, ts)], dtype=_ANCHOR).tobytes())
+
+    def ts_of(self, block: int):
+        i = bisect.bisect_left(self.blocks, block)
+        if i < len(self.blocks) and self.blocks[i] == block:
+            return self.ts[i]
+        if i == 0 or i == len(self.blocks):
+            return None
+        b0, b1, t0, t1 = self.blocks[i - 1], self.blocks[i], self.ts[i - 1], self.ts[i]
+        return int(round(t0 + (t1 - t0) * (block - b0) / (b1 - b0)))
+
+
+class ReserveStore:
+    def __init__(self, root: str, readonly: bool = False):
+        self.root = root
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self.meta = {"version": 1, "pairs": {}}
+        self._cols = {}
+        self._labels = {}
+        if not readonly:
+            os.makedirs(root, exist_ok=True)
+        self.clock = BlockClock(os.path.join(root, "blocks.bin"))
+        self._load_meta()
+        for addr, m in self.meta["pairs"].items():
+            c = _PairColumns(os.path.join(root, addr))
+            c.load(None if readonly else m.get("last_block"), repair=not readonly)
+            self._cols[addr] = c
+
+    # ---------- метаданные ----------
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def _load_meta(self):
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._labels = {m["label"]: a for a, m in self.meta["pairs"].items() if m.get("label")}
+
+    def save_meta(self):
+        tmp = self._meta_path() + ".tmp"
+        with self._lock:
+            payload = json.dumps(self.meta, ensure_ascii=False, separators=(",", ":"))
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, self._meta_path())
+
+    def add_pair(self, addr: str, label: str, token0: str, token1: str, last_block: int = None):
+        """Новая пара; last_block — последний уже «пройденный» блок (бэкфилл начнётся с last_block + 1)."""
+        addr = addr.lower()
+        with self._lock:
+            if addr in self.meta["pairs"]:
+                return False
+            self.meta["pairs"][addr] = {"label": label, "token0": token0.lower(), "token1": token1.lower(),
+                                        "last_block": last_block}
+            self._cols[addr] = _PairColumns(os.path.join(self.root, addr))
+            if label:
+                self._labels[label] = addr
+        return True
+
+    def pairs(self) -> dict:
+        with self._lock:
+            return {a: dict(m) for a, m in self.meta["pairs"].items()}
+
+    def pair_for(self, label_or_addr: str):
+        """Адрес пары по подписи «USDT->LINK» или адресу; None — пара не индексируется."""
+        s = label_or_addr.strip()
+        if s.lower() in self._cols:
+            return s.lower()
+        return self._labels.get(s)
+
+    def set_cursor(self, addrs, block: int):
+        with self._lock:
+            for a in addrs:
+                self.meta["pairs"][a]["last_block"] = int(block)
+
+    def append(self, addr: str, rows: dict) -> int:
+        return self._cols[addr].append(rows)
+
+    def refresh(self):
+        """Читатель (другой процесс/шард): новые пары из meta.json и дописанные строки."""
+        self._load_meta()
+        added = 0
+        for addr in self.meta["pairs"]:
+            c = self._cols.get(addr)
+            if c is None:
+                c = self._cols[addr] = _PairColumns(os.path.join(self.root, addr))
+            added += c.tail()
+        self.clock = BlockClock(os.path.join(self.root, "blocks.bin"))
+        return added
+
+    def close(self):
+        for c in self._cols.values():
+            c.close()
+
+    # ---------- запросы ----------
+    def rows(self, addr: str) -> int:
+        c = self._cols.get(addr)
+        return c.n if c else 0
+
+    def _row(self, c, i):
+        cols = c.cols
+        return {"block": int(cols["block"][i]), "ts": int(cols["ts"][i]),
+                "r0": float(cols["r0"][i]), "r1": float(cols["r1"][i])}
+
+    def at(self, addr: str, ts: float):
+        """Резервы пары на момент ts (последний Sync не позже ts): {"block", "ts", "r0", "r1"} | None."""
+        c = self._cols.get(addr)
+        if c is None:
+            return None
+        n = c.n
+        i = int(np.searchsorted(c.cols["ts"][:n], ts, side="right")) - 1
+        return self._row(c, i) if i >= 0 else None
+
+    def price(self, addr: str, ts: float, base_addr: str):
+        """Цена токена пары в базовом на момент ts: reserve(base) / reserve(token), без поправки на decimals
+        (для отношений цен во времени она сокращается); None — нет событий или пустой пул."""
+        row = self.at(addr, ts)
+        m = self.meta["pairs"].get(addr)
+        if row is None or m is None or row["r0"] <= 0 or row["r1"] <= 0:
+            return None
+        return row["r0"] / row["r1"] if m["token0"] == base_addr.lower() else row["r1"] / row["r0"]
+
+    def at_block(self, addr: str, block: int):
+        """Резервы пары после блока block."""
+        c = self._cols.get(addr)
+        if c is None:
+            return None
+        n = c.n
+        i = int(np.searchsorted(c.cols["block"][:n], block, side="right")) - 1
+        return self._row(c, i) if i >= 0 else None
+
+    def range(self, addr: str, t0: float = None, t1: float = None) -> dict:
+        """События пары с t0 <= ts <= t1: {колонка: numpy-срез} без копирования."""
+        c = self._cols.get(addr)
+        if c is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        n = c.n
+        ts = c.cols["ts"][:n]
+        lo = 0 if t0 is None else int(np.searchsorted(ts, t0, side="left"))
+        hi = n if t1 is None else int(np.searchsorted(ts, t1, side="right"))
+        return {name: c.cols[name][lo:hi] for name, _ in COLUMNS}
+
+    def stats(self) -> dict:
+        out = {}
+        for addr, m in self.pairs().items():
+            c = self._cols.get(addr)
+            n = c.n if c else 0
+            out[addr] = {"label": m.get("label"), "rows": n, "last_block": m.get("last_block"),
+                         "first_ts": int(c.cols["ts"][0]) if n else None,
+                         "last_ts": int(c.cols["ts"][n - 1]) if n else None}
+        return out
+
+
+def _word(data, i):
+    return int.from_bytes(bytes(data[32 * i:32 * (i + 1)]), "big")
+
+
+def _as_int(v):
+    if isinstance(v, str):
+        return int(v, 16) if v.startswith("0x") else int(v)
+    return int(v)
+
+
+class SyncIndexer:
+    def __init__(self, store: ReserveStore, w3, blocks_per_cycle: int = 20000, log_chunk: int = 2000,
+                 confirmations: int = 32, backfill_blocks: int = 200000, start_block: int = None):
+        """
+        w3               — web3.Web3 (eth.get_logs / eth.get_block / eth.block_number);
+        blocks_per_cycle — блоков за один step() (остальное — следующим вызовом);
+        backfill_blocks  — глубина истории для новой пары, если не задан start_block.
+        """
+        self.store = store
+        self.w3 = w3
+        self.blocks_per_cycle = blocks_per_cycle
+        self.log_chunk = self._max_chunk = log_chunk
+        self.confirmations = confirmations
+        self.backfill_blocks = backfill_blocks
+        self.start_block = start_block
+        self.last_stats = {}
+
+    def _anchor(self, block: int):
+        if block >= 0 and not self.store.clock.has(block):
+            self.store.clock.add(block, int(self.w3.eth.get_block(block)["timestamp"]))
+
+    def _fetch(self, addrs, frm: int, to: int):
+        from web3 import Web3
+        return self.w3.eth.get_logs({"fromBlock": frm, "toBlock": to,
+                                     "address": [Web3.to_checksum_address(a) for a in addrs],
+                                     "topics": [SYNC_TOPIC]})
+
+    def _ingest(self, addrs, frm: int, to: int) -> int:
+        """Sync-события пар addrs в блоках [frm, to] -> колонки; курсор пар — to."""
+        logs = self._fetch(addrs, frm, to)
+        if logs and any(lg.get("blockTimestamp") is None for lg in logs):
+            self._anchor(frm - 1)
+            self._anchor(to)
+        rows = {}
+        for lg in logs:
+            addr = lg["address"].lower()
+            if addr not in addrs:
+                continue
+            block = _as_int(lg["blockNumber"])
+            ts = lg.get("blockTimestamp")
+            ts = _as_int(ts) if ts is not None else self.store.clock.ts_of(block)
+            r = rows.setdefault(addr, {"block": [], "ts": [], "r0": [], "r1": []})
+            r["block"].append(block)
+            r["ts"].append(ts if ts is not None else 0)
+            r["r0"].append(float(_word(lg["data"], 0)))
+            r["r1"].append(float(_word(lg["data"], 1)))
+        n = 0
+        for addr, r in rows.items():
+            n += self.store.append(addr, r)
+        self.store.set_cursor(addrs, to)
+        self.store.save_meta()
+        return n
+
+    def step(self) -> dict:
+        """
+        Один ограниченный шаг. Двигаются пары с самым отстающим курсором — до ближайшего
+        курсора других пар (там группы сливаются в один запрос логов) или до головы.
+        """
+        t0 = time.time()
+        head = int(self.w3.eth.block_number) - self.confirmations
+        pairs = self.store.pairs()
+        st = {"events": 0, "blocks": 0, "pairs": len(pairs), "lag": 0, "sec": 0.0}
+        if not pairs:
+            self.last_stats = st
+            return st
+        start = self.start_block - 1 if self.start_block is not None else max(0, head - self.backfill_blocks)
+        fresh = [a for a, m in pairs.items() if m.get("last_block") is None]
+        if fresh:
+            self.store.set_cursor(fresh, start)
+            pairs = self.store.pairs()
+        cursors = {a: m["last_block"] for a, m in pairs.items()}
+        low = min(cursors.values())
+        st["lag"] = max(0, head - low)
+        if low >= head:
+            st["sec"] = time.time() - t0
+            self.last_stats = st
+            return st
+        group = {a for a, c in cursors.items() if c == low}
+        higher = [c for c in cursors.values() if c > low]
+        to = min(head, low + self.blocks_per_cycle, min(higher) if higher else head)
+        frm = low + 1
+        while frm <= to:
+            chunk_to = min(to, frm + self.log_chunk - 1)
+            try:
+                st["events"] += self._ingest(group, frm, chunk_to)
+            except Exception:
+                # слишком много логов в ответе провайдера — мельчим окно
+                if chunk_to == frm:
+                    raise
+                self.log_chunk = max(1, (chunk_to - frm + 1) // 2)
+                continue
+            st["blocks"] += chunk_to - frm + 1
+            frm = chunk_to + 1
+            self.log_chunk = min(self._max_chunk, self.log_chunk * 2)
+        st["lag"] = max(0, head - min(m["last_block"] for m in self.store.pairs().values()))
+        st["sec"] = time.time() - t0
+        self.last_stats = st
+        return st
+
+
+# ===================== CLI =====================
+def _parse_time(s):
+    """epoch, ISO (2026-10-01T12:00) или «назад» (90s, 15m, 2h, 1d)."""
+    if s is None:
+        return None
+    mult = {"s": 1, "m": 60, "h": 3600, "d": 86400}.get(s[-1])
+    if mult and s[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(s[:-1]) * mult
+    try:
+        return float(s)
+    except ValueError:
+        return dt.datetime.fromisoformat(s).timestamp()
+
+
+def _fmt_ts(ts):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Sync-event reserve history store")
+    p.add_argument("cmd", choices=("stats", "at", "range", "backfill"))
+    p.add_argument("root", nargs="?", default=os.getenv("RESERVE_INDEX_DIR", "reserves"))
+    p.add_argument("pair", nargs="?", default=None, help="label (USDT->LINK) or pair address")
+    p.add_argument("time", nargs="?", default=None, help="for 'at': epoch, ISO time or 15m/2h ago")
+    p.add_argument("--since", default=None, help="range start: epoch, ISO or 15m/2h ago")
+    p.add_argument("--until", default=None, help="range end")
+    p.add_argument("--csv", default=None, help="range: write rows to CSV instead of stdout")
+    p.add_argument("--rpc", default=os.getenv("ALCHEMY_POLYGON_RPC"), help="backfill: RPC URL")
+    p.add_argument("--add", action="append", default=[], metavar="PAIR_ADDR",
+                   help="backfill: pair address to start indexing (repeatable)")
+    p.add_argument("--from-block", type=int, default=None, help="backfill: first block for new pairs")
+    p.add_argument("--confirmations", type=int, default=32)
+    args = p.parse_args()
+
+    if args.cmd == "backfill":
+        from web3 import Web3
+        from web3.middleware import geth_poa_middleware
+        if not args.rpc:
+            raise SystemExit("--rpc (or ALCHEMY_POLYGON_RPC) is required")
+        w3 = Web3(Web3.HTTPProvider(args.rpc))
+        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        store = ReserveStore(args.root)
+        abi = [{"name": n, "type": "function", "stateMutability": "view", "inputs": [],
+                "outputs": [{"name": n, "type": "address"}]} for n in ("token0", "token1")]
+        for a in args.add:
+            pc = w3.eth.contract(address=Web3.to_checksum_address(a), abi=abi)
+            store.add_pair(a, a.lower(), pc.functions.token0().call(), pc.functions.token1().call())
+        idx = SyncIndexer(store, w3, confirmations=args.confirmations, start_block=args.from_block)
+        while True:
+            st = idx.step()
+            print(f"+{st['events']} events over {st['blocks']} blocks in {st['sec']:.1f}s, lag {st['lag']} blocks")
+            if st["blocks"] == 0:
+                break
+        store.close()
+        return
+
+    store = ReserveStore(args.root, readonly=True)
+    if args.cmd == "stats":
+        for addr, s in sorted(store.stats().items(), key=lambda kv: kv[1]["label"] or kv[0]):
+            span = f"{_fmt_ts(s['first_ts'])} .. {_fmt_ts(s['last_ts'])}" if s["rows"] else "-"
+            print(f"{(s['label'] or '-'):<16} {addr}  rows={s['rows']:<9} last_block={s['last_block']}  {span}")
+        return
+
+    addr = store.pair_for(args.pair or "")
+    if addr is None:
+        raise SystemExit(f"pair {args.pair!r} is not indexed in {args.root}")
+    if args.cmd == "at":
+        t = _parse_time(args.time) if args.time else time.time()
+        t_lookup = time.perf_counter()
+        r = store.at(addr, t)
+        took = (time.perf_counter() - t_lookup) * 1e6
+        if r is None:
+            raise SystemExit("no Sync events at or before that time")
+        print(f"{args.pair} at {_fmt_ts(t)}: block {r['block']} ({_fmt_ts(r['ts'])}) "
+              f"reserve0={r['r0']:.0f} reserve1={r['r1']:.0f}  [lookup {took:.1f}us]")
+        return
+
+    cols = store.range(addr, _parse_time(args.since), _parse_time(args.until))
+    out = open(args.csv, "w", encoding="utf-8") if args.csv else sys.stdout
+    try:
+        out.write("block,ts,reserve0,reserve1\n")
+        for b, t, r0, r1 in zip(cols["block"].tolist(), cols["ts"].tolist(), cols["r0"].tolist(), cols["r1"].tolist()):
+            out.write(f"{b},{t},{r0:.0f},{r1:.0f}\n")
+    finally:
+        if args.csv:
+            out.close()
+    if args.csv:
+        print(f"{len(cols['block'])} rows -> {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
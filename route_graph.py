@@ -0,0 +1,198 @@
+# route_graph.py
+"""
+Граф курсов между всеми известными токенами и поиск прибыльных циклов.
+
+Вес ребра src->dst = -log(rate * (1 - fee)), где rate — сколько dst (в целых токенах)
+даёт 1 src по последней котировке любого источника (1inch/Uniswap/Sushi/Web3/Dexscreener).
+Цикл прибылен, если сумма весов < -log(1 + min_profit).
+
+Поиск инкрементальный: между вызовами find_cycles() запоминаются рёбра, чей курс
+изменился, и ищутся только циклы, проходящие через эти рёбра (Bellman-Ford с
+ограничением числа шагов от конца каждого изменённого ребра). Циклы без изменённых
+рёбер уже были проверены на предыдущих итерациях.
+"""
+import math
+import time
+import threading
+
+INF = float("inf")
+
+
+class RouteGraph:
+    def __init__(self, fee: float = 0.0, max_len: int = 4, edge_ttl: float = 600.0, rel_eps: float = 1e-4):
+        self.fee = fee
+        self.max_len = max(2, int(max_len))
+        self.edge_ttl = edge_ttl
+        self.rel_eps = rel_eps
+        self._lock = threading.Lock()
+        # src -> {dst: {"w": weight, "rate": rate, "source": str, "ts": float}}
+        self._adj = {}
+        self._dirty = set()  # {(src, dst)}
+
+    # ---------- обновление рёбер ----------
+    def update_rate(self, src: str, dst: str, rate: float, source: str = "", ts: float = None):
+        """rate — количество dst за 1 src (в целых токенах, не units). Лучший курс на ребре побеждает,
+        пока не устарел."""
+        if src == dst or not rate or rate <= 0 or not math.isfinite(rate):
+            return
+        ts = ts or time.time()
+        w = -math.log(rate * (1.0 - self.fee))
+        with self._lock:
+            row = self._adj.setdefault(src, {})
+            cur = row.get(dst)
+            if cur is not None:
+                fresh = ts - cur["ts"] < self.edge_ttl
+                same_source = cur["source"] == source
+                # чужой источник с худшим курсом не перетирает свежее ребро
+                if fresh and not same_source and w >= cur["w"]:
+                    return
+                changed = abs(cur["rate"] - rate) > self.rel_eps * cur["rate"]
+                cur.update({"w": w, "rate": rate, "source": source, "ts": ts})
+                if changed:
+                    self._dirty.add((src, dst))
+                return
+            row[dst] = {"w": w, "rate": rate, "source": source, "ts": ts}
+            self._dirty.add((src, dst))
+
+    def update_quote(self, src: str, dst: str, amount_in: float, amount_out: float, source: str = ""):
+        """Обновление по котировке: amount_in/amount_out — в целых токенах."""
+        if amount_in and amount_in > 0 and amount_out and amount_out > 0:
+            self.update_rate(src, dst, amount_out / amount_in, source)
+
+    def prune(self, now: float = None):
+        now = now or time.time()
+        with self._lock:
+            for src in list(self._adj.keys()):
+                row = self._adj[src]
+                for dst in list(row.keys()):
+                    if now - row[dst]["ts"] > self.edge_ttl:
+                        row.pop(dst, None)
+                        self._dirty.discard((src, dst))
+                if not row:
+                    self._adj.pop(src, None)
+
+    def export_edges(self):
+        """Живые рёбра для снимка состояния: [[src, dst, rate, source, ts], ...]."""
+        now = time.time()
+        with self._lock:
+            return [[s, d, e["rate"], e["source"], e["ts"]]
+                    for s, row in self._adj.items() for d, e in row.items() if now - e["ts"] <= self.edge_ttl]
+
+    def import_edges(self, edges):
+        now = time.time()
+        for src, dst, rate, source, ts in edges:
+            if now - ts <= self.edge_ttl:
+                self.update_rate(src, dst, rate, source, ts)
+
+    def edge(self, src: str, dst: str):
+        with self._lock:
+            e = (self._adj.get(src) or {}).get(dst)
+            return dict(e) if e else None
+
+    def size(self):
+        with self._lock:
+            return len(self._adj), sum(len(r) for r in self._adj.values())
+
+    # ---------- поиск циклов ----------
+    def _bounded_paths(self, adj, start, max_hops):
+        """Bellman-Ford с ограничением числа рёбер: dist[k][node] — минимальный вес пути
+        start->node ровно из k рёбер; pred[k][node] — предыдущая вершина."""
+        dist = [{start: 0.0}]
+        pred = [{}]
+        for _ in range(max_hops):
+            prev = dist[-1]
+            cur, cur_pred = {}, {}
+            for u, du in prev.items():
+                for v, e in (adj.get(u) or {}).items():
+                    nd = du + e["w"]
+                    if nd < cur.get(v, INF):
+                        cur[v] = nd
+                        cur_pred[v] = u
+            dist.append(cur)
+            pred.append(cur_pred)
+            if not cur:
+                break
+        return dist, pred
+
+    @staticmethod
+    def _walk(pred, k, node, start):
+        path = [node]
+        while k > 0:
+            node = pred[k][node]
+            path.append(node)
+            k -= 1
+        if path[-1] != start:
+            return None
+        path.reverse()
+        return path
+
+    def find_cycles(self, min_profit: float = 0.0, anchors=None, full: bool = False):
+        """
+        Возвращает список циклов [{"path": [a, b, c, a], "profit": доля, "weight": w, "rates": [...]}],
+        отсортированных по убыванию прибыли. anchors — допустимые стартовые токены (базовые);
+        цикл поворачивается так, чтобы начинаться с первого найденного якоря.
+        full=True — проверить все рёбра, а не только изменённые.
+        """
+        threshold = -math.log(1.0 + min_profit)
+        now = time.time()
+        with self._lock:
+            adj = {}
+            for src, row in self._adj.items():
+                live = {dst: dict(e) for dst, e in row.items() if now - e["ts"] <= self.edge_ttl}
+                if live:
+                    adj[src] = live
+            if full:
+                dirty = {(s, d) for s, row in adj.items() for d in row}
+            else:
+                dirty = {(s, d) for (s, d) in self._dirty if d in (adj.get(s) or {})}
+            self._dirty.clear()
+
+        by_head = {}
+        for u, v in dirty:
+            by_head.setdefault(v, []).append(u)
+
+        found = {}
+        for v, tails in by_head.items():
+            dist, pred = self._bounded_paths(adj, v, self.max_len - 1)
+            for u in tails:
+                w_uv = adj[u][v]["w"]
+                for k in range(1, len(dist)):
+                    du = dist[k].get(u)
+                    if du is None:
+                        continue
+                    total = w_uv + du
+                    if total >= threshold:
+                        continue
+                    tail = self._walk(pred, k, u, v)
+                    if not tail:
+                        continue
+                    nodes = [u] + tail  # u -> v -> ... -> u
+                    cyc = nodes[:-1]
+                    if len(set(cyc)) != len(cyc):
+                        continue  # не простой цикл
+                    cyc = self._rotate(cyc, anchors)
+                    if cyc is None:
+                        continue
+                    key = tuple(cyc)
+                    if key in found and found[key]["weight"] <= total:
+                        continue
+                    path = cyc + [cyc[0]]
+                    found[key] = {
+                        "path": path,
+                        "weight": total,
+                        "profit": math.exp(-total) - 1.0,
+                        "rates": [adj[a][b]["rate"] for a, b in zip(path, path[1:])],
+                        "sources": [adj[a][b]["source"] for a, b in zip(path, path[1:])],
+                    }
+        return sorted(found.values(), key=lambda c: c["weight"])
+
+    @staticmethod
+    def _rotate(cyc, anchors):
+        if not anchors:
+            i = cyc.index(min(cyc))
+            return cyc[i:] + cyc[:i]
+        for a in anchors:
+            if a in cyc:
+                i = cyc.index(a)
+                return cyc[i:] + cyc[:i]
+        return None
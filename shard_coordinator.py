@@ -0,0 +1,139 @@
+# shard_coordinator.py
+"""
+Координатор шардированного режима (несколько процессов-воркеров на одной машине).
+
+  * shard_of()      — стабильный хеш пары (base, token) -> номер шарда;
+  * Coordinator     — общий SQLite-файл для всех воркеров:
+      - rate_budget   общий token bucket на запросы к провайдерам,
+      - pair_locks    единая таблица банов/охлаждений и «захвата» сигнала по паре,
+      - shard_stats   пульс воркеров (циклы, проверено пар, длительность цикла) для отчёта.
+Каждая операция — короткая транзакция BEGIN IMMEDIATE, поэтому атомарна между процессами.
+"""
+import os
+import time
+import sqlite3
+import threading
+import zlib
+
+
+def shard_of(key, shard_count: int) -> int:
+    """Стабильный (между процессами и перезапусками) номер шарда для ключа пары/маршрута."""
+    if shard_count <= 1:
+        return 0
+    raw = "|".join(str(k) for k in key) if isinstance(key, (tuple, list)) else str(key)
+    return zlib.crc32(raw.encode("utf-8")) % shard_count
+
+
+def _key_str(key) -> str:
+    return "->".join(str(k) for k in key) if isinstance(key, (tuple, list)) else str(key)
+
+
+class Coordinator:
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+        CREATE TABLE IF NOT EXISTS rate_budget (
+            name TEXT PRIMARY KEY, tokens REAL, ts REAL
+        );
+        CREATE TABLE IF NOT EXISTS pair_locks (
+            key TEXT PRIMARY KEY, until REAL, reason TEXT, duration INTEGER, shard INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS shard_stats (
+            shard INTEGER PRIMARY KEY, pid INTEGER, ts REAL, cycles INTEGER,
+            checked INTEGER, signals INTEGER, last_cycle_sec REAL, pairs INTEGER
+        );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _tx(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            res = fn(conn)
+            conn.execute("COMMIT")
+            return res
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- общий бюджет запросов ----------
+    def acquire(self, name: str, rate: float, burst: float = 1.0):
+        """Блокирует, пока в общем ведре `name` не появится токен (rate токенов/сек на все процессы)."""
+        rate = max(rate, 1e-6)
+        while True:
+            def take(conn):
+                now = time.time()
+                row = conn.execute("SELECT tokens, ts FROM rate_budget WHERE name=?", (name,)).fetchone()
+                tokens, ts = (row if row else (burst, now))
+                tokens = min(burst, tokens + (now - ts) * rate)
+                if tokens >= 1.0:
+                    conn.execute("INSERT OR REPLACE INTO rate_budget(name, tokens, ts) VALUES (?,?,?)",
+                                 (name, tokens - 1.0, now))
+                    return 0.0
+                conn.execute("INSERT OR REPLACE INTO rate_budget(name, tokens, ts) VALUES (?,?,?)",
+                             (name, tokens, now))
+                return (1.0 - tokens) / rate
+            wait = self._tx(take)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    # ---------- баны / охлаждения / сигналы ----------
+    def ban(self, key, reason: str, duration: int, shard: int = 0):
+        until = time.time() + duration
+        self._tx(lambda c: c.execute(
+            "INSERT OR REPLACE INTO pair_locks(key, until, reason, duration, shard) VALUES (?,?,?,?,?)",
+            (_key_str(key), until, reason, int(duration), shard)))
+
+    def get_ban(self, key):
+        """(reason, seconds_left) активного бана или None."""
+        row = self._conn().execute("SELECT until, reason FROM pair_locks WHERE key=?", (_key_str(key),)).fetchone()
+        if not row:
+            return None
+        left = row[0] - time.time()
+        return (row[1], int(left)) if left > 0 else None
+
+    def claim_signal(self, key, cooldown: int, shard: int = 0) -> bool:
+        """Атомарно: если пара не в бане/охлаждении — ставим охлаждение и возвращаем True."""
+        k = _key_str(key)
+        def claim(conn):
+            now = time.time()
+            row = conn.execute("SELECT until FROM pair_locks WHERE key=?", (k,)).fetchone()
+            if row and row[0] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO pair_locks(key, until, reason, duration, shard) VALUES (?,?,?,?,?)",
+                (k, now + cooldown, "Post-trade cooldown", int(cooldown), shard))
+            return True
+        return self._tx(claim)
+
+    def active_bans(self):
+        now = time.time()
+        rows = self._conn().execute("SELECT key, until, reason, duration FROM pair_locks WHERE until > ?", (now,))
+        return {r[0]: {"time": r[1] - r[3], "reason": r[2], "duration": r[3]} for r in rows}
+
+    def purge_expired(self):
+        self._tx(lambda c: c.execute("DELETE FROM pair_locks WHERE until <= ?", (time.time(),)))
+
+    # ---------- метрики шардов ----------
+    def heartbeat(self, shard: int, cycles: int, checked: int, signals: int, last_cycle_sec: float, pairs: int):
+        self._tx(lambda c: c.execute(
+            "INSERT OR REPLACE INTO shard_stats(shard, pid, ts, cycles, checked, signals, last_cycle_sec, pairs) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (shard, os.getpid(), time.time(), cycles, checked, signals, last_cycle_sec, pairs)))
+
+    def shard_stats(self):
+        rows = self._conn().execute(
+            "SELECT shard, pid, ts, cycles, checked, signals, last_cycle_sec, pairs FROM shard_stats ORDER BY shard")
+        cols = ("shard", "pid", "ts", "cycles", "checked", "signals", "last_cycle_sec", "pairs")
+        return [dict(zip(cols, r)) for r in rows]
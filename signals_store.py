@@ -0,0 +1,132 @@
+# signals_store.py
+"""
+Обслуживание signals.db: индексы, помесячный архив и инкрементальная очистка.
+
+  * ensure_schema_extras() — индексы (ts), (base, token, ts), (outcome) и auto_vacuum=INCREMENTAL;
+  * compact() — строки старше retention_days (и уже размеченные, outcome != -1) переносятся
+    в помесячные сжатые файлы <archive_dir>/signals_YYYY-MM.jsonl.gz, удаляются из «горячей»
+    таблицы пачками, после чего освобождённые страницы отдаются через incremental_vacuum;
+  * iter_archive() — чтение архивных месяцев (для обучения/бэктеста на полной истории).
+Горячая таблица остаётся ограниченной по размеру, поэтому запись и выборки не деградируют.
+
+  python signals_store.py --db signals.db --retention-days 90 --archive-dir signals_archive
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import argparse
+import datetime as dt
+
+INDEXES = (
+    ("idx_signals_ts", "signals(ts)"),
+    ("idx_signals_pair_ts", "signals(base, token, ts)"),
+    ("idx_signals_outcome", "signals(outcome)"),
+)
+
+
+def ensure_schema_extras(conn: sqlite3.Connection):
+    for name, target in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.commit()
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """auto_vacuum=INCREMENTAL; для существующей базы требуется один полный VACUUM (True — если он был)."""
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    has_tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table'").fetchone()[0]
+    if has_tables:
+        conn.commit()
+        conn.execute("VACUUM")
+        return True
+    return False
+
+
+def _month_of(ts) -> str:
+    s = str(ts or "")
+    return s[:7] if len(s) >= 7 and s[4] == "-" else "unknown"
+
+
+def compact(db_path: str, retention_days: float = 90, archive_dir: str = "signals_archive",
+            batch: int = 5000, vacuum_pages: int = 2000, keep_pending: bool = True):
+    """
+    Переносит старые строки в архив и чистит место. Возвращает dict со статистикой.
+    keep_pending=True — неразмеченные (outcome=-1) строки не архивируются, их ещё может дописать монитор.
+    """
+    t0 = time.time()
+    cutoff = (dt.datetime.now() - dt.timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(archive_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    stats = {"archived": 0, "months": set(), "vacuumed_pages": 0, "full_vacuum": False}
+    try:
+        ensure_schema_extras(conn)
+        stats["full_vacuum"] = enable_incremental_vacuum(conn)
+        where = "ts < ?" + (" AND outcome != -1" if keep_pending else "")
+        while True:
+            rows = conn.execute(f"SELECT * FROM signals WHERE {where} ORDER BY id LIMIT ?", (cutoff, batch)).fetchall()
+            if not rows:
+                break
+            by_month = {}
+            for r in rows:
+                by_month.setdefault(_month_of(r["ts"]), []).append(dict(r))
+            for month, items in by_month.items():
+                path = os.path.join(archive_dir, f"signals_{month}.jsonl.gz")
+                # каждый вызов дописывает отдельный gzip-member — формат остаётся валидным
+                with gzip.open(path, "at", encoding="utf-8") as f:
+                    for item in items:
+                        f.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n")
+                stats["months"].add(month)
+            conn.executemany("DELETE FROM signals WHERE id = ?", [(r["id"],) for r in rows])
+            conn.commit()
+            stats["archived"] += len(rows)
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free:
+            # pragma освобождает по странице на каждый шаг — результат нужно дочитать
+            conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+            conn.commit()
+            stats["vacuumed_pages"] = free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    stats["months"] = sorted(stats["months"])
+    stats["sec"] = time.time() - t0
+    return stats
+
+
+def iter_archive(archive_dir: str = "signals_archive", months=None):
+    """Строки архива (dict) по месяцам в хронологическом порядке; months — список 'YYYY-MM' или None."""
+    if not os.path.isdir(archive_dir):
+        return
+    for name in sorted(os.listdir(archive_dir)):
+        if not (name.startswith("signals_") and name.endswith(".jsonl.gz")):
+            continue
+        month = name[len("signals_"):-len(".jsonl.gz")]
+        if months and month not in months:
+            continue
+        with gzip.open(os.path.join(archive_dir, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main():
+    p = argparse.ArgumentParser(description="signals.db retention / compaction")
+    p.add_argument("--db", default="signals.db")
+    p.add_argument("--retention-days", type=float, default=90)
+    p.add_argument("--archive-dir", default="signals_archive")
+    p.add_argument("--batch", type=int, default=5000)
+    p.add_argument("--vacuum-pages", type=int, default=2000)
+    p.add_argument("--include-pending", action="store_true", help="Archive unlabelled (outcome=-1) rows too")
+    args = p.parse_args()
+    st = compact(args.db, args.retention_days, args.archive_dir, args.batch, args.vacuum_pages,
+                 keep_pending=not args.include_pending)
+    print(f"Archived {st['archived']} rows into {st['months'] or '-'}; freed {st['vacuumed_pages']} pages"
+          f"{' (one-time full VACUUM)' if st['full_vacuum'] else ''} in {st['sec']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# singleflight.py
+"""
+Single-flight: одновременные одинаковые запросы выполняются один раз.
+
+Первый вызов с ключом key запускает fn(), остальные (потоки или корутины), пришедшие,
+пока он в полёте, ждут и получают тот же результат (или то же исключение).
+Кэширования нет — после завершения следующий вызов снова идёт в сеть.
+
+  SF = SingleFlight("quote")
+  q = SF.do(("USDT", "WETH", 10**6), quote_fn, "USDT", "WETH", 10**6)        # потоки
+  q = await SF.do_async(("USDT", "WETH", 10**6), quote_coro_fn, ...)         # asyncio
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str = "", clone=None):
+        """clone(result) — копия результата для ждущих вызовов (если вызывающие его модифицируют)."""
+        self.name = name
+        self.clone = clone
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}   # (loop id, key) -> asyncio.Future
+        self.calls = 0           # всего обращений
+        self.executed = 0        # реально выполненных
+        self.shared = 0          # получили чужой результат
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return self.clone(call.result) if self.clone else call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        akey = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+            fut = self._async_calls.get(akey)
+            leader = fut is None
+            if leader:
+                fut = loop.create_future()
+                self._async_calls[akey] = fut
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            res = await asyncio.shield(fut)
+            return self.clone(res) if self.clone else res
+        try:
+            res = await coro_fn(*args, **kwargs)
+            fut.set_result(res)
+            return res
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # помечаем как полученное, если ждущих нет
+            raise
+        finally:
+            with self._lock:
+                self._async_calls.pop(akey, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "calls": self.calls, "executed": self.executed, "shared": self.shared,
+                    "in_flight": len(self._calls) + len(self._async_calls)}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = self.executed = self.shared = 0
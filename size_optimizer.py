@@ -0,0 +1,61 @@
+# size_optimizer.py
+"""
+Подбор оптимального объёма входа вместо фиксированного SELL_AMOUNT_USD.
+
+Модель круга base->token->base через пулы глубиной D (USD на сторону пула):
+    r(x) = edge * (D / (D + x)) ** 2
+edge — множитель круга при нулевом объёме, восстанавливается по наблюдённому
+r0 = exit/entry на размере x0. Чистый PnL в USD:
+    pnl(x) = x * (r(x) - 1 - cost),  cost = 2*DEX_FEE + SLIPPAGE
+Все кандидаты считаются одной матрицей (кандидаты × сетка размеров).
+"""
+import numpy as np
+
+
+def depth_from_liquidity(liquidity_usd):
+    """Глубина одной стороны пула по полной ликвидности Dexscreener."""
+    return np.asarray(liquidity_usd, dtype=float) / 2.0
+
+
+def depth_from_quotes(x1, r1, x2, r2):
+    """
+    Глубина по двум котировкам круга (x1 < x2, r = exit/entry).
+    Из r1/r2 = ((D + x2) / (D + x1)) ** 2 получаем D; NaN, если импакта не видно.
+    """
+    x1, r1, x2, r2 = (np.asarray(v, dtype=float) for v in (x1, r1, x2, r2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.sqrt(r1 / r2)
+        d = (s * x1 - x2) / (1.0 - s)
+    return np.where((r1 > r2) & np.isfinite(d) & (d > 0), d, np.nan)
+
+
+def optimise_sizes(r0, depth, x0, cost, min_size=10.0, max_size=10_000.0, grid=64):
+    """
+    r0    — наблюдённый множитель круга на размере x0 (exit/entry), shape (n,)
+    depth — глубина пула в USD, shape (n,)
+    x0    — размер, на котором получен r0 (скаляр или (n,))
+    cost  — комиссии+проскальзывание в долях (скаляр)
+    Возвращает (best_size, best_pnl_usd, best_pnl_pct) — массивы shape (n,).
+    Для кандидатов без глубины или с отрицательным PnL на всей сетке — NaN / 0.
+    """
+    r0 = np.atleast_1d(np.asarray(r0, dtype=float))
+    depth = np.atleast_1d(np.asarray(depth, dtype=float))
+    x0 = np.broadcast_to(np.asarray(x0, dtype=float), r0.shape)
+
+    sizes = np.geomspace(min_size, max_size, int(grid))[None, :]     # (1, m)
+    d = depth[:, None]                                               # (n, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        edge = r0[:, None] * ((d + x0[:, None]) / d) ** 2
+        r = edge * (d / (d + sizes)) ** 2
+        pnl = sizes * (r - 1.0 - cost)                               # (n, m)
+    pnl = np.where(np.isfinite(pnl), pnl, -np.inf)
+
+    idx = np.argmax(pnl, axis=1)
+    rows = np.arange(len(r0))
+    best_pnl = pnl[rows, idx]
+    best_size = sizes[0, idx]
+    ok = np.isfinite(best_pnl) & (best_pnl > 0) & (depth > 0)
+    best_size = np.where(ok, best_size, np.nan)
+    best_pnl = np.where(ok, best_pnl, 0.0)
+    best_pct = np.where(ok, best_pnl / best_size * 100.0, 0.0)
+    return best_size, best_pnl, best_pct
@@ -0,0 +1,150 @@
+# state_snapshot.py
+"""
+Тёплый перезапуск: снимок состояния сканера на диск и восстановление при старте.
+
+  * кольцевые буферы пар (PAIR_BUFFERS) — в memory-mapped файле <prefix>.buffers:
+    фиксированные слоты [ключ пары | длина | поля × BUFFER_LEN float64], запись — in-place
+    без пересоздания файла;
+  * остальное (баны, охлаждения, открытые позиции мониторов, кэши) — компактный JSON
+    <prefix>.json, запись атомарная (tmp + os.replace).
+Просроченные записи (баны, позиции, устаревшие буферы) при восстановлении пропускаются.
+"""
+import os
+import json
+import mmap
+import time
+import struct
+from collections import deque
+
+MAGIC = b"PBUF1\0\0\0"
+HEADER = struct.Struct("<8sIII")      # magic, buffer_len, n_fields, n_slots
+KEY_BYTES = 64
+SLOT_HEAD = struct.Struct(f"<{KEY_BYTES}sI")  # key, count
+FIELDS = ("price", "vol", "buys", "sells", "ts")
+
+
+def _slot_size(buffer_len):
+    return SLOT_HEAD.size + 8 * buffer_len * len(FIELDS)
+
+
+def _key_to_str(key) -> str:
+    return "->".join(key) if isinstance(key, (tuple, list)) else str(key)
+
+
+def _str_to_key(s: str):
+    return tuple(s.split("->"))
+
+
+class RingBufferFile:
+    """mmap-файл с фиксированными слотами под кольцевые буферы пар."""
+
+    def __init__(self, path: str, buffer_len: int):
+        self.path = path
+        self.buffer_len = buffer_len
+        self.slot_size = _slot_size(buffer_len)
+        self._slot_fmt = struct.Struct(f"<{buffer_len}d")
+
+    def write(self, buffers: dict) -> int:
+        """Переписывает слоты содержимым buffers; файл растёт только при появлении новых пар."""
+        items = [(k, v) for k, v in buffers.items() if len(_key_to_str(k).encode("utf-8")) <= KEY_BYTES]
+        n = len(items)
+        size = HEADER.size + n * self.slot_size
+        mode = "r+b" if os.path.exists(self.path) else "w+b"
+        with open(self.path, mode) as f:
+            f.truncate(max(size, HEADER.size + self.slot_size))
+            with mmap.mmap(f.fileno(), 0) as mm:
+                mm[0:HEADER.size] = HEADER.pack(MAGIC, self.buffer_len, len(FIELDS), n)
+                off = HEADER.size
+                for key, buf in items:
+                    count = min(len(buf["ts"]), self.buffer_len)
+                    mm[off:off + SLOT_HEAD.size] = SLOT_HEAD.pack(_key_to_str(key).encode("utf-8"), count)
+                    pos = off + SLOT_HEAD.size
+                    for field in FIELDS:
+                        vals = list(buf[field])[-count:] if count else []
+                        vals = [float(x) for x in vals] + [0.0] * (self.buffer_len - count)
+                        mm[pos:pos + self._slot_fmt.size] = self._slot_fmt.pack(*vals)
+                        pos += self._slot_fmt.size
+                    off += self.slot_size
+                mm.flush()
+        return size
+
+    def read(self, max_age: float = None) -> dict:
+        """{key: {field: deque}} — буферы, чей последний ts не старше max_age секунд."""
+        out = {}
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            return out
+        now = time.time()
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, blen, nf, n = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or nf != len(FIELDS):
+                    return out
+                slot_size = _slot_size(blen)
+                fmt = struct.Struct(f"<{blen}d")
+                keep = min(blen, self.buffer_len)
+                for i in range(n):
+                    off = HEADER.size + i * slot_size
+                    raw_key, count = SLOT_HEAD.unpack_from(mm, off)
+                    pos = off + SLOT_HEAD.size
+                    cols = {}
+                    for field in FIELDS:
+                        cols[field] = fmt.unpack_from(mm, pos)[:count]
+                        pos += fmt.size
+                    if not count or (max_age and now - cols["ts"][-1] > max_age):
+                        continue
+                    key = _str_to_key(raw_key.rstrip(b"\0").decode("utf-8"))
+                    out[key] = {field: deque(cols[field][-keep:], maxlen=self.buffer_len) for field in FIELDS}
+        return out
+
+
+def _write_json_atomic(path: str, payload: dict) -> int:
+    tmp = path + ".tmp"
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def save_state(prefix: str, buffers: dict, buffer_len: int, bans: dict, positions: list, caches: dict = None):
+    """Пишет снимок; возвращает (байт всего, секунд)."""
+    t0 = time.time()
+    size = RingBufferFile(prefix + ".buffers", buffer_len).write(buffers)
+    size += _write_json_atomic(prefix + ".json", {
+        "saved_at": time.time(),
+        "bans": [[_key_to_str(k), v["time"], v["reason"], v["duration"]] for k, v in bans.items()],
+        "positions": positions,
+        "caches": caches or {},
+    })
+    return size, time.time() - t0
+
+
+def load_state(prefix: str, buffer_len: int, buffer_max_age: float, hold_seconds: float):
+    """
+    Возвращает dict: buffers, bans, positions, caches, restore_sec, snapshot_bytes, skipped.
+    Баны с истёкшим сроком, позиции с истёкшим удержанием и старые буферы отбрасываются.
+    """
+    t0 = time.time()
+    res = {"buffers": {}, "bans": {}, "positions": [], "caches": {}, "skipped": 0, "snapshot_bytes": 0}
+    jpath, bpath = prefix + ".json", prefix + ".buffers"
+    for p in (jpath, bpath):
+        if os.path.exists(p):
+            res["snapshot_bytes"] += os.path.getsize(p)
+    res["buffers"] = RingBufferFile(bpath, buffer_len).read(max_age=buffer_max_age)
+    if os.path.exists(jpath):
+        with open(jpath, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        now = time.time()
+        for key, ts, reason, duration in payload.get("bans", []):
+            if now - ts < duration:
+                res["bans"][_str_to_key(key)] = {"time": ts, "reason": reason, "duration": duration}
+            else:
+                res["skipped"] += 1
+        for pos in payload.get("positions", []):
+            if now - pos.get("started_at", 0) < hold_seconds:
+                res["positions"].append(pos)
+            else:
+                res["skipped"] += 1
+        res["caches"] = payload.get("caches") or {}
+    res["restore_sec"] = time.time() - t0
+    return res
@@ -0,0 +1,51 @@
+# tests/test_round_trip_singleflight.py
+"""Круговая котировка через single-flight: ждущий вызов получает ту же тройку, что и ведущий."""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ALCHEMY_POLYGON_RPC", "http://127.0.0.1:1")
+
+import main  # noqa: E402
+
+
+def test_concurrent_waiter_gets_round_trip_triple(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_round_trip(base_symbol, token_symbol, amount_units):
+        calls.append((base_symbol, token_symbol, amount_units))
+        started.set()
+        release.wait(5)
+        return ({"buyAmount": "100", "source": "stub"}, {"buyAmount": "101", "source": "stub"}, ["r"])
+
+    monkeypatch.setattr(main, "_quote_round_trip", slow_round_trip)
+    results, errors = [None, None], []
+
+    def run(i):
+        try:
+            results[i] = main.quote_round_trip("USDT", "LINK", 10 ** 6)
+        except Exception as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=run, args=(0,))
+    leader.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=run, args=(1,))
+    waiter.start()
+    deadline = time.time() + 5
+    while main.SF_ROUND_TRIP.shared == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert errors == []
+    assert len(calls) == 1
+    q_in, q_out, reasons = results[1]
+    assert (q_in["buyAmount"], q_out["buyAmount"], reasons) == ("100", "101", ["r"])
+    # ждущий получает копии: правка его результата не видна ведущему
+    q_in["source"] = "changed"
+    assert results[0][0]["source"] == "stub"
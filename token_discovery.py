@@ -0,0 +1,267 @@
+# token_discovery.py
+"""
+Автоматическое расширение списка токенов: кандидаты из PairCreated фабрики QuickSwap
+и из Dexscreener, инкрементальный индекс пар по ликвидности/объёму, топ-N — сканеру.
+
+Работа за один refresh() ограничена:
+  * логи PairCreated — не больше blocks_per_cycle блоков (курсор last_block хранится в индексе);
+  * Dexscreener — не больше ds_batches батчей по 30 адресов (сначала самые давно обновлённые токены);
+  * decimals — одним Multicall3.aggregate3 на decimals_batch токенов.
+Индекс сохраняется в JSON (атомарно), поэтому после перезапуска сканирование продолжается с курсора.
+"""
+import os
+import json
+import math
+import time
+import threading
+
+PAIR_CREATED_TOPIC = "0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9"
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+DEXSCREENER_TOKEN_URL = "https://api.dexscreener.com/latest/dex/tokens/"
+DECIMALS_SELECTOR = bytes.fromhex("313ce567")
+DS_BATCH = 30  # лимит адресов в одном запросе /latest/dex/tokens/a,b,c
+
+MULTICALL3_ABI = [{
+    "name": "aggregate3",
+    "type": "function",
+    "stateMutability": "payable",
+    "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+        {"name": "target", "type": "address"},
+        {"name": "allowFailure", "type": "bool"},
+        {"name": "callData", "type": "bytes"},
+    ]}],
+    "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+        {"name": "success", "type": "bool"},
+        {"name": "returnData", "type": "bytes"},
+    ]}],
+}]
+
+
+def _topic_to_addr(topic) -> str:
+    raw = topic.hex() if hasattr(topic, "hex") else str(topic)
+    raw = raw[2:] if raw.startswith("0x") else raw
+    return "0x" + raw[-40:].lower()
+
+
+def pair_score(liquidity_usd: float, volume_h24: float) -> float:
+    """Рейтинг пары: среднее геометрическое ликвидности и суточного объёма (в USD)."""
+    return math.sqrt(max(0.0, liquidity_usd or 0.0) * max(0.0, volume_h24 or 0.0))
+
+
+class TokenDiscovery:
+    def __init__(self, anchors: dict, w3=None, factory: str = None, http_get=None,
+                 index_path: str = "discovery_index.json", blocks_per_cycle: int = 20000,
+                 log_chunk: int = 2000, ds_batches: int = 3, decimals_batch: int = 100,
+                 min_liq_usd: float = 50000.0, min_vol_usd: float = 10000.0, ds_ttl: float = 900.0,
+                 start_block: int = None, ds_url: str = DEXSCREENER_TOKEN_URL):
+        """
+        anchors   — {symbol: address} базовых токенов: интересны только пары token/anchor;
+        w3        — web3.Web3 (логи и Multicall3), None — только Dexscreener;
+        http_get  — url -> json|None (с общим pace_requests вызывающей стороны).
+        """
+        self.anchors = {a.lower(): s for s, a in anchors.items()}
+        self.w3 = w3
+        self.factory = factory
+        self.http_get = http_get
+        self.index_path = index_path
+        self.blocks_per_cycle = blocks_per_cycle
+        self.log_chunk = log_chunk
+        self.ds_batches = ds_batches
+        self.decimals_batch = decimals_batch
+        self.min_liq_usd = min_liq_usd
+        self.min_vol_usd = min_vol_usd
+        self.ds_ttl = ds_ttl
+        self.start_block = start_block
+        self.ds_url = ds_url
+        self._lock = threading.Lock()
+        self.last_block = None
+        # address -> {"symbol", "decimals", "ds_ts", "seen"}
+        self.tokens = {}
+        # pair address -> {"token", "anchor", "dex", "liq", "vol", "score", "ts"}
+        self.pairs = {}
+        self.last_stats = {}
+        self._anchor_ts = {}   # anchor -> время последнего запроса его пар в Dexscreener
+        self.load()
+
+    # ---------- персистентность ----------
+    def load(self):
+        """Читает индекс с диска (другие шарды так подхватывают результат шарда 0)."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with self._lock:
+                self.last_block = data.get("last_block")
+                self.tokens = data.get("tokens") or {}
+                self.pairs = data.get("pairs") or {}
+        except Exception:
+            pass
+
+    def save(self):
+        if not self.index_path:
+            return
+        with self._lock:
+            payload = {"last_block": self.last_block, "tokens": self.tokens, "pairs": self.pairs}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    # ---------- источники кандидатов ----------
+    def add_candidate(self, addr: str, symbol: str = None):
+        addr = addr.lower()
+        if addr in self.anchors:
+            return False
+        with self._lock:
+            t = self.tokens.get(addr)
+            if t is None:
+                self.tokens[addr] = {"symbol": symbol, "decimals": None, "ds_ts": 0.0, "seen": time.time()}
+                return True
+            if symbol and not t.get("symbol"):
+                t["symbol"] = symbol
+        return False
+
+    def scan_pair_created(self) -> int:
+        """Новые PairCreated не дальше blocks_per_cycle блоков от курсора; возвращает число новых токенов."""
+        if self.w3 is None or not self.factory:
+            return 0
+        head = self.w3.eth.block_number
+        if self.last_block is None:
+            self.last_block = self.start_block if self.start_block is not None else max(0, head - self.blocks_per_cycle)
+        frm = self.last_block + 1
+        to = min(head, self.last_block + self.blocks_per_cycle)
+        added = 0
+        while frm <= to:
+            chunk_to = min(to, frm + self.log_chunk - 1)
+            logs = self.w3.eth.get_logs({"fromBlock": frm, "toBlock": chunk_to, "address": self.factory,
+                                         "topics": [PAIR_CREATED_TOPIC]})
+            for lg in logs:
+                t0, t1 = _topic_to_addr(lg["topics"][1]), _topic_to_addr(lg["topics"][2])
+                # кандидат — только токен в паре с одним из базовых
+                if t0 in self.anchors and t1 not in self.anchors:
+                    added += self.add_candidate(t1)
+                elif t1 in self.anchors and t0 not in self.anchors:
+                    added += self.add_candidate(t0)
+            self.last_block = chunk_to
+            frm = chunk_to + 1
+        return added
+
+    def refresh_dexscreener(self, base_url: str = None) -> int:
+        """
+        Обновляет пары самых давно не обновлявшихся токенов; не больше ds_batches запросов.
+        Сами базовые токены тоже запрашиваются (раз в ds_ttl): их самые ликвидные пары — источник
+        кандидатов без логов фабрики.
+        """
+        if self.http_get is None:
+            return 0
+        base_url = base_url or self.ds_url
+        now = time.time()
+        anchors = [a for a in self.anchors if now - self._anchor_ts.get(a, 0.0) >= self.ds_ttl]
+        with self._lock:
+            stale = sorted((t["ds_ts"], a) for a, t in self.tokens.items() if now - t["ds_ts"] >= self.ds_ttl)
+        todo = (anchors + [a for _, a in stale])[:self.ds_batches * DS_BATCH]
+        requests_made = 0
+        for i in range(0, len(todo), DS_BATCH):
+            batch = todo[i:i + DS_BATCH]
+            data = self.http_get(base_url + ",".join(batch))
+            requests_made += 1
+            with self._lock:
+                for a in batch:
+                    if a in self.anchors:
+                        self._anchor_ts[a] = now
+                    else:
+                        self.tokens[a]["ds_ts"] = now
+                for p in (data or {}).get("pairs") or []:
+                    self._ingest_ds_pair(p, now)
+        return requests_made
+
+    def _ingest_ds_pair(self, p: dict, now: float):
+        b = ((p.get("baseToken") or {}).get("address") or "").lower()
+        q = ((p.get("quoteToken") or {}).get("address") or "").lower()
+        if q in self.anchors and b not in self.anchors:
+            token, anchor, sym = b, q, (p.get("baseToken") or {}).get("symbol")
+        elif b in self.anchors and q not in self.anchors:
+            token, anchor, sym = q, b, (p.get("quoteToken") or {}).get("symbol")
+        else:
+            return
+        pair_addr = (p.get("pairAddress") or "").lower()
+        if not pair_addr:
+            return
+        liq = float((p.get("liquidity") or {}).get("usd") or 0.0)
+        vol = float((p.get("volume") or {}).get("h24") or 0.0)
+        if token not in self.tokens:
+            self.tokens[token] = {"symbol": sym, "decimals": None, "ds_ts": now, "seen": now}
+        elif sym and not self.tokens[token].get("symbol"):
+            self.tokens[token]["symbol"] = sym
+        self.pairs[pair_addr] = {"token": token, "anchor": anchor, "dex": p.get("dexId"),
+                                 "liq": liq, "vol": vol, "score": pair_score(liq, vol), "ts": now}
+
+    def resolve_decimals(self) -> int:
+        """decimals() для неразрешённых токенов из индекса — одним Multicall3 на decimals_batch адресов."""
+        if self.w3 is None:
+            return 0
+        with self._lock:
+            score = {}
+            for p in self.pairs.values():
+                score[p["token"]] = max(score.get(p["token"], 0.0), p["score"])
+            ranked = sorted(score, key=lambda a: -score[a])
+            todo = [a for a in ranked if self.tokens.get(a, {}).get("decimals") is None][:self.decimals_batch]
+        if not todo:
+            return 0
+        from web3 import Web3
+        mc = self.w3.eth.contract(address=Web3.to_checksum_address(MULTICALL3), abi=MULTICALL3_ABI)
+        calls = [(Web3.to_checksum_address(a), True, DECIMALS_SELECTOR) for a in todo]
+        res = mc.functions.aggregate3(calls).call()
+        resolved = 0
+        with self._lock:
+            for a, (ok, ret) in zip(todo, res):
+                if ok and len(ret) >= 32:
+                    dec = int.from_bytes(bytes(ret[:32]), "big")
+                    if 0 <= dec <= 36:
+                        self.tokens[a]["decimals"] = dec
+                        resolved += 1
+                        continue
+                self.tokens[a]["decimals"] = -1  # не ERC-20 / ошибка — больше не пробуем
+        return resolved
+
+    # ---------- результат ----------
+    def top_pairs(self, n: int, max_age: float = None):
+        """Лучшие n пар (по одной на токен): [{"address", "symbol", "decimals", "anchor", "liq", "vol", "score"}]."""
+        now = time.time()
+        best = {}
+        with self._lock:
+            for p in self.pairs.values():
+                if p["liq"] < self.min_liq_usd or p["vol"] < self.min_vol_usd:
+                    continue
+                if max_age and now - p["ts"] > max_age:
+                    continue
+                t = self.tokens.get(p["token"]) or {}
+                dec = t.get("decimals")
+                if dec is None or dec < 0:
+                    continue
+                cur = best.get(p["token"])
+                if cur is None or p["score"] > cur["score"]:
+                    best[p["token"]] = {"address": p["token"], "symbol": t.get("symbol") or p["token"][:8],
+                                        "decimals": dec, "anchor": self.anchors[p["anchor"]],
+                                        "liq": p["liq"], "vol": p["vol"], "score": p["score"]}
+        return sorted(best.values(), key=lambda r: -r["score"])[:n]
+
+    def refresh(self):
+        """Один ограниченный по работе шаг: логи -> Dexscreener -> decimals -> сохранение."""
+        t0 = time.time()
+        st = {"new_tokens": 0, "ds_requests": 0, "decimals": 0, "errors": []}
+        for name, fn in (("new_tokens", self.scan_pair_created), ("ds_requests", self.refresh_dexscreener),
+                         ("decimals", self.resolve_decimals)):
+            try:
+                st[name] = fn()
+            except Exception as e:
+                st["errors"].append(f"{name}: {repr(e)}")
+        try:
+            self.save()
+        except Exception as e:
+            st["errors"].append(f"save: {repr(e)}")
+        st["tokens"], st["pairs"] = len(self.tokens), len(self.pairs)
+        st["sec"] = time.time() - t0
+        self.last_stats = st
+        return st
@@ -0,0 +1,173 @@
+# token_registry.py
+"""
+Единый реестр токенов и пар для всех подсистем (main.py, pipeline_web3.py, discovery).
+
+  * токенам и парам выдаются плотные целые id (id пары стабилен: не переиспользуется);
+  * статические данные пары считаются один раз: адреса (lower и checksum), множители 10**decimals,
+    объём входа в units базового токена, подписи;
+  * TOKENS / DECIMALS / ADDRESS_TO_SYMBOL / CHECKSUM — «живые» словари для старого кода,
+    реестр обновляет их сам при add_token / remove_token.
+Адреса по умолчанию — Polygon PoS (нативный USDC, актуальные wstETH/BET/GMT).
+"""
+import threading
+
+from web3 import Web3
+
+POLYGON_TOKENS = {
+    # базовые
+    "USDT":   "0xc2132d05d31c914a87c6611c10748aeb04b58e8f",
+    "USDC":   "0x3c499c542cef5e3811e1192ce70d8cc03d5c3359",
+    "DAI":    "0x8f3cf7ad23cd3cadbd9735aff958023239c6a063",
+    "FRAX":   "0x45c32fa6df82ead1e2ef74d17b76547eddfaff89",
+    # ликвидные/наблюдаемые
+    "wstETH": "0x03b54a6e9a984069379fae1a4fc4dbae93b3bccd",
+    "BET":    "0xbf7970d56a150cd0b60bd08388a4a75a27777777",
+    "WPOL":   "0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270",
+    "tBTC":   "0x236aa50979d5f3de3bd1eeb40e81137f22ab794b",
+    "SAND":   "0xbbba073c31bf03b8acf7c28ef0738decf3695683",
+    "GMT":    "0x714db550b574b3e927af3d93e26127d15721d4c2",
+    "LINK":   "0x53e0bca35ec356bd5dddfebbd1fc0fd03fabad39",
+    "EMT":    "0x708383ae0e80e75377d664e4d6344404dede119a",
+    "AAVE":   "0xd6df932a45c0f255f85145f286ea0b292b21c90b",
+    "LDO":    "0xc3c7d422809852031b44ab29eec9f1eff2a58756",
+    "POL":    "0x0d500b1d8e8ef31e21c99d1db9a6444d3adf1270",  # WMATIC (wrapped POL)
+    "WETH":   "0x7ceb23fd6bc0add59e62ac25578270cff1b9f619",
+    "SUSHI":  "0x0b3f868e0be5597d5db7feb59e1cadbb0fdda50a",
+}
+POLYGON_DECIMALS = {
+    "USDT": 6, "USDC": 6, "DAI": 18, "FRAX": 18,
+    "wstETH": 18, "BET": 18, "WPOL": 18, "tBTC": 18, "SAND": 18, "GMT": 8,
+    "LINK": 18, "EMT": 18, "AAVE": 18, "LDO": 18, "POL": 18, "WETH": 18, "SUSHI": 18
+}
+
+
+class PairInfo:
+    """Статические данные пары base->token (считаются один раз при регистрации)."""
+    __slots__ = ("id", "base", "token", "base_id", "token_id", "key", "label", "exit_label", "route_label",
+                 "base_addr", "token_addr", "base_addr_cs", "token_addr_cs",
+                 "base_scale", "token_scale", "entry_units", "active")
+
+    def __repr__(self):
+        return f"PairInfo({self.id}, {self.label})"
+
+
+class TokenRegistry:
+    def __init__(self, tokens: dict, decimals: dict, default_decimals: int = 18):
+        self._lock = threading.RLock()
+        self.default_decimals = default_decimals
+        self.entry_amount = 0.0
+        # по id токена
+        self.symbols, self.addr, self.addr_cs, self.decimals, self.scale, self.active = [], [], [], [], [], []
+        self._token_id = {}
+        # по id пары
+        self.pairs = []
+        self._pair_id = {}
+        self._by_base = {}
+        # совместимые словари
+        self.TOKENS, self.DECIMALS, self.ADDRESS_TO_SYMBOL, self.CHECKSUM = {}, {}, {}, {}
+        for sym, address in tokens.items():
+            self.add_token(sym, address, decimals.get(sym, default_decimals))
+
+    # ---------- токены ----------
+    def add_token(self, symbol: str, address: str, decimals: int = None) -> int:
+        dec = self.default_decimals if decimals is None else int(decimals)
+        with self._lock:
+            tid = self._token_id.get(symbol)
+            if tid is None:
+                tid = len(self.symbols)
+                self._token_id[symbol] = tid
+                self.symbols.append(symbol)
+                self.addr.append(None); self.addr_cs.append(None)
+                self.decimals.append(None); self.scale.append(None); self.active.append(True)
+            self.addr[tid] = address.lower()
+            self.addr_cs[tid] = Web3.to_checksum_address(address.lower())
+            self.decimals[tid] = dec
+            self.scale[tid] = 10 ** dec
+            self.active[tid] = True
+            self.TOKENS[symbol] = self.addr[tid]
+            self.DECIMALS[symbol] = dec
+            self.CHECKSUM[symbol] = self.addr_cs[tid]
+            self.ADDRESS_TO_SYMBOL[self.addr[tid]] = symbol
+            self._rebuild_pairs()
+            return tid
+
+    def remove_token(self, symbol: str):
+        with self._lock:
+            tid = self._token_id.get(symbol)
+            if tid is None or not self.active[tid]:
+                return
+            self.active[tid] = False
+            addr = self.addr[tid]
+            for d in (self.TOKENS, self.DECIMALS, self.CHECKSUM):
+                d.pop(symbol, None)
+            if self.ADDRESS_TO_SYMBOL.get(addr) == symbol:
+                self.ADDRESS_TO_SYMBOL.pop(addr, None)
+                # другой символ с тем же адресом (WPOL/POL) остаётся в отображении
+                for t, s in enumerate(self.symbols):
+                    if self.active[t] and self.addr[t] == addr:
+                        self.ADDRESS_TO_SYMBOL[addr] = s
+            self._rebuild_pairs()
+
+    def token_id(self, symbol: str):
+        return self._token_id.get(symbol)
+
+    def symbol_of(self, address: str):
+        return self.ADDRESS_TO_SYMBOL.get((address or "").lower())
+
+    # ---------- пары ----------
+    def set_entry_amount(self, amount: float):
+        """Объём входа в целых базовых токенах (SELL_AMOUNT_USD) -> entry_units всех пар."""
+        with self._lock:
+            self.entry_amount = float(amount)
+            for p in self.pairs:
+                p.entry_units = int(self.entry_amount * p.base_scale)
+
+    def _rebuild_pairs(self):
+        """Новые пары получают следующий id; пары снятых токенов помечаются неактивными."""
+        n = len(self.symbols)
+        for b in range(n):
+            for t in range(n):
+                if b == t:
+                    continue
+                key = (self.symbols[b], self.symbols[t])
+                pid = self._pair_id.get(key)
+                if pid is None:
+                    p = PairInfo()
+                    p.id = pid = len(self.pairs)
+                    p.base, p.token, p.base_id, p.token_id, p.key = key[0], key[1], b, t, key
+                    p.label = f"{key[0]}->{key[1]}"
+                    p.exit_label = f"{key[1]}->{key[0]}"
+                    p.route_label = f"{key[0]}->{key[1]}->{key[0]}"
+                    self.pairs.append(p)
+                    self._pair_id[key] = pid
+                p = self.pairs[pid]
+                p.base_addr, p.token_addr = self.addr[b], self.addr[t]
+                p.base_addr_cs, p.token_addr_cs = self.addr_cs[b], self.addr_cs[t]
+                p.base_scale, p.token_scale = self.scale[b], self.scale[t]
+                p.entry_units = int(self.entry_amount * p.base_scale)
+                p.active = self.active[b] and self.active[t]
+        by_base = {}
+        for p in self.pairs:
+            if p.active:
+                by_base.setdefault(p.base, []).append(p)
+        for lst in by_base.values():
+            lst.sort(key=lambda p: p.token_id)
+        self._by_base = by_base
+
+    def pair(self, base: str, token: str):
+        pid = self._pair_id.get((base, token))
+        return self.pairs[pid] if pid is not None else None
+
+    def pair_id(self, base: str, token: str):
+        return self._pair_id.get((base, token))
+
+    def pairs_for(self, base: str):
+        """Активные пары base->* в порядке id токенов (снимок списка — безопасно менять реестр во время обхода)."""
+        return list(self._by_base.get(base, ()))
+
+    def pair_count(self) -> int:
+        return len(self.pairs)
+
+
+# общий экземпляр для процесса
+REGISTRY = TokenRegistry(POLYGON_TOKENS, POLYGON_DECIMALS)
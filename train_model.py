@@ -2,17 +2,119 @@
 import argparse
 import sqlite3
 import json
+import time
+import resource
+import tracemalloc
+import datetime as dt
 import joblib
 import numpy as np
 import pandas as pd
 from pathlib import Path
 
+# признаки в том же порядке, что и build_feature_matrix (ts_hour/ts_minute — из колонки ts)
+BASE_FEATURE_COLUMNS = [
+    "exp_pnl", "net_pnl", "entry_sell_units", "buy_amount_token_units", "exit_units_est",
+    "hold_seconds",
+    "liquidity_usd", "buys", "sells", "vol_m5", "avg_m5", "momentum_m5",
+    "d_price", "dd_price", "d_vol", "d_buys", "vol_rel_change",
+]
+TS_FEATURE_COLUMNS = ["ts_hour", "ts_minute"]
+# признаки пула из истории резервов (main.reserve_features) — только с --pool-features:
+# у старых строк их нет (0.0), а модель без них остаётся совместимой с дообучением
+POOL_FEATURE_COLUMNS = ["pool_syncs_5m", "pool_chg_5m"]
+# колонки таблицы signals, которые читаются напрямую (остальное — из features_json)
+_TABLE_FEATURES = ("exp_pnl", "net_pnl", "entry_sell_units", "buy_amount_token_units", "exit_units_est", "hold_seconds")
+
 def load_signals_from_db(db_path: str, table: str = "signals"):
     conn = sqlite3.connect(db_path)
     df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
     conn.close()
     return df
 
+def count_labelled(db_path: str, table: str = "signals", where: str = "outcome IN (0, 1)", params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+    finally:
+        conn.close()
+
+def iter_labelled_chunks(db_path: str, table: str = "signals", chunksize: int = 5000,
+                         where: str = "outcome IN (0, 1)", params=()):
+    """Размеченные строки порциями; фильтр по outcome выполняется в SQL, а не в pandas."""
+    cols = ("id", "ts", "outcome", "features_json") + _TABLE_FEATURES
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE {where} ORDER BY id", params)
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def _ts_hour_minute(ts):
+    try:
+        t = dt.datetime.fromisoformat(str(ts))
+        return t.hour, t.minute
+    except Exception:
+        return 0, 0
+
+def feature_columns_for(pool_features: bool = False):
+    return BASE_FEATURE_COLUMNS + (POOL_FEATURE_COLUMNS if pool_features else []) + TS_FEATURE_COLUMNS
+
+def load_feature_matrix_streaming(db_path: str, table: str = "signals", chunksize: int = 5000,
+                                  where: str = "outcome IN (0, 1)", params=(), pool_features: bool = False):
+    """
+    Строит float32-матрицу признаков в одном заранее выделенном буфере, читая таблицу порциями.
+    Возвращает (X, y, feature_columns, ids, stats) — stats: load_sec, peak_mb (tracemalloc), maxrss_mb.
+    pool_features — добавить колонки POOL_FEATURE_COLUMNS.
+    """
+    t0 = time.time()
+    tracemalloc.start()
+    feature_columns = feature_columns_for(pool_features)
+    col_idx = {c: i for i, c in enumerate(feature_columns)}
+    n = count_labelled(db_path, table, where, params)
+    X = np.zeros((n, len(feature_columns)), dtype=np.float32)
+    y = np.empty(n, dtype=np.int8)
+    ids = np.empty(n, dtype=np.int64)
+    i = 0
+    for rows in iter_labelled_chunks(db_path, table, chunksize, where, params):
+        for row in rows:
+            if i >= n:
+                break  # строки, добавленные после COUNT
+            rid, ts, outcome, fj = row[:4]
+            ids[i] = rid
+            y[i] = outcome
+            x = X[i]
+            for j, v in enumerate(row[4:]):
+                if v is not None:
+                    x[j] = v
+            try:
+                feats = json.loads(fj) if fj else {}
+            except Exception:
+                feats = {}
+            if isinstance(feats, dict):
+                for k, v in feats.items():
+                    j = col_idx.get(k)
+                    if j is not None and k not in _TABLE_FEATURES:
+                        try:
+                            x[j] = float(v or 0.0)
+                        except (TypeError, ValueError):
+                            pass
+            x[col_idx["ts_hour"]], x[col_idx["ts_minute"]] = _ts_hour_minute(ts)
+            i += 1
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = {
+        "rows": i,
+        "load_sec": time.time() - t0,
+        "peak_mb": peak / 1e6,
+        "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "matrix_mb": X[:i].nbytes / 1e6,
+    }
+    return X[:i], y[:i], feature_columns, ids[:i], stats
+
 def explode_features_column(df: pd.DataFrame, col='features_json'):
     feats = []
     for v in df[col].fillna("{}"):
@@ -28,7 +130,7 @@ def explode_features_column(df: pd.DataFrame, col='features_json'):
     feats_df.columns = [str(c) for c in feats_df.columns]
     return pd.concat([df.reset_index(drop=True), feats_df.reset_index(drop=True)], axis=1)
 
-def build_feature_matrix(df: pd.DataFrame):
+def build_feature_matrix(df: pd.DataFrame, pool_features: bool = False):
     # We take a set of typical features present in your pipeline.
     # If a column doesn't exist it will be filled with 0.
     use_cols = [
@@ -39,6 +141,8 @@ def build_feature_matrix(df: pd.DataFrame):
         # derivative-like features (if present)
         "d_price", "dd_price", "d_vol", "d_buys", "vol_rel_change"
     ]
+    if pool_features:
+        use_cols += POOL_FEATURE_COLUMNS
 
     # If ts exists, add hour/minute
     if "ts" in df.columns:
@@ -74,6 +178,10 @@ class ModelWrapper:
         if not isinstance(X_df, pd.DataFrame):
             X_df = pd.DataFrame(X_df)
         X = X_df.reindex(columns=self.feature_columns, fill_value=0.0)
+        # нативные Booster (lgb.train / xgb.train) уже отдают вероятность для binary-objective
+        booster_proba = predict_booster_proba(self.model, X)
+        if booster_proba is not None:
+            return booster_proba
         # LightGBM и XGBoost имеют predict_proba
         if hasattr(self.model, "predict_proba"):
             proba = self.model.predict_proba(X)
@@ -92,6 +200,243 @@ class ModelWrapper:
             return probs
         raise RuntimeError("Model has neither predict_proba nor predict")
 
+def predict_booster_proba(model, X):
+    """Вероятность класса 1 для lgb.Booster / xgb.Booster; None — если это не Booster."""
+    mod = type(model).__module__ or ""
+    if mod.startswith("lightgbm") and type(model).__name__ == "Booster":
+        return np.asarray(model.predict(X)).ravel()
+    if mod.startswith("xgboost") and type(model).__name__ == "Booster":
+        import xgboost as xgb
+        dm = X if isinstance(X, xgb.DMatrix) else xgb.DMatrix(np.asarray(X, dtype=np.float32))
+        return np.asarray(model.predict(dm)).ravel()
+    return None
+
+def model_family(model) -> str:
+    return "xgb" if (type(model).__module__ or "").startswith("xgboost") else "lgb"
+
+# ---------- метаданные артефакта (водяной знак обучения) ----------
+def meta_path(model_path) -> Path:
+    return Path(str(model_path) + ".meta.json")
+
+def load_meta(model_path) -> dict:
+    p = meta_path(model_path)
+    if not p.exists():
+        return {}
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def save_meta(model_path, meta: dict):
+    meta_path(model_path).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def labelled_watermark(db_path: str, table: str = "signals") -> dict:
+    """
+    Водяной знак разметки. Результат пишется монитором не по порядку id (параллельные мониторы,
+    восстановленные после рестарта позиции, идеи), поэтому граница — по времени разметки resolved_ts:
+    последнее значение и id строк, размеченных в ту же секунду. Строки без resolved_ts (старые базы) —
+    по наибольшему id.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ts = conn.execute(f"SELECT MAX(resolved_ts) FROM {table} WHERE outcome IN (0, 1)").fetchone()[0] or ""
+        ids = [r[0] for r in conn.execute(
+            f"SELECT id FROM {table} WHERE outcome IN (0, 1) AND resolved_ts = ? ORDER BY id", (ts,))]
+        legacy = conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM {table} WHERE outcome IN (0, 1) AND resolved_ts IS NULL").fetchone()[0]
+    finally:
+        conn.close()
+    return {"watermark_resolved_ts": ts, "watermark_ids": ids, "watermark_id": int(legacy)}
+
+def rows_after_watermark(meta: dict):
+    """(where, params) размеченных строк, которых ещё не было при обучении модели из meta."""
+    ts = meta.get("watermark_resolved_ts")
+    if ts is None:
+        # meta до watermark_resolved_ts: всё, что размечено после прошлого обучения
+        trained = meta.get("trained_at")
+        ts = dt.datetime.fromisoformat(trained).strftime("%Y-%m-%d %H:%M:%S") if trained else ""
+    ids = [int(i) for i in meta.get("watermark_ids") or []]
+    same_second = f"(resolved_ts = ? AND id NOT IN ({','.join('?' * len(ids))}))" if ids else "resolved_ts = ?"
+    where = (f"outcome IN (0, 1) AND (resolved_ts > ? OR {same_second} "
+             f"OR (resolved_ts IS NULL AND id > ?))")
+    return where, (ts, ts, *ids, int(meta.get("watermark_id") or 0))
+
+def holdout_auc(model, X, y):
+    from sklearn.metrics import roc_auc_score
+    if len(np.unique(y)) < 2:
+        return None
+    proba = predict_booster_proba(model, X)
+    if proba is None:
+        proba = ModelWrapper(model, list(range(X.shape[1]))).predict(pd.DataFrame(X))
+    return float(roc_auc_score(y, proba))
+
+def train_incremental(args):
+    """
+    Дообучение: строки новее водяного знака из <out>.meta.json, продолжение бустинга
+    от прошлого Booster, сравнение со старой моделью на свежем out-of-time holdout.
+    Новая модель сохраняется, только если она не хуже старой.
+    """
+    t0 = time.time()
+    meta = load_meta(args.out)
+    # граница берётся до чтения строк: размеченное во время обучения попадёт в следующий запуск
+    watermark = labelled_watermark(args.db)
+    where, params = rows_after_watermark(meta)
+    old = joblib.load(args.out)
+    old_model = old.model if isinstance(old, ModelWrapper) else old
+    # набор колонок — как у прошлой модели: признаки пула дообучаются, только если она их уже знает
+    pool_features = isinstance(old, ModelWrapper) and POOL_FEATURE_COLUMNS[0] in old.feature_columns
+
+    X, y, feature_columns, ids, stats = load_feature_matrix_streaming(
+        args.db, chunksize=args.chunksize, where=where, params=params, pool_features=pool_features)
+    print(f"Rows labelled since {meta.get('watermark_resolved_ts') or meta.get('trained_at') or 'start'}: "
+          f"{len(y)} (load {stats['load_sec']:.2f}s)")
+    if len(y) < args.min_new:
+        raise SystemExit(f"Too few new rows for incremental training: {len(y)} (<{args.min_new}).")
+    if isinstance(old, ModelWrapper) and list(old.feature_columns) != feature_columns:
+        raise SystemExit("Feature columns changed since the previous model — run a full training.")
+
+    # holdout — самые свежие строки (по id), обучение — более ранние новые строки
+    cut = int(len(y) * (1.0 - args.test_size))
+    X_tr, y_tr, X_ho, y_ho = X[:cut], y[:cut], X[cut:], y[cut:]
+
+    if model_family(old_model) == "xgb":
+        import xgboost as xgb
+        dtrain = xgb.DMatrix(X_tr, label=y_tr)
+        new_model = xgb.train(_xgb_default_params(), dtrain, num_boost_round=args.inc_rounds,
+                              evals=[(dtrain, "train")], xgb_model=old_model, verbose_eval=50)
+    else:
+        import lightgbm as lgb
+        dtrain = lgb.Dataset(X_tr, label=y_tr, free_raw_data=True)
+        new_model = _lgb_train(_lgb_default_params(), dtrain, [dtrain], ["train"],
+                               num_boost_round=args.inc_rounds, init_model=old_model)
+
+    auc_old = holdout_auc(old_model, X_ho, y_ho)
+    auc_new = holdout_auc(new_model, X_ho, y_ho)
+    took = time.time() - t0
+    full_sec = meta.get("full_train_sec")
+    saved = (full_sec - took) if full_sec else None
+    print(f"Holdout AUC: old={auc_old} new={auc_new} (rows {len(y_ho)})")
+    print(f"Incremental training took {took:.2f}s" + (f", saved ~{saved:.2f}s vs full run" if saved is not None else ""))
+
+    keep_new = auc_old is None or auc_new is None or auc_new >= auc_old - args.max_auc_drop
+    if not keep_new:
+        print("New model is worse on holdout — keeping the previous model, watermark unchanged.")
+        return
+    joblib.dump(ModelWrapper(new_model, feature_columns), str(Path(args.out)))
+    meta.update(watermark)
+    meta.update({
+        "trained_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "mode": "incremental",
+        "family": model_family(new_model),
+        "rows": int(len(y)),
+        "last_train_sec": took,
+        "time_saved_sec": saved,
+        "holdout_auc_old": auc_old,
+        "holdout_auc_new": auc_new,
+    })
+    save_meta(args.out, meta)
+    print(f"Saved incrementally trained model to {args.out}; labelled up to {meta['watermark_resolved_ts'] or '-'}")
+
+# ---------- walk-forward выбор модели ----------
+LGB_GRID = [{"num_leaves": nl, "learning_rate": lr, "min_data_in_leaf": 20}
+            for nl in (15, 31, 63) for lr in (0.05, 0.1)]
+XGB_GRID = [{"max_depth": md, "eta": eta, "subsample": 0.8}
+            for md in (3, 6) for eta in (0.05, 0.1)]
+
+def walk_forward_folds(n_rows: int, n_folds: int, gap: int = 0):
+    """Расширяющееся окно: данные режутся на n_folds+1 блоков по времени;
+    fold k учится на блоках 0..k и проверяется на блоке k+1 (с пропуском gap строк)."""
+    bounds = np.linspace(0, n_rows, n_folds + 2, dtype=int)
+    folds = []
+    for k in range(n_folds):
+        tr_end = bounds[k + 1]
+        va_start, va_end = min(tr_end + gap, bounds[k + 2]), bounds[k + 2]
+        if tr_end > 0 and va_end > va_start:
+            folds.append((tr_end, va_start, va_end))
+    return folds
+
+_WF_DATA = None
+
+def _wf_init(X, y):
+    global _WF_DATA
+    _WF_DATA = (X, y)
+
+def _wf_task(task):
+    """Один (кандидат, fold): обучение на префиксе, метрики на следующем блоке."""
+    from sklearn.metrics import roc_auc_score, log_loss
+    family, params, rounds, fold_no, (tr_end, va_start, va_end) = task
+    X, y = _WF_DATA
+    X_tr, y_tr, X_va, y_va = X[:tr_end], y[:tr_end], X[va_start:va_end], y[va_start:va_end]
+    t0 = time.time()
+    if family == "xgb":
+        import xgboost as xgb
+        full = dict(_xgb_default_params(), nthread=1, verbosity=0, **params)
+        model = xgb.train(full, xgb.DMatrix(X_tr, label=y_tr), num_boost_round=rounds)
+    else:
+        import lightgbm as lgb
+        full = dict(_lgb_default_params(), num_threads=1, **params)
+        model = lgb.train(full, lgb.Dataset(X_tr, label=y_tr), num_boost_round=rounds)
+    train_sec = time.time() - t0
+    proba = predict_booster_proba(model, X_va)
+    auc = float(roc_auc_score(y_va, proba)) if len(np.unique(y_va)) > 1 else float("nan")
+    ll = float(log_loss(y_va, np.clip(proba, 1e-7, 1 - 1e-7), labels=[0, 1]))
+    return {"family": family, "params": json.dumps(params, sort_keys=True), "fold": fold_no,
+            "train_rows": int(tr_end), "valid_rows": int(va_end - va_start),
+            "auc": auc, "logloss": ll, "train_sec": train_sec}
+
+def select_model(args):
+    """Walk-forward выбор модели: LightGBM и XGBoost по сетке, все (кандидат, fold) — в пуле процессов."""
+    from concurrent.futures import ProcessPoolExecutor
+    watermark = labelled_watermark(args.db)
+    X, y, feature_columns, _, stats = load_feature_matrix_streaming(args.db, chunksize=args.chunksize,
+                                                                    pool_features=args.pool_features)
+    print(f"Loaded {stats['rows']} labelled rows in {stats['load_sec']:.2f}s")
+    if len(y) < args.min_samples:
+        raise SystemExit(f"Too few samples for training: {len(y)} rows (<{args.min_samples}). Collect more labeled data.")
+    folds = walk_forward_folds(len(y), args.folds, args.gap)
+    candidates = [("lgb", p) for p in LGB_GRID] + [("xgb", p) for p in XGB_GRID]
+    tasks = [(fam, params, args.rounds, k, fold) for fam, params in candidates for k, fold in enumerate(folds)]
+    print(f"{len(candidates)} candidates x {len(folds)} folds = {len(tasks)} fits")
+
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_wf_init, initargs=(X, y)) as ex:
+        rows = list(ex.map(_wf_task, tasks))
+    per_fold = pd.DataFrame(rows)
+    board = (per_fold.groupby(["family", "params"])
+             .agg(mean_auc=("auc", "mean"), min_auc=("auc", "min"), mean_logloss=("logloss", "mean"),
+                  train_sec=("train_sec", "sum"))
+             .reset_index().sort_values(["mean_auc", "mean_logloss"], ascending=[False, True]))
+    folds_wide = per_fold.pivot_table(index=["family", "params"], columns="fold", values="auc")
+    folds_wide.columns = [f"auc_fold{c}" for c in folds_wide.columns]
+    board = board.merge(folds_wide.reset_index(), on=["family", "params"])
+    board.to_csv(args.leaderboard, index=False)
+    print(f"Walk-forward done in {time.time()-t0:.2f}s; leaderboard -> {args.leaderboard}")
+    print(board.head(10).to_string(index=False))
+
+    best = board.iloc[0]
+    params = json.loads(best["params"])
+    print(f"Best: {best['family']} {params} mean AUC={best['mean_auc']:.4f}; retraining on all rows...")
+    t_fit = time.time()
+    if best["family"] == "xgb":
+        import xgboost as xgb
+        model = xgb.train(dict(_xgb_default_params(), **params), xgb.DMatrix(X, label=y), num_boost_round=args.rounds)
+    else:
+        import lightgbm as lgb
+        model = lgb.train(dict(_lgb_default_params(), **params), lgb.Dataset(X, label=y), num_boost_round=args.rounds)
+    joblib.dump(ModelWrapper(model, feature_columns), str(Path(args.out)))
+    meta = dict(watermark, **{
+        "trained_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "mode": "walk-forward",
+        "family": best["family"],
+        "params": params,
+        "rows": int(len(y)),
+        "full_train_sec": time.time() - t_fit,
+        "last_train_sec": time.time() - t_fit,
+        "oot_mean_auc": float(best["mean_auc"]),
+    })
+    save_meta(args.out, meta)
+    print(f"Saved best model to {args.out}")
+
 def train_lightgbm(X_train, y_train, X_val=None, y_val=None, params=None):
     import lightgbm as lgb
     dtrain = lgb.Dataset(X_train, label=y_train)
@@ -101,7 +446,40 @@ def train_lightgbm(X_train, y_train, X_val=None, y_val=None, params=None):
         dvalid = lgb.Dataset(X_val, label=y_val)
         valid_sets.append(dvalid)
         valid_names.append("valid")
-    params = params or {
+    params = params or _lgb_default_params()
+    return _lgb_train(params, dtrain, valid_sets, valid_names)
+
+def _lgb_train(params, dtrain, valid_sets, valid_names, num_boost_round=500, init_model=None):
+    import lightgbm as lgb
+    callbacks = [lgb.log_evaluation(50)]
+    if len(valid_sets) > 1:
+        callbacks.append(lgb.early_stopping(50))
+    return lgb.train(params, dtrain, num_boost_round=num_boost_round, valid_sets=valid_sets,
+                     valid_names=valid_names, init_model=init_model, callbacks=callbacks)
+
+def train_streaming(X, y, use_xgb=False, test_size=0.2, seed=42):
+    """
+    Обучение на буфере из load_feature_matrix_streaming без промежуточных DataFrame:
+    Dataset/DMatrix строится один раз по всему буферу, train/valid — через subset/slice по индексам.
+    """
+    from sklearn.model_selection import train_test_split
+    idx = np.arange(len(y))
+    tr_idx, va_idx = train_test_split(idx, test_size=test_size, stratify=y, random_state=seed)
+    print("Train rows:", len(tr_idx), "Val rows:", len(va_idx), "Features:", X.shape[1])
+    if use_xgb:
+        import xgboost as xgb
+        dall = xgb.DMatrix(X, label=y)
+        dtrain, dvalid = dall.slice(tr_idx), dall.slice(va_idx)
+        return xgb.train(_xgb_default_params(), dtrain, num_boost_round=500,
+                         evals=[(dtrain, "train"), (dvalid, "valid")], early_stopping_rounds=50)
+    import lightgbm as lgb
+    dall = lgb.Dataset(X, label=y, free_raw_data=True)
+    dtrain = dall.subset(np.sort(tr_idx))
+    dvalid = dall.subset(np.sort(va_idx))
+    return _lgb_train(_lgb_default_params(), dtrain, [dtrain, dvalid], ["train", "valid"])
+
+def _lgb_default_params():
+    return {
         "objective": "binary",
         "metric": "auc",
         "verbosity": -1,
@@ -109,9 +487,14 @@ def train_lightgbm(X_train, y_train, X_val=None, y_val=None, params=None):
         "num_threads": 4,
         "seed": 42,
     }
-    bst = lgb.train(params, dtrain, num_boost_round=500, valid_sets=valid_sets,
-                    early_stopping_rounds=50, verbose_eval=50)
-    return bst
+
+def _xgb_default_params():
+    return {
+        "objective": "binary:logistic",
+        "eval_metric": "auc",
+        "verbosity": 1,
+        "seed": 42,
+    }
 
 def train_xgboost(X_train, y_train, X_val=None, y_val=None, params=None):
     import xgboost as xgb
@@ -121,12 +504,7 @@ def train_xgboost(X_train, y_train, X_val=None, y_val=None, params=None):
     if X_val is not None and y_val is not None:
         deval = xgb.DMatrix(X_val, label=y_val)
         evals.append((deval, "valid"))
-    params = params or {
-        "objective": "binary:logistic",
-        "eval_metric": "auc",
-        "verbosity": 1,
-        "seed": 42,
-    }
+    params = params or _xgb_default_params()
     bst = xgb.train(params, dtrain, num_boost_round=500, evals=evals,
                     early_stopping_rounds=50)
     return bst
@@ -138,9 +516,61 @@ def main():
     p.add_argument("--use-xgb", action="store_true", help="Train XGBoost instead of LightGBM")
     p.add_argument("--test-size", type=float, default=0.2)
     p.add_argument("--min-samples", type=int, default=50, help="Min positive+negative samples required")
+    p.add_argument("--stream", action="store_true", help="Chunked SQL read into one float32 buffer (low memory)")
+    p.add_argument("--chunksize", type=int, default=5000, help="Rows per chunk for --stream")
+    p.add_argument("--incremental", action="store_true",
+                   help="Continue boosting the model in --out on rows newer than its training watermark")
+    p.add_argument("--inc-rounds", type=int, default=100, help="Boosting rounds to add in --incremental")
+    p.add_argument("--min-new", type=int, default=50, help="Min new labelled rows for --incremental")
+    p.add_argument("--max-auc-drop", type=float, default=0.0, help="Accept new model if holdout AUC drops by at most this")
+    p.add_argument("--select", action="store_true",
+                   help="Walk-forward model selection over LightGBM/XGBoost grids (process pool)")
+    p.add_argument("--folds", type=int, default=4, help="Walk-forward folds for --select")
+    p.add_argument("--gap", type=int, default=0, help="Rows skipped between train and valid block")
+    p.add_argument("--rounds", type=int, default=300, help="Boosting rounds per candidate in --select")
+    p.add_argument("--workers", type=int, default=None, help="Processes for --select (default: all cores)")
+    p.add_argument("--archive-dir", default=None,
+                   help="Also train on rows archived by signals_store.py (default path only)")
+    p.add_argument("--leaderboard", default="model_leaderboard.csv", help="Leaderboard CSV for --select")
+    p.add_argument("--pool-features", action="store_true",
+                   help="Also train on pool_syncs_5m / pool_chg_5m from the reserve index (full/--select; "
+                        "--incremental follows the previous model)")
     args = p.parse_args()
 
+    if args.select:
+        select_model(args)
+        return
+
+    if args.incremental:
+        if not Path(args.out).exists():
+            raise SystemExit(f"No previous model at {args.out} — run a full training first.")
+        train_incremental(args)
+        return
+
+    t_start = time.time()
+    watermark = labelled_watermark(args.db) if Path(args.db).exists() else {}
+    if args.stream:
+        X, y, feature_columns, _, stats = load_feature_matrix_streaming(args.db, chunksize=args.chunksize,
+                                                                        pool_features=args.pool_features)
+        print(f"Loaded {stats['rows']} labelled rows in {stats['load_sec']:.2f}s, matrix {stats['matrix_mb']:.1f} MB, "
+              f"peak traced {stats['peak_mb']:.1f} MB, max RSS {stats['maxrss_mb']:.1f} MB")
+        if len(y) < args.min_samples:
+            raise SystemExit(f"Too few samples for training: {len(y)} rows (<{args.min_samples}). Collect more labeled data.")
+        print("Training XGBoost..." if args.use_xgb else "Training LightGBM...")
+        model = train_streaming(X, y, use_xgb=args.use_xgb, test_size=args.test_size)
+        wrapper = ModelWrapper(model, feature_columns)
+        joblib.dump(wrapper, str(Path(args.out)))
+        save_full_meta(args.out, watermark, model, len(y), time.time() - t_start)
+        print(f"Saved wrapped model to {args.out}. Feature columns: {feature_columns}")
+        return
+
     df = load_signals_from_db(args.db)
+    if args.archive_dir:
+        from signals_store import iter_archive
+        archived = pd.DataFrame(list(iter_archive(args.archive_dir)))
+        if len(archived):
+            print(f"Loaded {len(archived)} archived rows from {args.archive_dir}")
+            df = pd.concat([archived, df], ignore_index=True)
     if df is None or df.shape[0] == 0:
         raise SystemExit("No rows in DB. Make sure signals.db exists and has signals table.")
 
@@ -153,7 +583,7 @@ def main():
     df2 = explode_features_column(df, col='features_json')
 
     # build X, y
-    X, feature_columns = build_feature_matrix(df2)
+    X, feature_columns = build_feature_matrix(df2, pool_features=args.pool_features)
     y = df2["outcome"].astype(int).values
 
     # check samples
@@ -176,8 +606,22 @@ def main():
     wrapper = ModelWrapper(model, feature_columns)
     outp = Path(args.out)
     joblib.dump(wrapper, str(outp))
+    save_full_meta(outp, watermark, model, X.shape[0], time.time() - t_start)
     print(f"Saved wrapped model to {outp}. Feature columns: {feature_columns}")
 
+def save_full_meta(model_path, watermark, model, rows, took):
+    save_meta(model_path, dict(watermark, **{
+        "trained_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "mode": "full",
+        "family": model_family(model),
+        "rows": int(rows),
+        "full_train_sec": took,
+        "last_train_sec": took,
+    }))
+
 if __name__ == "__main__":
-    main()
+    # запускаем через импорт, чтобы ModelWrapper сохранялся как train_model.ModelWrapper
+    # (иначе pickle ссылается на __main__ и main.py/дообучение не смогут загрузить артефакт)
+    import train_model
+    train_model.main()
   
@@ -0,0 +1,527 @@
+# v3_pool.py
+"""
+Локальная модель пулов Uniswap V3 / Sushi V3.
+
+  * TickMath / SqrtPriceMath / SwapMath — целочисленный порт библиотек ядра V3
+    (те же округления, что и в контракте пула);
+  * simulate_swap() — exact-input своп с проходом по инициализированным тикам,
+    как в UniswapV3Pool.swap();
+  * PoolState — снимок пула (sqrtPrice, tick, liquidity, тики) с (де)сериализацией в JSON,
+    чтобы симулятор можно было проверять на записанных фикстурах;
+  * V3PoolCache — кэш состояний по парам: список пулов и тики загружаются один раз,
+    дальше обновляется только slot0/liquidity и окно тиков вокруг текущего.
+"""
+import json
+import time
+import threading
+from bisect import bisect_right
+
+Q96 = 1 << 96
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+MAX_UINT256 = (1 << 256) - 1
+FEE_DENOM = 1_000_000
+
+TICK_SPACING_BY_FEE = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+
+# ===================== FullMath =====================
+def _mul_div(a, b, d):
+    return (a * b) // d
+
+def _mul_div_up(a, b, d):
+    return -((-a * b) // d)
+
+def _div_up(a, b):
+    return -((-a) // b)
+
+
+# ===================== TickMath =====================
+_TICK_FACTORS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    abs_tick = -tick if tick < 0 else tick
+    if abs_tick > MAX_TICK:
+        raise ValueError("tick out of range")
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 1 << 128
+    for bit, factor in _TICK_FACTORS:
+        if abs_tick & bit:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    # Q128.128 -> Q64.96 с округлением вверх
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96: int) -> int:
+    """Наибольший tick, для которого get_sqrt_ratio_at_tick(tick) <= sqrt_price_x96."""
+    if not (MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO):
+        raise ValueError("sqrt price out of range")
+    lo, hi = MIN_TICK, MAX_TICK
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if get_sqrt_ratio_at_tick(mid) <= sqrt_price_x96:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+# ===================== SqrtPriceMath =====================
+def _next_sqrt_from_amount0_up(sqrt_p, liquidity, amount, add):
+    if amount == 0:
+        return sqrt_p
+    numerator1 = liquidity << 96
+    if add:
+        product = amount * sqrt_p
+        denominator = numerator1 + product
+        if denominator >= numerator1:
+            return _mul_div_up(numerator1, sqrt_p, denominator)
+        return _div_up(numerator1, numerator1 // sqrt_p + amount)
+    product = amount * sqrt_p
+    denominator = numerator1 - product
+    return _mul_div_up(numerator1, sqrt_p, denominator)
+
+def _next_sqrt_from_amount1_down(sqrt_p, liquidity, amount, add):
+    if add:
+        return sqrt_p + (amount << 96) // liquidity
+    quotient = _div_up(amount << 96, liquidity)
+    return sqrt_p - quotient
+
+def get_next_sqrt_price_from_input(sqrt_p, liquidity, amount_in, zero_for_one):
+    if zero_for_one:
+        return _next_sqrt_from_amount0_up(sqrt_p, liquidity, amount_in, True)
+    return _next_sqrt_from_amount1_down(sqrt_p, liquidity, amount_in, True)
+
+def get_amount0_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_b - sqrt_a
+    if round_up:
+        return _div_up(_mul_div_up(numerator1, numerator2, sqrt_b), sqrt_a)
+    return _mul_div(numerator1, numerator2, sqrt_b) // sqrt_a
+
+def get_amount1_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return _mul_div_up(liquidity, sqrt_b - sqrt_a, Q96)
+    return _mul_div(liquidity, sqrt_b - sqrt_a, Q96)
+
+
+# ===================== SwapMath =====================
+def compute_swap_step(sqrt_current, sqrt_target, liquidity, amount_remaining, fee_pips):
+    """Только exact-input (amount_remaining >= 0). Возвращает (sqrt_next, amount_in, amount_out, fee_amount)."""
+    zero_for_one = sqrt_current >= sqrt_target
+    amount_less_fee = _mul_div(amount_remaining, FEE_DENOM - fee_pips, FEE_DENOM)
+    if zero_for_one:
+        amount_in = get_amount0_delta(sqrt_target, sqrt_current, liquidity, True)
+    else:
+        amount_in = get_amount1_delta(sqrt_current, sqrt_target, liquidity, True)
+    if amount_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = get_next_sqrt_price_from_input(sqrt_current, liquidity, amount_less_fee, zero_for_one)
+
+    is_max = sqrt_target == sqrt_next
+    if zero_for_one:
+        if not is_max:
+            amount_in = get_amount0_delta(sqrt_next, sqrt_current, liquidity, True)
+        amount_out = get_amount1_delta(sqrt_next, sqrt_current, liquidity, False)
+    else:
+        if not is_max:
+            amount_in = get_amount1_delta(sqrt_current, sqrt_next, liquidity, True)
+        amount_out = get_amount0_delta(sqrt_current, sqrt_next, liquidity, False)
+
+    if sqrt_next != sqrt_target:
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = _mul_div_up(amount_in, fee_pips, FEE_DENOM - fee_pips)
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+
+# ===================== PoolState =====================
+class PoolState:
+    __slots__ = ("id", "token0", "token1", "dec0", "dec1", "fee", "tick_spacing",
+                 "sqrt_price_x96", "tick", "liquidity", "tick_idx", "tick_net",
+                 "tick_lo", "tick_hi", "ts", "ticks_ts")
+
+    def __init__(self, id, token0, token1, dec0, dec1, fee, sqrt_price_x96, tick, liquidity,
+                 ticks=(), tick_lo=MIN_TICK, tick_hi=MAX_TICK, tick_spacing=None, ts=None):
+        self.id = id
+        self.token0 = token0.lower()
+        self.token1 = token1.lower()
+        self.dec0 = int(dec0)
+        self.dec1 = int(dec1)
+        self.fee = int(fee)
+        self.tick_spacing = int(tick_spacing or TICK_SPACING_BY_FEE.get(self.fee, 60))
+        self.sqrt_price_x96 = int(sqrt_price_x96)
+        self.tick = int(tick)
+        self.liquidity = int(liquidity)
+        self.tick_lo = int(tick_lo)   # диапазон тиков, который реально загружен
+        self.tick_hi = int(tick_hi)
+        self.ts = ts or time.time()
+        self.ticks_ts = self.ts
+        self.set_ticks(ticks)
+
+    def set_ticks(self, ticks):
+        """ticks — iterable (tickIdx, liquidityNet); хранится двумя отсортированными списками."""
+        pairs = sorted((int(i), int(n)) for i, n in ticks if int(n) != 0)
+        self.tick_idx = [i for i, _ in pairs]
+        self.tick_net = [n for _, n in pairs]
+
+    def copy(self):
+        """Независимая копия: обновления готовятся на копии и подменяются в кэше целиком (put_state),
+        поэтому котировка в другом потоке никогда не видит состояние «наполовину»."""
+        st = PoolState.__new__(PoolState)
+        for k in PoolState.__slots__:
+            setattr(st, k, getattr(self, k))
+        return st
+
+    def with_slot(self, pool: dict):
+        """Копия с новыми slot0/liquidity из ответа subgraph."""
+        st = self.copy()
+        st.sqrt_price_x96 = int(pool["sqrtPrice"])
+        st.tick = int(pool.get("tick") or self.tick)
+        st.liquidity = int(pool.get("liquidity") or 0)
+        st.ts = time.time()
+        return st
+
+    def merge_ticks(self, ticks, lo, hi):
+        """Заменить тики в окне [lo, hi] свежими данными (инкрементальное обновление)."""
+        keep = [(i, n) for i, n in zip(self.tick_idx, self.tick_net) if i < lo or i > hi]
+        self.set_ticks(keep + [(int(i), int(n)) for i, n in ticks])
+        self.ticks_ts = time.time()
+
+    def to_dict(self):
+        return {
+            "id": self.id, "token0": self.token0, "token1": self.token1,
+            "dec0": self.dec0, "dec1": self.dec1, "fee": self.fee, "tick_spacing": self.tick_spacing,
+            "sqrt_price_x96": str(self.sqrt_price_x96), "tick": self.tick, "liquidity": str(self.liquidity),
+            "tick_lo": self.tick_lo, "tick_hi": self.tick_hi,
+            "ticks": [[i, str(n)] for i, n in zip(self.tick_idx, self.tick_net)],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["id"], d["token0"], d["token1"], d["dec0"], d["dec1"], d["fee"],
+                   int(d["sqrt_price_x96"]), d["tick"], int(d["liquidity"]),
+                   ticks=[(i, int(n)) for i, n in d.get("ticks", [])],
+                   tick_lo=d.get("tick_lo", MIN_TICK), tick_hi=d.get("tick_hi", MAX_TICK),
+                   tick_spacing=d.get("tick_spacing"))
+
+    @classmethod
+    def from_graph(cls, pool: dict, ticks=(), tick_lo=MIN_TICK, tick_hi=MAX_TICK):
+        """Из ответа subgraph (pools{ id feeTier liquidity sqrtPrice tick token0{id decimals} token1{...} })."""
+        return cls(pool["id"], pool["token0"]["id"], pool["token1"]["id"],
+                   pool["token0"]["decimals"], pool["token1"]["decimals"], pool["feeTier"],
+                   int(pool["sqrtPrice"]), int(pool.get("tick") or 0), int(pool.get("liquidity") or 0),
+                   ticks=ticks, tick_lo=tick_lo, tick_hi=tick_hi)
+
+
+def load_fixture(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return PoolState.from_dict(json.load(f))
+
+def dump_fixture(state: PoolState, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state.to_dict(), f)
+
+
+# ===================== Swap =====================
+def simulate_swap(state: PoolState, zero_for_one: bool, amount_in: int):
+    """
+    Exact-input своп без изменения state. Возвращает (amount_out, amount_in_used).
+    Если загруженных тиков не хватило на весь объём (вышли за [tick_lo, tick_hi]
+    или кончилась ликвидность) — amount_in_used < amount_in.
+    """
+    amount_remaining = int(amount_in)
+    amount_out = 0
+    sqrt_p = state.sqrt_price_x96
+    tick = state.tick
+    liquidity = state.liquidity
+    idx, net = state.tick_idx, state.tick_net
+    limit = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+
+    while amount_remaining > 0 and sqrt_p != limit:
+        # следующий инициализированный тик в направлении свопа
+        if zero_for_one:
+            pos = bisect_right(idx, tick) - 1
+            if pos < 0:
+                tick_next, initialized = max(MIN_TICK, state.tick_lo), False
+            else:
+                tick_next, initialized = idx[pos], True
+                if tick_next < state.tick_lo:
+                    tick_next, initialized = state.tick_lo, False
+        else:
+            pos = bisect_right(idx, tick)
+            if pos >= len(idx):
+                tick_next, initialized = min(MAX_TICK, state.tick_hi), False
+            else:
+                tick_next, initialized = idx[pos], True
+                if tick_next > state.tick_hi:
+                    tick_next, initialized = state.tick_hi, False
+        tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+        sqrt_next_tick = get_sqrt_ratio_at_tick(tick_next)
+
+        if zero_for_one:
+            sqrt_target = max(sqrt_next_tick, limit)
+        else:
+            sqrt_target = min(sqrt_next_tick, limit)
+
+        if liquidity <= 0 and not initialized:
+            break  # за пределами загруженных тиков ликвидности нет
+        if liquidity > 0:
+            sqrt_p_new, step_in, step_out, fee_amount = compute_swap_step(
+                sqrt_p, sqrt_target, liquidity, amount_remaining, state.fee)
+            amount_remaining -= step_in + fee_amount
+            amount_out += step_out
+        else:
+            sqrt_p_new = sqrt_target
+
+        if sqrt_p_new == sqrt_next_tick:
+            if not initialized:
+                break  # граница загруженного окна
+            liq_net = net[pos]
+            if zero_for_one:
+                liq_net = -liq_net
+            liquidity += liq_net
+            tick = tick_next - 1 if zero_for_one else tick_next
+        elif sqrt_p_new != sqrt_p:
+            tick = get_tick_at_sqrt_ratio(sqrt_p_new)
+        sqrt_p = sqrt_p_new
+
+    return amount_out, int(amount_in) - amount_remaining
+
+
+def quote_exact_in(state: PoolState, src_addr: str, amount_in: int):
+    """Котировка src -> второй токен пула. (amount_out | None, reason | None)."""
+    src = src_addr.lower()
+    if src == state.token0:
+        zero_for_one = True
+    elif src == state.token1:
+        zero_for_one = False
+    else:
+        return None, "dir mismatch"
+    out, used = simulate_swap(state, zero_for_one, amount_in)
+    if used < amount_in:
+        return None, f"insufficient tick liquidity ({used}/{amount_in} filled)"
+    if out <= 0:
+        return None, "zero out"
+    return out, None
+
+
+# ===================== Cache =====================
+POOLS_QUERY = """
+query Pools($a:String!, $b:String!){
+  pools(
+    where:{ token0_in:[$a,$b], token1_in:[$a,$b], feeTier_in:[100,500,3000,10000] }
+    first: 20, orderBy: liquidity, orderDirection: desc
+  ){
+    id feeTier liquidity sqrtPrice tick token0{ id decimals } token1{ id decimals }
+  }
+}"""
+
+POOL_SLOT_QUERY = """
+query Pool($id:ID!){
+  pool(id:$id){ id feeTier liquidity sqrtPrice tick token0{ id decimals } token1{ id decimals } }
+}"""
+
+TICKS_QUERY = """
+query Ticks($pool:String!, $lo:BigInt!, $hi:BigInt!, $skip:Int!){
+  ticks(
+    where:{ pool:$pool, tickIdx_gte:$lo, tickIdx_lte:$hi, liquidityNet_not:"0" }
+    first: 1000, skip:$skip, orderBy: tickIdx, orderDirection: asc
+  ){ tickIdx liquidityNet }
+}"""
+
+
+class V3PoolCache:
+    """
+    Кэш состояний V3-пулов для одного subgraph.
+    post(query, variables) -> dict data (или исключение); должен сам соблюдать rate-limit.
+    Список пулов пары — раз в pools_ttl, slot0/liquidity — раз в state_ttl,
+    окно тиков ±tick_window*tick_spacing вокруг текущего тика — раз в ticks_ttl
+    или сразу, если текущий тик вышел из загруженного окна.
+    """
+
+    def __init__(self, post, state_ttl=30.0, ticks_ttl=300.0, pools_ttl=3600.0, tick_window=400):
+        self.post = post
+        self.state_ttl = state_ttl
+        self.ticks_ttl = ticks_ttl
+        self.pools_ttl = pools_ttl
+        self.tick_window = tick_window
+        self._lock = threading.Lock()
+        self._pool_of_pair = {}  # frozenset({a, b}) -> (pool_id|None, ts)
+        self._states = {}        # pool_id -> PoolState
+        self.network_calls = 0
+        self.local_quotes = 0
+
+    def _query(self, q, variables):
+        self.network_calls += 1
+        return self.post(q, variables) or {}
+
+    def _window(self, tick, spacing):
+        span = self.tick_window * spacing
+        return max(MIN_TICK, tick - span), min(MAX_TICK, tick + span)
+
+    def _load_ticks(self, pool_id, lo, hi):
+        out, skip = [], 0
+        while True:
+            data = self._query(TICKS_QUERY, {"pool": pool_id, "lo": str(lo), "hi": str(hi), "skip": skip})
+            batch = data.get("ticks") or []
+            out.extend((int(t["tickIdx"]), int(t["liquidityNet"])) for t in batch)
+            if len(batch) < 1000 or skip >= 5000:
+                return out
+            skip += 1000
+
+    def put_state(self, state: PoolState):
+        with self._lock:
+            self._states[state.id] = state
+            self._pool_of_pair[frozenset((state.token0, state.token1))] = (state.id, time.time())
+
+    def _select_pool(self, a, b):
+        data = self._query(POOLS_QUERY, {"a": a, "b": b})
+        pools = [p for p in (data.get("pools") or [])
+                 if {p["token0"]["id"].lower(), p["token1"]["id"].lower()} == {a, b}]
+        if not pools:
+            return None
+        def liq(x):
+            try: return int(x.get("liquidity") or 0)
+            except Exception: return 0
+        return max(pools, key=liq)
+
+    def get_state(self, src_addr: str, dst_addr: str, allow_network: bool = True):
+        """PoolState самого ликвидного пула пары (или None). allow_network=False — только кэш."""
+        a, b = src_addr.lower(), dst_addr.lower()
+        key = frozenset((a, b))
+        now = time.time()
+        with self._lock:
+            pool_id, pts = self._pool_of_pair.get(key, (None, 0.0))
+            state = self._states.get(pool_id) if pool_id else None
+        if not allow_network:
+            return state
+
+        if state is None or now - pts > self.pools_ttl:
+            pool = self._select_pool(a, b)
+            if pool is None:
+                with self._lock:
+                    self._pool_of_pair[key] = (None, now)
+                return None
+            spacing = TICK_SPACING_BY_FEE.get(int(pool["feeTier"]), 60)
+            lo, hi = self._window(int(pool.get("tick") or 0), spacing)
+            state = PoolState.from_graph(pool, self._load_ticks(pool["id"], lo, hi), lo, hi)
+            self.put_state(state)
+            return state
+
+        if now - state.ts > self.state_ttl:
+            pool = (self._query(POOL_SLOT_QUERY, {"id": state.id}) or {}).get("pool")
+            if pool:
+                state = self.refresh_slot(state, pool)
+        return self.refresh_ticks_if_needed(state)
+
+    def refresh_slot(self, state: PoolState, pool: dict) -> PoolState:
+        """Новое состояние со свежим slot0 — подменяется в кэше целиком; state не меняется."""
+        new = state.with_slot(pool)
+        self.put_state(new)
+        return new
+
+    def in_window(self, state: PoolState, tick: int = None) -> bool:
+        """Тик (по умолчанию текущий) лежит внутри загруженного окна с запасом в четверть окна."""
+        margin = (self.tick_window // 4) * state.tick_spacing
+        tick = state.tick if tick is None else tick
+        return state.tick_lo + margin <= tick <= state.tick_hi - margin
+
+    def refresh_ticks_if_needed(self, state: PoolState) -> PoolState:
+        if self.in_window(state) and time.time() - state.ticks_ts <= self.ticks_ttl:
+            return state
+        lo, hi = self._window(state.tick, state.tick_spacing)
+        new = state.copy()
+        new.merge_ticks(self._load_ticks(state.id, lo, hi), lo, hi)
+        # загруженный диапазон — объединение окон, если они пересекаются
+        if lo <= state.tick_hi and hi >= state.tick_lo:
+            new.tick_lo, new.tick_hi = min(lo, state.tick_lo), max(hi, state.tick_hi)
+        else:
+            new.tick_lo, new.tick_hi = lo, hi
+        self.put_state(new)
+        return new
+
+    def export_states(self, max_age=None):
+        """Состояния пулов для снимка (to_dict + ts), без устаревших."""
+        now = time.time()
+        with self._lock:
+            states = list(self._states.values())
+        out = []
+        for st in states:
+            if max_age is None or now - st.ts <= max_age:
+                d = st.to_dict()
+                d["ts"] = st.ts
+                out.append(d)
+        return out
+
+    def import_states(self, items, max_age=None):
+        now = time.time()
+        for d in items:
+            ts = d.get("ts") or 0.0
+            if max_age is not None and now - ts > max_age:
+                continue
+            st = PoolState.from_dict(d)
+            st.ts = st.ticks_ts = ts
+            self.put_state(st)
+
+    def quote(self, src_addr: str, dst_addr: str, amount_in: int, allow_network: bool = True):
+        """(amount_out | None, reason | None) — сама котировка всегда локальная."""
+        state = self.get_state(src_addr, dst_addr, allow_network=allow_network)
+        if state is None:
+            return None, "no pool"
+        self.local_quotes += 1
+        return quote_exact_in(state, src_addr, amount_in)
+
+
+if __name__ == "__main__":
+    # Запись и проверка фикстур:
+    #   python v3_pool.py record <subgraph_url> <tokenA> <tokenB> pool.json
+    #   python v3_pool.py quote pool.json <src_addr> <amount_units>
+    import sys
+    import requests
+
+    if len(sys.argv) >= 6 and sys.argv[1] == "record":
+        url, a, b, path = sys.argv[2:6]
+
+        def _post(q, v):
+            r = requests.post(url, json={"query": q, "variables": v}, timeout=(5, 30))
+            r.raise_for_status()
+            return r.json().get("data") or {}
+
+        st = V3PoolCache(_post).get_state(a, b)
+        if st is None:
+            raise SystemExit("no pool for pair")
+        dump_fixture(st, path)
+        print(f"saved {st.id} fee={st.fee} ticks={len(st.tick_idx)} -> {path}")
+    elif len(sys.argv) >= 5 and sys.argv[1] == "quote":
+        st = load_fixture(sys.argv[2])
+        print(quote_exact_in(st, sys.argv[3], int(sys.argv[4])))
+    else:
+        print(__doc__)